@@ -26,13 +26,10 @@ class InterferenceGraph:
 
     def __str__(self):
         pairs = set()
-        for k in self.graph.keys():
-            new_pairs = set((k, v) for v in self.graph[k])
-            pairs = pairs.union(new_pairs)
-
-        for a, b in list(pairs):
-            if (b, a) in pairs:
-                pairs.remove((a, b))
+        for a in self.graph.keys():
+            for b in self.graph[a]:
+                if (b, a) not in pairs:
+                    pairs.add((a, b))
 
         strings = [print_ast(a) + ' -- ' + print_ast(b) for a, b in pairs]
         return 'InterferenceGraph{\n ' + ',\n '.join(strings) + '\n}'
@@ -220,7 +220,9 @@ compiler_passes = {
 }
 
 
-def run_compiler(s, logging=False):
+def run_compiler(s, logging=False, emit_asm=True, profiler=None):
+    # pass a cs3020_support.profiling.PassProfiler as profiler to record
+    # the time, memory and output size of each pass
     def print_prog(current_program):
         print('Concrete syntax:')
         if isinstance(current_program, x86.X86Program):
@@ -245,7 +247,14 @@ def run_compiler(s, logging=False):
         print_prog(current_program)
 
     for pass_name, pass_fn in compiler_passes.items():
-        current_program = pass_fn(current_program)
+        # the emulator can run the x86 AST directly, so printing is optional
+        if pass_name == 'print x86' and not emit_asm:
+            break
+
+        if profiler is not None:
+            current_program = profiler.run_pass(pass_name, pass_fn, current_program)
+        else:
+            current_program = pass_fn(current_program)
 
         if logging == True:
             print()
@@ -2,6 +2,9 @@ from ast import *
 from typing import List, Set, Dict, Tuple
 import functools
 
+from cs3020_support.closure_interpreter import compile_Lif
+from cs3020_support.limits import ExecutionLimits, StepGuard
+
 binops = {
     '+': lambda a, b: a + b,
     'Eq': lambda a, b: a == b,
@@ -17,10 +20,16 @@ unops = {
     'Not': lambda a: not a
     }
 
-def eval_Lif(prog: Module) -> List[int]:
+def eval_Lif(prog: Module, limits: ExecutionLimits = None) -> List[int]:
+    # limits bounds the statements executed and the running time; see
+    # cs3020_support/limits.py
+    guard = None if limits is None else StepGuard(limits)
+
     def eval_stmts(stmts: List[stmt], env: Dict[str, any]) -> List[any]:
         outputs = []
         for stmt in stmts:
+            if guard is not None:
+                guard.step(stmt)
             match stmt:
                 case Assign([Name(x)], e):
                     env[x] = eval_e(e, env)
@@ -66,3 +75,10 @@ def eval_Lif(prog: Module) -> List[int]:
             return eval_stmts(stmts, env)
         case _:
             raise Exception('eval_Lif', prog)
+
+
+def eval_Lif_compiled(prog: Module, limits: ExecutionLimits = None) -> List[int]:
+    # Gives the same outputs as eval_Lif, but translates the program into
+    # closures once instead of matching each node every time it runs,
+    # which is much faster for loops (see cs3020_support/closure_interpreter.py)
+    return compile_Lif(prog, 'Lif', limits)()
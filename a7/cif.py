@@ -56,6 +56,11 @@ class Assign(Stmt):
 class Return(Stmt):
     exp: Expr
 
+@dataclass(frozen=True, eq=True)
+class TailCall(Stmt):
+    func: Expr
+    args: List[Expr]
+
 @dataclass(frozen=True, eq=True)
 class Goto(Stmt):
     label: str
@@ -106,6 +111,10 @@ def print_program(program: CProgram):
                 return f'{x} = {print_exp(e)}'
             case Return(e):
                 return f'return {print_exp(e)}'
+            case TailCall(fun, args):
+                fun_str = print_exp(fun)
+                args_str = ', '.join([print_exp(a) for a in args])
+                return f'tailcall {fun_str}({args_str})'
             case Goto(l):
                 return f'goto {l}'
             case If(condition, then_branch, else_branch):
@@ -3,6 +3,9 @@ from typing import List, Set, Dict
 import functools
 from dataclasses import dataclass
 
+from cs3020_support.closure_interpreter import compile_Lif
+from cs3020_support.limits import ExecutionLimits, StepGuard
+
 binops = {
     '+': lambda a, b: a + b,
     'Eq': lambda a, b: a == b,
@@ -22,18 +25,82 @@ unops = {
 class FunVal:
     args: List[str]
     body: List[stmt]
+    names: List[str]  # the variables the body mentions, other than the arguments
+
+class NameCollector(NodeVisitor):
+    # collects the names a function body reads or assigns, not counting
+    # the bodies of functions defined inside it
+    def __init__(self):
+        self.names = {}
+
+    def visit_Name(self, node: Name):
+        self.names[node.id] = None
+
+    def visit_FunctionDef(self, node: FunctionDef):
+        self.names[node.name] = None
+
+def frame_names(arg_names: List[str], body: List[stmt]) -> List[str]:
+    collector = NameCollector()
+    for s in body:
+        collector.visit(s)
+    return [x for x in collector.names if x not in arg_names]
+
+class Unbound:
+    def __repr__(self):
+        return 'UNBOUND'
+
+UNBOUND = Unbound()
+
+def eval_Lif(prog: Module, limits: ExecutionLimits = None) -> List[int]:
+    # limits bounds the statements executed and the running time; see
+    # cs3020_support/limits.py
+    guard = None if limits is None else StepGuard(limits)
 
-def eval_Lif(prog: Module) -> List[int]:
     outputs = []
 
+    # The environment of a call is a copy of the caller's environment, with
+    # the arguments bound. Since the caller cannot run until the call
+    # returns, the copy only needs the variables the function mentions: the
+    # others can only be read by functions it calls, which find them in the
+    # scopes of the calls in progress (the top level first, then one
+    # environment per active call, innermost last).
+    scopes = []
+
+    def lookup(x: str) -> any:
+        for scope in reversed(scopes):
+            if x in scope:
+                return scope[x]
+        return UNBOUND
+
+    def new_frame(fv: FunVal, arg_vals: List[any]) -> Dict[str, any]:
+        caller = scopes[-1]
+        frame = {}
+        for x in fv.names:
+            if x in caller:
+                frame[x] = caller[x]
+            else:
+                v = lookup(x)
+                if v is not UNBOUND:
+                    frame[x] = v
+        for a in fv.args[len(arg_vals):]:
+            # arguments that are not passed keep the caller's value
+            v = lookup(a)
+            if v is not UNBOUND:
+                frame[a] = v
+        for a, v in zip(fv.args, arg_vals):
+            frame[a] = v
+        return frame
+
     def eval_stmts(stmts: List[stmt], env: Dict[str, any]) -> List[any]:
         for stmt in stmts:
+            if guard is not None:
+                guard.step(stmt)
             match stmt:
                 case Return(e):
                     return eval_e(e, env)
                 case FunctionDef(name, args, body):
                     arg_names = [a.arg for a in args.args]
-                    env[name] = FunVal(arg_names, body)
+                    env[name] = FunVal(arg_names, body, frame_names(arg_names, body))
 
                 case Assign([Name(x)], e):
                     env[x] = eval_e(e, env)
@@ -55,10 +122,10 @@ def eval_Lif(prog: Module) -> List[int]:
             case Call(Name(fun_name), args):
                 fv = env[fun_name]
                 arg_vals = [eval_e(a, env) for a in args]
-                new_env = env.copy()
-                for a, v in zip(fv.args, arg_vals):
-                    new_env[a] = v
+                new_env = new_frame(fv, arg_vals)
+                scopes.append(new_env)
                 retval = eval_stmts(fv.body, new_env)
+                scopes.pop()
                 return retval
 
             case Constant(i):
@@ -91,9 +158,17 @@ def eval_Lif(prog: Module) -> List[int]:
                 raise Exception('eval_e', dump(e))
 
     env = {}
+    scopes.append(env)
     match prog:
         case Module(stmts):
             eval_stmts(stmts, env)
             return outputs
         case _:
             raise Exception('eval_Lif', prog)
+
+
+def eval_Lif_compiled(prog: Module, limits: ExecutionLimits = None) -> List[int]:
+    # Gives the same outputs as eval_Lif, but translates the program into
+    # closures once instead of matching each node every time it runs,
+    # which is much faster for loops (see cs3020_support/closure_interpreter.py)
+    return compile_Lif(prog, 'Lfun', limits)()
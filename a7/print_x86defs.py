@@ -1,10 +1,14 @@
 from typing import Set, Dict, Tuple, List
 import cs3020_support.x86 as x86
 
-def print_x86_defs(program) -> str:
+def print_x86_defs(program, pseudo_instructions: bool = False) -> str:
     """
     Prints an x86 program to a string.
     :param program: An x86 program.
+    :param pseudo_instructions: Print TailJmp as "tailjmp *arg", for logging
+    the passes before prelude & conclusion. Otherwise a TailJmp is an error:
+    it is not an x86 instruction, and must be expanded first (see
+    cs3020_support.tail_calls.expand_tail_jumps).
     :return: A string, ready for gcc.
     """
 
@@ -22,6 +26,8 @@ def print_x86_defs(program) -> str:
                 return f'{offset}(%{register})'
             case x86.GlobalVal(x):
                 return f'{x}(%rip)'
+            case x86.FunRef(label):
+                return f'{label}(%rip)'
             case _:
                 raise Exception('print_arg', a)
 
@@ -57,6 +63,14 @@ def print_x86_defs(program) -> str:
                 return f'callq *{print_arg(a1)}'
             case x86.Retq():
                 return f'retq'
+            case x86.TailJmp(a1, _) if pseudo_instructions:
+                # pseudo-instruction, expanded by prelude & conclusion
+                return f'tailjmp *{print_arg(a1)}'
+            case x86.TailJmp(_, _):
+                raise Exception('print_instr: TailJmp must be expanded by prelude & conclusion '
+                                '(expand_tail_jumps) before printing', e)
+            case x86.IndirectJmp(a1):
+                return f'jmp *{print_arg(a1)}'
             case x86.Jmp(label):
                 return f'jmp {label}'
             case x86.JmpIf(cc, label):
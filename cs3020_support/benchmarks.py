@@ -0,0 +1,747 @@
+import argparse
+import ast
+import dataclasses
+import importlib
+import os
+import random
+import time
+
+import pandas as pd
+
+from .parser_x86 import x86_parser
+from .x86_decode import decode_program, decode_text, decode_ast_program
+from .eval_x86 import X86Emulator, FunPointer, load_program
+from .limits import ExecutionLimitExceeded, ExecutionLimits
+from . import x86
+from .profiling import PassProfiler, program_size
+from .interference_graph import BitsetInterferenceGraph
+from .coloring import color_graph, count_spills, count_moves_removed
+from .register_allocation import allocate_homes, apply_homes, remove_self_moves
+from .peephole import PeepholeOptimizer
+from .constant_folding import ConstantFolder
+from .dead_code import DeadCodeEliminator
+from .closure_interpreter import compile_Lif
+from .program_gen import ASSIGNMENT_LANGUAGES, ProgramShape, generate_program
+
+# ==================================================
+# Workloads
+# ==================================================
+
+def straight_line_program(n: int) -> str:
+    """
+    Generates an x86 program with a single block of roughly 4n instructions.
+    :param n: The number of add/store groups in the block.
+    :return: An x86 program, as a string.
+    """
+    lines = [' .globl main',
+             'main:',
+             ' pushq %rbp',
+             ' movq %rsp, %rbp',
+             ' subq $16, %rsp',
+             ' movq $0, -8(%rbp)',
+             ' movq $1, %rcx']
+    for _ in range(n):
+        lines += [' movq -8(%rbp), %rax',
+                  ' addq %rcx, %rax',
+                  ' movq %rax, -8(%rbp)',
+                  ' imulq $1, %rcx']
+    lines += [' movq -8(%rbp), %rdi',
+              ' callq print_int',
+              ' addq $16, %rsp',
+              ' popq %rbp',
+              ' retq']
+    return '\n'.join(lines) + '\n'
+
+def loop_program(n: int) -> str:
+    """
+    Generates an x86 program that sums the numbers 0..n-1 in a loop.
+    :param n: The loop trip count.
+    :return: An x86 program, as a string.
+    """
+    return f"""
+ .globl main
+main:
+ pushq %rbp
+ movq %rsp, %rbp
+ movq $0, %rbx
+ movq $0, %rcx
+ jmp loop
+loop:
+ cmpq ${n}, %rcx
+ jge done
+ addq %rcx, %rbx
+ addq $1, %rcx
+ jmp loop
+done:
+ movq %rbx, %rdi
+ callq print_int
+ popq %rbp
+ retq
+"""
+
+def random_x86_ast(n_blocks: int, n_instrs: int, seed: int = 0) -> x86.X86Program:
+    """
+    Generates a random (not necessarily meaningful) x86 program, covering
+    every instruction and argument form that print_x86 can print.
+    :param n_blocks: The number of blocks.
+    :param n_instrs: The number of instructions per block.
+    :param seed: The random seed.
+    :return: An x86 program AST.
+    """
+    rng = random.Random(seed)
+    labels = ['main'] + [f'block_{i}' for i in range(1, n_blocks)]
+    regs = ['rsp', 'rbp', 'rax', 'rbx', 'rcx', 'rdx', 'rsi', 'rdi',
+            'r8', 'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15']
+
+    def arg():
+        return rng.choice([lambda: x86.Immediate(rng.randint(-2**40, 2**40)),
+                           lambda: x86.Reg(rng.choice(regs)),
+                           lambda: x86.Var(f'tmp_{rng.randint(0, 20)}'),
+                           lambda: x86.Deref(rng.choice(regs), -8 * rng.randint(0, 64)),
+                           lambda: x86.GlobalVal('free_ptr')])()
+
+    def instr():
+        return rng.choice([lambda: rng.choice([x86.Addq, x86.Subq, x86.Imulq, x86.Movq,
+                                               x86.Cmpq, x86.Andq, x86.Orq, x86.Xorq,
+                                               x86.Leaq])(arg(), arg()),
+                           lambda: x86.Movzbq(x86.ByteReg('al'), arg()),
+                           lambda: rng.choice([x86.Pushq, x86.Popq])(arg()),
+                           lambda: x86.Callq(rng.choice(labels + ['print_int'])),
+                           lambda: x86.IndirectCallq(arg(), 0),
+                           lambda: x86.Jmp(rng.choice(labels)),
+                           lambda: x86.JmpIf(rng.choice(['e', 'l', 'le', 'g', 'ge']),
+                                             rng.choice(labels)),
+                           lambda: x86.Set(rng.choice(['e', 'l', 'le', 'g', 'ge']),
+                                           x86.ByteReg('al')),
+                           lambda: x86.Retq()])()
+
+    blocks = {l: [instr() for _ in range(n_instrs)] for l in labels}
+    return x86.X86Program(blocks)
+
+def random_x86_program(n_blocks: int, n_instrs: int, seed: int = 0) -> str:
+    """
+    Generates a random program with random_x86_ast, and prints it.
+    """
+    return x86.print_x86(random_x86_ast(n_blocks, n_instrs, seed))
+
+# ==================================================
+# Parsing
+# ==================================================
+
+def check_decode_text(programs):
+    """
+    Checks that decode_text agrees with the Lark parser on each program.
+    :param programs: A list of (name, program string) pairs.
+    :return: The names of the programs that decode differently, and the
+    names of the programs that decode_text does not handle.
+    """
+    mismatches = []
+    fallbacks = []
+    for name, s in programs:
+        fast = decode_text(s)
+        if fast is None:
+            fallbacks.append(name)
+        elif fast != decode_program(x86_parser.parse(s)):
+            mismatches.append(name)
+    return mismatches, fallbacks
+
+def check_decode_ast(asts):
+    """
+    Checks that decoding each x86 program AST directly gives the same result
+    as printing it and parsing the text with Lark.
+    :param asts: A list of (name, X86Program) pairs.
+    :return: A list of the names of the programs that decode differently.
+    """
+    return [name for name, p in asts
+            if decode_ast_program(p) != decode_program(x86_parser.parse(x86.print_x86(p)))]
+
+def bench_parsers(workloads, repeat: int = 3):
+    """
+    Measures how long it takes to parse and decode each program, with
+    Lark and with decode_text.
+    :param workloads: A list of (name, program string) pairs.
+    :param repeat: The number of timed runs; the fastest is reported.
+    :return: A list of result dicts, one per workload and parser.
+    """
+    parsers = [('lark', lambda s: decode_program(x86_parser.parse(s))),
+               ('decode_text', decode_text)]
+    results = []
+    for name, s in workloads:
+        n_lines = s.count('\n')
+        for parser_name, parse in parsers:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                parse(s)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results.append({'workload': f'{name} ({parser_name})',
+                            'lines': n_lines,
+                            'seconds': best,
+                            'lines_per_sec': n_lines / best})
+    return results
+
+def print_parser_results(results):
+    for r in results:
+        print(f"{r['workload']:<30} {r['lines']:>10} lines "
+              f"{r['seconds']:>9.4f} s {r['lines_per_sec']:>12,.0f} lines/s")
+
+# ==================================================
+# Emulator throughput
+# ==================================================
+
+def decode_any(program):
+    """
+    Decodes a program for the emulator, whether it is assembly text (as
+    some compilers' run_compiler returns even with emit_asm=False) or an
+    x86 AST.
+    """
+    if isinstance(program, str):
+        return load_program(program)
+    return decode_ast_program(program)
+
+def count_instructions(code, memory='flat') -> int:
+    """
+    Runs a decoded program once, counting the instructions executed.
+    """
+    emu = X86Emulator(logging=False, memory=memory, profile=True)
+    run_decoded(emu, code)
+    return emu.execution_profile().instructions
+
+def run_decoded(emu: X86Emulator, code):
+    for name in code.labels:
+        emu.global_vals[name] = FunPointer(name)
+    output = []
+    emu.run(code, code.labels['main'], output)
+    return output
+
+def bench_emulator(workloads, repeat: int = 3, memory='flat'):
+    """
+    Measures emulator throughput (executed instructions per second) on
+    pre-parsed programs, so that parsing time is excluded.
+    :param workloads: A list of (name, program string) pairs.
+    :param repeat: The number of timed runs; the fastest is reported.
+    :param memory: The emulator's memory model ('flat' or 'dict').
+    :return: A list of result dicts, one per workload.
+    """
+    results = []
+    for name, s in workloads:
+        code = load_program(s)
+        n_instrs = count_instructions(code, memory)
+
+        best = None
+        for _ in range(repeat):
+            emu = X86Emulator(logging=False, memory=memory)
+            start = time.perf_counter()
+            run_decoded(emu, code)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        results.append({'workload': name,
+                        'instructions': n_instrs,
+                        'seconds': best,
+                        'instrs_per_sec': n_instrs / best})
+    return results
+
+def print_results(results):
+    for r in results:
+        print(f"{r['workload']:<20} {r['instructions']:>10} instrs "
+              f"{r['seconds']:>9.4f} s {r['instrs_per_sec']:>12,.0f} instrs/s")
+
+# ==================================================
+# Compiler scaling
+# ==================================================
+
+def compiler_scaling(run_compiler, interpreter, language: str, knob: str, values,
+                     shape: ProgramShape = None, seed: int = 0) -> pd.DataFrame:
+    """
+    Compiles and runs generated programs of increasing size, recording how
+    the cost of each compiler pass and of emulation grows.
+    :param run_compiler: The compiler's run_compiler function.
+    :param interpreter: The reference interpreter (e.g. eval_Lif).
+    :param language: The source language (see program_gen.LANGUAGES).
+    :param knob: The ProgramShape field to vary (e.g. 'length').
+    :param values: The values of the knob to try.
+    :param shape: The values of the other knobs; defaults to ProgramShape().
+    :param seed: The random seed for program generation.
+    :return: A table with one row per value of the knob.
+    """
+    shape = shape or ProgramShape()
+    rows = []
+    for v in values:
+        program = generate_program(language, dataclasses.replace(shape, **{knob: v}), seed)
+        expected = interpreter(ast.parse(program))
+
+        profiler = PassProfiler(trace_memory=False)
+        start = time.perf_counter()
+        x86_program = run_compiler(program, logging=False, emit_asm=False, profiler=profiler)
+        compile_seconds = time.perf_counter() - start
+
+        emu = X86Emulator(logging=False)
+        start = time.perf_counter()
+        output = emu.eval_program(x86_program)
+        emulate_seconds = time.perf_counter() - start
+
+        row = {knob: v,
+               'source_lines': program.count('\n'),
+               'x86_instrs': program_size(x86_program)[1],
+               'compile_seconds': compile_seconds,
+               'emulate_seconds': emulate_seconds,
+               'correct': output == expected}
+        for p in profiler.passes:
+            row[p.name] = p.seconds
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def insert_pass(compiler_passes, pass_name: str, pass_fn, before: str):
+    """
+    Returns a copy of a compiler_passes dictionary with a pass inserted
+    before the given pass.
+    """
+    if before not in compiler_passes:
+        raise Exception(f'insert_pass: no pass named {before}')
+    new_passes = {}
+    for name, fn in compiler_passes.items():
+        if name == before:
+            new_passes[pass_name] = pass_fn
+        new_passes[name] = fn
+    return new_passes
+
+def pass_effect(compiler, pass_name: str, pass_fn, before: str, programs) -> pd.DataFrame:
+    """
+    Compiles each program with and without an extra pass, and counts the
+    instructions of the output and the instructions executed by the emulator.
+    :param compiler: An assignment's compiler module.
+    :param pass_name: The name of the extra pass.
+    :param pass_fn: The extra pass.
+    :param before: The name of the pass to insert it before.
+    :param programs: A list of (name, source program) pairs.
+    :return: A table with one row per program.
+    """
+    original = compiler.compiler_passes
+    rows = []
+    for name, program in programs:
+        row = {'program': name}
+        for suffix, passes in [('', original),
+                               ('_after', insert_pass(original, pass_name, pass_fn, before))]:
+            compiler.compiler_passes = passes
+            try:
+                x86_program = compiler.run_compiler(program, logging=False, emit_asm=False)
+            finally:
+                compiler.compiler_passes = original
+            code = decode_any(x86_program)
+            row['instrs' + suffix] = len(code.instrs)
+            row['executed' + suffix] = count_instructions(code)
+            row['output' + suffix] = X86Emulator(logging=False).eval_program(x86_program)
+        row['same_output'] = row.pop('output') == row.pop('output_after')
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+# ==================================================
+# Graph coloring
+# ==================================================
+
+def interval_graph(n_vars: int, max_live: int, move_fraction: float = 0.2, seed: int = 0):
+    """
+    Generates an interference graph like those of straight-line code: each
+    variable is live over an interval, and variables whose intervals
+    overlap interfere.
+    :param n_vars: The number of variables.
+    :param max_live: The largest number of variables live at once (roughly).
+    :param move_fraction: The fraction of variables defined by a move from
+    a variable whose interval just ended.
+    :param seed: The random seed.
+    :return: A pair (graph, moves) for color_graph.
+    """
+    rng = random.Random(seed)
+    graph = BitsetInterferenceGraph()
+    moves = {}
+    active = []
+    for i in range(n_vars):
+        v = x86.Var(f'v{i}')
+        graph.add_node(v)
+        ended = None
+        while active and (len(active) >= max_live or rng.random() < 0.5):
+            ended = active.pop(rng.randrange(len(active)))
+        graph.add_interference([v], active)
+        if ended is not None and rng.random() < move_fraction:
+            moves.setdefault(v, set()).add(ended)
+            moves.setdefault(ended, set()).add(v)
+        active.append(v)
+    return graph, moves
+
+def scan_dsatur(graph, nodes):
+    """
+    DSatur without a priority queue: each step scans every uncolored node
+    for the highest saturation. Used as the baseline for bench_coloring.
+    """
+    coloring = {}
+    neighbors = {a: graph.neighbors(a) for a in nodes}
+    saturation = {a: set() for a in nodes}
+    uncolored = set(nodes)
+    while uncolored:
+        a = max(uncolored, key=lambda a: (len(saturation[a]), len(neighbors[a])))
+        c = 0
+        while c in saturation[a]:
+            c += 1
+        coloring[a] = c
+        uncolored.remove(a)
+        for b in neighbors[a]:
+            saturation[b].add(c)
+    return coloring
+
+def bench_coloring(sizes, max_live: int = 40, num_registers: int = 13):
+    """
+    Compares coloring time and spills of the priority-queue DSatur in
+    coloring.py, with and without move biasing, against a scanning DSatur.
+    :param sizes: Numbers of variables to try.
+    :param max_live: Roughly the largest number of variables live at once.
+    :param num_registers: The number of registers available.
+    :return: A table with one row per size and algorithm.
+    """
+    rows = []
+    for n in sizes:
+        graph, moves = interval_graph(n, max_live, seed=n)
+        nodes = list(graph.get_nodes())
+        algorithms = [('scan dsatur', lambda: scan_dsatur(graph, nodes)),
+                      ('heap dsatur', lambda: color_graph(graph, nodes)),
+                      ('heap dsatur + moves', lambda: color_graph(graph, nodes, moves=moves,
+                                                                  num_registers=num_registers)),
+                      ('degree', lambda: color_graph(graph, nodes, heuristic='degree'))]
+        for name, run in algorithms:
+            if name == 'scan dsatur' and n > 10000:
+                continue
+            start = time.perf_counter()
+            coloring = run()
+            elapsed = time.perf_counter() - start
+            rows.append({'vars': n,
+                         'algorithm': name,
+                         'seconds': elapsed,
+                         'colors': max(coloring.values()) + 1,
+                         'spills': count_spills(coloring, num_registers),
+                         'moves_removed': count_moves_removed(coloring, moves)})
+    return pd.DataFrame(rows)
+
+# ==================================================
+# Register allocation
+# ==================================================
+
+CALLER_SAVED_REGISTERS = ['rdx', 'rcx', 'rsi', 'rdi', 'r8', 'r9', 'r10', 'r11']
+CALLEE_SAVED_REGISTERS = ['rbx', 'r12', 'r13', 'r14', 'r15']
+
+def pseudo_x86_program(n_vars: int, n_loops: int, n_instrs: int, trip_count: int = 3,
+                       seed: int = 0, bool_tests: bool = False) -> x86.X86Program:
+    """
+    Generates a pseudo-x86 program (with variables, before register
+    allocation) like the output of select instructions: a chain of loops
+    whose bodies update and print variables, followed by printing every
+    variable, so that all of them are live throughout.
+    :param n_vars: The number of variables.
+    :param n_loops: The number of loops.
+    :param n_instrs: The number of instructions in each loop body.
+    :param trip_count: The number of iterations of each loop.
+    :param seed: The random seed.
+    :param bool_tests: Test loop conditions through a boolean variable, as
+    when compiling "c = i < n" followed by "if c".
+    :return: A program whose blocks jump to "conclusion" at the end.
+    """
+    rng = random.Random(seed)
+    vs = [x86.Var(f'v{i}') for i in range(n_vars)]
+    print_int = lambda a: [x86.Movq(a, x86.Reg('rdi')), x86.Callq('print_int')]
+
+    blocks = {'start': [x86.Movq(x86.Immediate(i), v) for i, v in enumerate(vs)]}
+    blocks['start'].append(x86.Jmp('loop_0'))
+    for k in range(n_loops):
+        counter = x86.Var(f'i{k}')
+        blocks[f'loop_{k}'] = [x86.Movq(x86.Immediate(0), counter), x86.Jmp(f'body_{k}')]
+        body = []
+        for _ in range(n_instrs):
+            r = rng.random()
+            a, b = rng.choice(vs), rng.choice(vs)
+            if r < 0.4:
+                body.append(x86.Movq(a, b))
+            elif r < 0.7:
+                body.append(x86.Addq(x86.Immediate(rng.randint(1, 10)), b))
+            elif r < 0.9:
+                t = x86.Var(f'tmp_{k}_{len(body)}')
+                body += [x86.Movq(a, t), x86.Subq(x86.Immediate(1), t), x86.Movq(t, b)]
+            else:
+                body += print_int(a)
+        exit_label = f'loop_{k + 1}' if k + 1 < n_loops else 'end'
+        body += [x86.Addq(x86.Immediate(1), counter),
+                 x86.Cmpq(x86.Immediate(trip_count), counter)]
+        if bool_tests:
+            c = x86.Var(f'c{k}')
+            body += [x86.Set('l', x86.ByteReg('al')),
+                     x86.Movzbq(x86.ByteReg('al'), c),
+                     x86.Cmpq(x86.Immediate(0), c),
+                     x86.JmpIf('e', exit_label),
+                     x86.Jmp(f'body_{k}')]
+        else:
+            body += [x86.JmpIf('l', f'body_{k}'),
+                     x86.Jmp(exit_label)]
+        blocks[f'body_{k}'] = body
+    blocks['end'] = [i for v in vs for i in print_int(v)] + [x86.Jmp('conclusion')]
+    return x86.X86Program(blocks)
+
+def with_prelude(blocks, allocation=None) -> x86.X86Program:
+    # adds main and conclusion blocks, so the program can be emulated
+    rbp, rsp = x86.Reg('rbp'), x86.Reg('rsp')
+    saved = [x86.Reg(r) for r in allocation.callee_saved_used] if allocation else []
+    space = x86.Immediate(allocation.stack_space() if allocation else 0)
+    main = [x86.Pushq(rbp), x86.Movq(rsp, rbp)] + [x86.Pushq(r) for r in saved] + \
+           [x86.Subq(space, rsp), x86.Jmp('start')]
+    conclusion = [x86.Addq(space, rsp)] + [x86.Popq(r) for r in reversed(saved)] + \
+                 [x86.Popq(rbp), x86.Retq()]
+    return x86.X86Program({'main': main, **blocks, 'conclusion': conclusion})
+
+# Instructions an allocated program may execute before it is considered
+# stuck in a loop (generated programs execute far fewer)
+MAX_STEPS = 10**7
+
+def emulate_bounded(program):
+    """
+    Runs a program in the emulator, returning its output, or None if it runs
+    for more than MAX_STEPS instructions (e.g. because a loop counter was
+    overwritten).
+    """
+    try:
+        return X86Emulator(logging=False, limits=ExecutionLimits(MAX_STEPS)).eval_program(program)
+    except ExecutionLimitExceeded:
+        return None
+
+def bench_allocation(sizes, n_loops: int = 10,
+                     strategies=('coloring', 'coalescing', 'linear scan'),
+                     bool_tests=(False, True)):
+    """
+    Compares register allocation strategies on generated pseudo-x86
+    programs: allocation time (including liveness analysis), spills, the
+    self-moves removed afterwards, the instructions executed by the
+    emulator, and whether the allocated program prints the same values.
+    :param sizes: Numbers of variables to try.
+    :param n_loops: The number of loops in each program.
+    :param strategies: The strategies to compare.
+    :param bool_tests: The shapes of loop test to try (see pseudo_x86_program);
+    with True, each loop ends in a jmp back to its body.
+    :return: A table with one row per size, loop shape and strategy.
+    """
+    rows = []
+    for n, bool_test in [(n, b) for n in sizes for b in bool_tests]:
+        program = pseudo_x86_program(n, n_loops, 2 * n, seed=n, bool_tests=bool_test)
+        expected = X86Emulator(logging=False).eval_program(with_prelude(program.blocks))
+        for strategy in strategies:
+            start = time.perf_counter()
+            allocation = allocate_homes(program.blocks, CALLER_SAVED_REGISTERS,
+                                        CALLEE_SAVED_REGISTERS, strategy)
+            elapsed = time.perf_counter() - start
+            blocks, removed = remove_self_moves(apply_homes(program.blocks, allocation.homes))
+            allocated = with_prelude(blocks, allocation)
+            output = emulate_bounded(allocated)
+            rows.append({'vars': len(allocation.homes),
+                         'bool_tests': bool_test,
+                         'strategy': strategy,
+                         'seconds': elapsed,
+                         'spilled': sum(1 for h in allocation.homes.values()
+                                        if isinstance(h, x86.Deref)),
+                         'stack_slots': allocation.stack_slots,
+                         'moves_removed': removed,
+                         'executed': (count_instructions(decode_any(allocated))
+                                      if output is not None else None),
+                         'correct': output == expected})
+    return pd.DataFrame(rows)
+
+def bench_peephole(sizes, n_loops: int = 10):
+    """
+    Measures the peephole pass on generated programs after register
+    allocation (by coloring) and prelude & conclusion: instructions in the
+    program and executed by the emulator, before and after, and the number
+    of times each rule applied.
+    :param sizes: Numbers of variables to try.
+    :param n_loops: The number of loops in each program.
+    :return: A table with one row per size.
+    """
+    rows = []
+    for n in sizes:
+        program = pseudo_x86_program(n, n_loops, 2 * n, seed=n, bool_tests=True)
+        allocation = allocate_homes(program.blocks, CALLER_SAVED_REGISTERS,
+                                    CALLEE_SAVED_REGISTERS)
+        before = with_prelude(apply_homes(program.blocks, allocation.homes), allocation)
+        optimizer = PeepholeOptimizer()
+        after = optimizer(before)
+
+        size = lambda p: sum(len(instrs) for instrs in p.blocks.values())
+        output_before = X86Emulator(logging=False).eval_program(before)
+        output_after = X86Emulator(logging=False).eval_program(after)
+        rows.append({'vars': n,
+                     'instrs': size(before),
+                     'instrs_after': size(after),
+                     'executed': count_instructions(decode_any(before)),
+                     'executed_after': count_instructions(decode_any(after)),
+                     **optimizer.hits,
+                     'correct': output_before == output_after})
+    return pd.DataFrame(rows)
+
+def bench_dead_code(sizes, n_loops: int = 10):
+    """
+    Measures dead code elimination on generated pseudo-x86 programs, before
+    register allocation: instructions in the program and executed by the
+    emulator (running the variables directly), before and after.
+    :param sizes: Numbers of variables to try.
+    :param n_loops: The number of loops in each program.
+    :return: A table with one row per size.
+    """
+    rows = []
+    for n in sizes:
+        program = pseudo_x86_program(n, n_loops, 2 * n, seed=n, bool_tests=True)
+        eliminator = DeadCodeEliminator()
+        start = time.perf_counter()
+        optimized = eliminator(program)
+        elapsed = time.perf_counter() - start
+
+        before, after = with_prelude(program.blocks), with_prelude(optimized.blocks)
+        size = lambda p: sum(len(instrs) for instrs in p.blocks.values())
+        rows.append({'vars': n,
+                     'instrs': size(before),
+                     'instrs_after': size(after),
+                     'executed': count_instructions(decode_any(before)),
+                     'executed_after': count_instructions(decode_any(after)),
+                     'seconds': elapsed,
+                     'correct': (X86Emulator(logging=False).eval_program(before) ==
+                                 X86Emulator(logging=False).eval_program(after))})
+    return pd.DataFrame(rows)
+
+def bench_interpreter(interpreter, language: str, trip_counts, shape: ProgramShape = None,
+                      seed: int = 0) -> pd.DataFrame:
+    """
+    Compares the reference interpreter with the closure-compiling one
+    (closure_interpreter.py) on generated programs with nested loops.
+    :param interpreter: The reference interpreter (e.g. eval_Lif).
+    :param language: The source language (see program_gen.LANGUAGES).
+    :param trip_counts: The loop trip counts to try.
+    :param shape: The other knobs; defaults to loops nested two deep.
+    :param seed: The random seed for program generation.
+    :return: A table with one row per trip count.
+    """
+    shape = shape or ProgramShape(depth=2)
+    rows = []
+    for n in trip_counts:
+        tree = ast.parse(generate_program(language, dataclasses.replace(shape, trip_count=n), seed))
+
+        start = time.perf_counter()
+        expected = interpreter(tree)
+        reference_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        run = compile_Lif(tree, language)
+        compile_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        output = run()
+        run_seconds = time.perf_counter() - start
+
+        rows.append({'trip_count': n,
+                     'reference_seconds': reference_seconds,
+                     'compile_seconds': compile_seconds,
+                     'run_seconds': run_seconds,
+                     'speedup': reference_seconds / (compile_seconds + run_seconds),
+                     'correct': output == expected})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the CS 3020 support code')
+    parser.add_argument('-n', '--size', type=int, default=5000,
+                        help='Size of the straight-line workload')
+    parser.add_argument('-l', '--loop', type=int, default=100000,
+                        help='Trip count of the loop workload')
+    parser.add_argument('-m', '--memory', choices=['flat', 'dict'], default='flat',
+                        help='Memory model used by the emulator')
+    parser.add_argument('--parse', action='store_true',
+                        help='Benchmark parsing instead of execution')
+    parser.add_argument('--scaling', nargs='+', metavar=('KNOB', 'VALUE'),
+                        help='Run from an assignment directory: compile and run generated '
+                             'programs, varying a program_gen.ProgramShape knob over the given '
+                             'values (e.g. --scaling length 10 100 1000)')
+    parser.add_argument('--language', help='Source language for --scaling and --interpreter '
+                                           '(by default, that of the current assignment)')
+    parser.add_argument('--fold', action='store_true',
+                        help='Run from an assignment directory: measure constant folding '
+                             'on the test programs')
+    parser.add_argument('--coloring', nargs='+', type=int, metavar='VARS',
+                        help='Benchmark graph coloring on generated graphs with these numbers of variables')
+    parser.add_argument('--allocation', nargs='+', type=int, metavar='VARS',
+                        help='Compare register allocation strategies on generated programs '
+                             'with these numbers of variables')
+    parser.add_argument('--peephole', nargs='+', type=int, metavar='VARS',
+                        help='Measure the peephole pass on generated programs '
+                             'with these numbers of variables')
+    parser.add_argument('--dead-code', nargs='+', type=int, metavar='VARS',
+                        help='Measure dead code elimination on generated programs '
+                             'with these numbers of variables')
+    parser.add_argument('--interpreter', nargs='+', type=int, metavar='TRIPS',
+                        help='Run from an assignment directory (a4-a7): compare the reference '
+                             'interpreter with the closure-compiling one on generated programs '
+                             'with these loop trip counts')
+    parser.add_argument('--check', nargs='*', metavar='FILE',
+                        help='Check decode_text against Lark on generated programs '
+                             'and the given assembly files')
+    args = parser.parse_args()
+
+    if args.interpreter:
+        language = args.language or ASSIGNMENT_LANGUAGES[os.path.basename(os.getcwd())]
+        interpreter = importlib.import_module('interpreter')
+        print(bench_interpreter(interpreter.eval_Lif, language,
+                                args.interpreter).to_string(index=False))
+    elif args.dead_code:
+        print(bench_dead_code(args.dead_code).to_string(index=False))
+    elif args.fold:
+        compiler = importlib.import_module('compiler')
+        programs = []
+        for file_name in sorted(os.listdir('tests')):
+            if file_name.endswith('.py'):
+                with open(os.path.join('tests', file_name)) as f:
+                    programs.append((file_name, f.read()))
+        folder = ConstantFolder()
+        print(pass_effect(compiler, 'fold constants', folder, 'remove complex opera*',
+                          programs).to_string(index=False))
+        print(folder.changes)
+    elif args.peephole:
+        print(bench_peephole(args.peephole).to_string(index=False))
+    elif args.allocation:
+        print(bench_allocation(args.allocation).to_string(index=False))
+    elif args.coloring:
+        print(bench_coloring(args.coloring).to_string(index=False))
+    elif args.scaling:
+        knob, *values = args.scaling
+        language = args.language or ASSIGNMENT_LANGUAGES[os.path.basename(os.getcwd())]
+        compiler = importlib.import_module('compiler')
+        interpreter = importlib.import_module('interpreter')
+        interpret = getattr(interpreter, 'eval_Lvar', None) or interpreter.eval_Lif
+        print(compiler_scaling(compiler.run_compiler, interpret, language, knob,
+                               [int(v) for v in values]).to_string(index=False))
+    elif args.check is not None:
+        programs = [(f'random {seed}', random_x86_program(20, 50, seed)) for seed in range(20)]
+        programs += [('straight-line', straight_line_program(args.size)),
+                     ('loop', loop_program(args.loop))]
+        for file_name in args.check:
+            with open(file_name) as f:
+                programs.append((file_name, f.read()))
+        mismatches, fallbacks = check_decode_text(programs)
+        print(f'{len(programs) - len(mismatches) - len(fallbacks)}/{len(programs)} '
+              f'programs decoded identically')
+        for name in mismatches:
+            print('MISMATCH:', name)
+        for name in fallbacks:
+            print('FALLBACK:', name)
+
+        asts = [(f'random {seed}', random_x86_ast(20, 50, seed)) for seed in range(20)]
+        mismatches = check_decode_ast(asts)
+        print(f'{len(asts) - len(mismatches)}/{len(asts)} ASTs decoded identically')
+        for name in mismatches:
+            print('MISMATCH:', name)
+    elif args.parse:
+        print_parser_results(bench_parsers([('straight-line', straight_line_program(args.size)),
+                                            ('random', random_x86_program(100, 100))]))
+    else:
+        print_results(bench_emulator([('straight-line', straight_line_program(args.size)),
+                                      ('loop', loop_program(args.loop))],
+                                     memory=args.memory))
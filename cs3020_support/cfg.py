@@ -0,0 +1,205 @@
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+# ==================================================
+# CFG simplification for Cif programs
+# ==================================================
+# A pass over the output of explicate control (a CProgram with blocks, or
+# with one CFunctionDef per function), meant to run right after it:
+#
+#     compiler_passes = {
+#         ...
+#         'explicate control': explicate_control,
+#         'simplify cfg': CFGSimplifier(),
+#         'select instructions': select_instructions,
+#         ...
+#     }
+#
+# It threads jumps through blocks that only contain a goto, drops blocks
+# that cannot be reached, merges each block into its only predecessor when
+# that predecessor ends with a goto to it, and lays out the blocks so that
+# the target of each goto (and the else branch of each if) comes right
+# after the block when possible. The peephole pass (peephole.py) can then
+# remove the jumps to the next block, as long as select instructions keeps
+# the order of the blocks.
+#
+# The entry block of each function keeps its label and comes first. Each
+# assignment has its own copy of cif.py, so statements are recognized by
+# class name.
+
+def kind(x) -> str:
+    return type(x).__name__
+
+def entry_label(blocks: Dict[str, List], name: Optional[str] = None) -> str:
+    """
+    Guesses the entry block of a function: "start", "<name>start" or
+    "<name>_start" if there is such a block, otherwise the first block.
+    """
+    candidates = ['start'] + ([f'{name}start', f'{name}_start'] if name else [])
+    for label in candidates:
+        if label in blocks:
+            return label
+    return next(iter(blocks))
+
+def successors(stmts: List) -> List[str]:
+    if not stmts:
+        return []
+    last = stmts[-1]
+    match kind(last):
+        case 'Goto':
+            return [last.label]
+        case 'If':
+            return [last.then_branch.label, last.else_branch.label]
+        case _:
+            return []
+
+class CFGSimplifier:
+    """
+    Simplifies the control-flow graph of Cif programs. Callable as a
+    compiler pass; changes counts, over every program simplified by this
+    object, the jumps threaded, blocks merged, unreachable blocks removed,
+    and gotos followed by their target in the new layout.
+    """
+    changes: Dict[str, int]
+
+    def __init__(self):
+        self.changes = {'threaded': 0, 'merged': 0, 'unreachable': 0, 'fallthrough': 0}
+
+    def __call__(self, program):
+        return self.simplify_program(program)
+
+    def simplify_program(self, program):
+        """
+        Simplifies a CProgram, with either blocks or defs.
+        """
+        if hasattr(program, 'defs'):
+            return replace(program, defs=[replace(d, blocks=self.simplify_blocks(d.blocks, d.name))
+                                          for d in program.defs])
+        else:
+            return replace(program, blocks=self.simplify_blocks(program.blocks))
+
+    def simplify_blocks(self, blocks: Dict[str, List], name: Optional[str] = None,
+                        entry: Optional[str] = None) -> Dict[str, List]:
+        """
+        Simplifies the blocks of one function.
+        :param blocks: The blocks.
+        :param name: The name of the function, used to find the entry block.
+        :param entry: The label of the entry block; see entry_label for the default.
+        :return: The new blocks, in their new order.
+        """
+        if not blocks:
+            return blocks
+        entry = entry or entry_label(blocks, name)
+        blocks = self.thread_jumps(dict(blocks))
+        blocks = self.remove_unreachable(blocks, entry)
+        blocks = self.merge_blocks(blocks, entry)
+        return self.layout(blocks, entry)
+
+    # ------------------------------------------------------------
+    # Jump threading
+
+    def thread_jumps(self, blocks: Dict[str, List]) -> Dict[str, List]:
+        # the final target of each label, following blocks that only hold a goto
+        def final_target(label: str) -> str:
+            seen = {label}
+            while label in blocks and len(blocks[label]) == 1 and kind(blocks[label][0]) == 'Goto':
+                label = blocks[label][0].label
+                if label in seen:
+                    # an infinite loop of gotos; leave it alone
+                    break
+                seen.add(label)
+            return label
+
+        def thread(goto):
+            target = final_target(goto.label)
+            if target != goto.label:
+                self.changes['threaded'] += 1
+                return replace(goto, label=target)
+            return goto
+
+        for label, stmts in blocks.items():
+            if not stmts:
+                continue
+            last = stmts[-1]
+            match kind(last):
+                case 'Goto':
+                    new = thread(last)
+                case 'If':
+                    new = replace(last, then_branch=thread(last.then_branch),
+                                  else_branch=thread(last.else_branch))
+                    if new.then_branch.label == new.else_branch.label:
+                        # both branches go to the same place; the test is
+                        # an atomic comparison, with no effect of its own
+                        new = new.then_branch
+                case _:
+                    new = last
+            if new is not last:
+                blocks[label] = stmts[:-1] + [new]
+        return blocks
+
+    # ------------------------------------------------------------
+    # Unreachable blocks
+
+    def remove_unreachable(self, blocks: Dict[str, List], entry: str) -> Dict[str, List]:
+        reachable = {entry}
+        stack = [entry]
+        while stack:
+            for target in successors(blocks[stack.pop()]):
+                if target in blocks and target not in reachable:
+                    reachable.add(target)
+                    stack.append(target)
+        self.changes['unreachable'] += len(blocks) - len(reachable)
+        return {label: stmts for label, stmts in blocks.items() if label in reachable}
+
+    # ------------------------------------------------------------
+    # Merging blocks
+
+    def merge_blocks(self, blocks: Dict[str, List], entry: str) -> Dict[str, List]:
+        predecessors: Dict[str, int] = {label: 0 for label in blocks}
+        for stmts in blocks.values():
+            for target in successors(stmts):
+                if target in predecessors:
+                    predecessors[target] += 1
+
+        for label in list(blocks):
+            if label not in blocks:
+                continue
+            while True:
+                stmts = blocks[label]
+                succs = successors(stmts)
+                if not (stmts and kind(stmts[-1]) == 'Goto'):
+                    break
+                target = succs[0]
+                if target == entry or target == label or target not in blocks or \
+                        predecessors[target] != 1:
+                    break
+                blocks[label] = stmts[:-1] + blocks.pop(target)
+                self.changes['merged'] += 1
+        return blocks
+
+    # ------------------------------------------------------------
+    # Layout
+
+    def layout(self, blocks: Dict[str, List], entry: str) -> Dict[str, List]:
+        """
+        Orders the blocks in chains: each block is followed, when it has not
+        been placed yet, by the target of its goto or the else branch of its
+        if.
+        """
+        order = []
+        placed = set()
+        for label in [entry] + [l for l in blocks if l != entry]:
+            while label in blocks and label not in placed:
+                placed.add(label)
+                order.append(label)
+                succs = successors(blocks[label])
+                nexts = [t for t in succs if t in blocks and t not in placed]
+                # prefer the else branch: select instructions emits
+                # "jcc then; jmp else", so the jmp is the one to remove
+                preferred = succs[-1] if succs and succs[-1] in nexts else None
+                if preferred is None and nexts:
+                    preferred = nexts[0]
+                if preferred is not None and preferred == succs[-1]:
+                    self.changes['fallthrough'] += 1
+                label = preferred
+        return {label: blocks[label] for label in order}
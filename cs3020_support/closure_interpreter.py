@@ -0,0 +1,328 @@
+import functools
+from ast import *
+from typing import Any, Callable, Dict, List
+
+from .limits import ExecutionLimits, StepGuard
+from .program_gen import LANGUAGES
+
+# ==================================================
+# Closure-compiling interpreter
+# ==================================================
+# The reference interpreters (eval_Lif in a4-a7) match every AST node
+# against a list of patterns each time it is evaluated, and look up
+# operators by name; in a loop, that work is redone on every iteration.
+# This interpreter translates the program once into nested Python
+# closures, with the operators resolved and each variable given a slot in
+# a list-based frame, and then runs the closures.
+#
+# It gives the same outputs as the reference interpreter of each language
+# (Lif, Lwhile, Ltup or Lfun), including their quirks:
+#   - "and"/"or" evaluate both operands;
+#   - only "not" is a unary operator, and != is not a comparison;
+#   - in the Lfun interpreter (a7), an if statement returns from the
+#     enclosing list of statements, and a call copies the caller's
+#     variables into the callee's frame before binding the arguments.
+# As in a7, the copy is limited to the variables the callee mentions: each
+# function has its own slot table, and a variable the caller has not
+# bound is found in the frames of the calls in progress.
+# Unsupported statements and expressions raise the same exceptions as the
+# reference interpreters, when (and only if) they are run.
+#
+# With ExecutionLimits, each statement counts one step before it runs, as
+# in the reference interpreters; without, the statements are not wrapped,
+# so they cost nothing extra.
+
+UNARY_OPS = {
+    'Not': lambda a: not a
+}
+
+BINARY_OPS = {
+    'Add': lambda a, b: a + b,
+    'Sub': lambda a, b: a - b,
+    'Mult': lambda a, b: a * b,
+}
+
+COMPARE_OPS = {
+    'Eq': lambda a, b: a == b,
+    'Gt': lambda a, b: a > b,
+    'Lt': lambda a, b: a < b,
+    'GtE': lambda a, b: a >= b,
+    'LtE': lambda a, b: a <= b,
+}
+
+BOOL_OPS = {
+    'And': lambda a, b: a and b,
+    'Or': lambda a, b: a or b,
+}
+
+class Unbound:
+    # the value of a slot whose variable has not been assigned
+    def __repr__(self):
+        return 'UNBOUND'
+
+UNBOUND = Unbound()
+
+class CompiledFunction:
+    def __init__(self, slots: Dict[str, int], arg_slots: List[int], body: Callable):
+        self.slots = slots          # the function's own slot table
+        self.names = list(slots)    # in slot order
+        self.arg_slots = arg_slots
+        self.body = body
+
+Frame = List[Any]
+Code = Callable[[Frame], Any]
+
+def raiser(*exception_args) -> Code:
+    def run(frame):
+        raise Exception(*exception_args)
+    return run
+
+class ClosureCompiler:
+    """
+    Translates one program into closures. Each statement or expression
+    becomes a function of the current frame.
+    """
+
+    def __init__(self, language: str, limits: ExecutionLimits = None):
+        assert language in LANGUAGES[1:], f'unknown language: {language}'
+        level = LANGUAGES.index(language)
+        self.has_while = level >= 2
+        self.has_tuples = level >= 3
+        self.lfun = level >= 4
+        self.limits = limits
+        self.slots: Dict[str, int] = {}     # of the function being compiled
+        self.outputs: List[Any] = []
+        self.guard: StepGuard = None    # a new one for each run, with limits
+        # the frames of the top level and the calls in progress, innermost
+        # last, each with its slot table
+        self.scopes: List[tuple] = []
+
+    def slot(self, x: str) -> int:
+        if x not in self.slots:
+            self.slots[x] = len(self.slots)
+        return self.slots[x]
+
+    def lookup(self, x: str) -> Any:
+        # the value of x in the innermost frame that has it bound
+        for frame, slots in reversed(self.scopes):
+            if x in slots and frame[slots[x]] is not UNBOUND:
+                return frame[slots[x]]
+        return UNBOUND
+
+    # ------------------------------------------------------------
+    # Statements
+
+    def compile_stmts(self, stmts: List[stmt]) -> Code:
+        """
+        Compiles a list of statements into one function, that returns the
+        value of the return statement that ended it, if any.
+        """
+        simple = []
+        last = None
+        for s in stmts:
+            if self.lfun and isinstance(s, (Return, If)):
+                # the rest of the list never runs
+                last = self.guarded(s, self.compile_stmt(s))
+                break
+            simple.append(self.guarded(s, self.compile_stmt(s)))
+
+        if last is None:
+            if len(simple) == 1:
+                only, = simple
+                def run(frame):
+                    only(frame)
+            else:
+                def run(frame):
+                    for s in simple:
+                        s(frame)
+        else:
+            def run(frame):
+                for s in simple:
+                    s(frame)
+                return last(frame)
+        return run
+
+    def guarded(self, s: stmt, code: Code) -> Code:
+        # counts a step before running the statement, if there are limits
+        if self.limits is None:
+            return code
+        compiler = self
+        def run(frame):
+            compiler.guard.step(s)
+            return code(frame)
+        return run
+
+    def compile_stmt(self, s: stmt) -> Code:
+        match s:
+            case Assign([Name(x)], e):
+                i, value = self.slot(x), self.compile_expr(e)
+                def run(frame):
+                    frame[i] = value(frame)
+                return run
+            case Expr(Call(Name('print'), [e])):
+                value = self.compile_expr(e)
+                compiler = self
+                def run(frame):
+                    compiler.outputs.append(value(frame))
+                return run
+            case If(condition, then_stmts, else_stmts):
+                test = self.compile_expr(condition)
+                then_code = self.compile_stmts(then_stmts)
+                else_code = self.compile_stmts(else_stmts)
+                if self.lfun:
+                    def run(frame):
+                        if test(frame):
+                            return then_code(frame)
+                        else:
+                            return else_code(frame)
+                else:
+                    def run(frame):
+                        if test(frame):
+                            then_code(frame)
+                        else:
+                            else_code(frame)
+                return run
+            case While(condition, body) if self.has_while:
+                test, body_code = self.compile_expr(condition), self.compile_stmts(body)
+                def run(frame):
+                    while test(frame):
+                        body_code(frame)
+                return run
+            case Return(e) if self.lfun:
+                return self.compile_expr(e)
+            case FunctionDef(name, args, body) if self.lfun:
+                # the body gets its own slot table, with the arguments first
+                outer, self.slots = self.slots, {}
+                arg_slots = [self.slot(a.arg) for a in args.args]
+                body_code = self.compile_stmts(body)
+                function = CompiledFunction(self.slots, arg_slots, body_code)
+                self.slots = outer
+                i = self.slot(name)
+                def run(frame):
+                    frame[i] = function
+                return run
+            case _:
+                return raiser('eval_stmts', dump(s))
+
+    # ------------------------------------------------------------
+    # Expressions
+
+    def compile_expr(self, e: expr) -> Code:
+        match e:
+            case Constant(c):
+                return lambda frame: c
+            case Name(x):
+                i = self.slot(x)
+                def run(frame):
+                    v = frame[i]
+                    if v is UNBOUND:
+                        raise KeyError(x)
+                    return v
+                return run
+            case Call(Name(_), args) if self.lfun:
+                return self.compile_call(e.func, args)
+            case UnaryOp(op, e1):
+                return self.compile_op(UNARY_OPS, type(op).__name__, [e1])
+            case BinOp(e1, op, e2) if type(op).__name__ in ('Add', 'Mult') or \
+                    (self.has_while and type(op).__name__ == 'Sub'):
+                return self.compile_op(BINARY_OPS, type(op).__name__, [e1, e2])
+            case Compare(e1, [op], [e2]):
+                return self.compile_op(COMPARE_OPS, type(op).__name__, [e1, e2])
+            case BoolOp(op, args):
+                f = BOOL_OPS[type(op).__name__]
+                codes = [self.compile_expr(a) for a in args]
+                def run(frame):
+                    # every operand is evaluated, as in the reference interpreters
+                    return functools.reduce(f, [c(frame) for c in codes])
+                return run
+            case IfExp(test, then_e, else_e):
+                test_code = self.compile_expr(test)
+                then_code, else_code = self.compile_expr(then_e), self.compile_expr(else_e)
+                return lambda frame: then_code(frame) if test_code(frame) else else_code(frame)
+            case Tuple(args) if self.has_tuples:
+                codes = [self.compile_expr(a) for a in args]
+                return lambda frame: tuple([c(frame) for c in codes])
+            case Subscript(e1, e2) if self.has_tuples:
+                a, b = self.compile_expr(e1), self.compile_expr(e2)
+                return lambda frame: a(frame)[b(frame)]
+            case _:
+                return raiser('eval_e', dump(e))
+
+    def compile_op(self, table: Dict[str, Callable], name: str, args: List[expr]) -> Code:
+        if name not in table:
+            # the reference interpreters fail looking up the operator,
+            # before evaluating its operands
+            def run(frame):
+                raise KeyError(name)
+            return run
+        codes = [self.compile_expr(a) for a in args]
+        f = table[name]
+        if len(codes) == 1:
+            a, = codes
+            return lambda frame: f(a(frame))
+        a, b = codes
+        return lambda frame: f(a(frame), b(frame))
+
+    def compile_call(self, func: Name, args: List[expr]) -> Code:
+        lookup = self.compile_expr(func)
+        codes = [self.compile_expr(a) for a in args]
+        # the caller's slot table, complete by the time the call runs
+        caller_slots = self.slots
+        compiler = self
+        # for each function called here, the callee slots to fill before
+        # binding the arguments, with the caller's slot of each (or None)
+        plans: Dict[CompiledFunction, List[tuple]] = {}
+
+        def plan_for(fv: CompiledFunction) -> List[tuple]:
+            bound = set(fv.arg_slots[:len(codes)])
+            plan = [(j, caller_slots.get(x), x) for j, x in enumerate(fv.names)
+                    if j not in bound]
+            plans[fv] = plan
+            return plan
+
+        def run(frame):
+            fv = lookup(frame)
+            vals = [c(frame) for c in codes]
+            plan = plans[fv] if fv in plans else plan_for(fv)
+            new_frame = [UNBOUND] * len(fv.names)
+            for j, i, x in plan:
+                v = UNBOUND if i is None else frame[i]
+                if v is UNBOUND:
+                    v = compiler.lookup(x)
+                new_frame[j] = v
+            for i, v in zip(fv.arg_slots, vals):
+                new_frame[i] = v
+            compiler.scopes.append((new_frame, fv.slots))
+            retval = fv.body(new_frame)
+            compiler.scopes.pop()
+            return retval
+        return run
+
+def compile_Lif(prog: Module, language: str,
+                limits: ExecutionLimits = None) -> Callable[[], List[Any]]:
+    """
+    Translates a program into closures.
+    :param prog: The program's AST.
+    :param language: The language whose reference interpreter to follow:
+    'Lif' (a4), 'Lwhile' (a5), 'Ltup' (a6) or 'Lfun' (a7).
+    :param limits: The steps and time allowed to each run, as for eval_Lif;
+    a run that exceeds them raises ExecutionLimitExceeded.
+    :return: A function that runs the program and returns the values it
+    printed, like eval_Lif; it can be called more than once.
+    """
+    match prog:
+        case Module(stmts):
+            compiler = ClosureCompiler(language, limits)
+            body = compiler.compile_stmts(stmts)
+        case _:
+            raise Exception('eval_Lif', prog)
+
+    def run() -> List[Any]:
+        compiler.outputs = []
+        if limits is not None:
+            compiler.guard = StepGuard(limits)
+        frame = [UNBOUND] * len(compiler.slots)
+        compiler.scopes = [(frame, compiler.slots)]
+        body(frame)
+        return compiler.outputs
+    return run
@@ -0,0 +1,179 @@
+import heapq
+import itertools
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# ==================================================
+# Registers and colors
+# ==================================================
+# Colors 0..k-1 are the k registers available for allocation, in order.
+# Colors k and above are stack locations (spills). Registers that are never
+# allocated (%rax, %rsp, %rbp, %r11, %r15) get negative colors, so variables
+# that interfere with them are not affected.
+
+RESERVED_REGISTERS = ['rax', 'rsp', 'rbp', 'r11', 'r15']
+
+def register_colors(caller_saved_registers: List[str],
+                    callee_saved_registers: List[str]) -> Dict[str, int]:
+    """
+    Assigns a color to each register.
+    :param caller_saved_registers: E.g. constants.caller_saved_registers.
+    :param callee_saved_registers: E.g. constants.callee_saved_registers.
+    :return: A dictionary mapping register names to colors.
+    """
+    colors = {}
+    for i, r in enumerate(RESERVED_REGISTERS):
+        colors[r] = -(i + 1)
+    k = 0
+    for r in caller_saved_registers + callee_saved_registers:
+        if r not in colors:
+            colors[r] = k
+            k += 1
+    return colors
+
+def precolor_registers(nodes: Iterable, colors: Dict[str, int]) -> Dict[Hashable, int]:
+    """
+    Returns the precoloring of the register nodes (Reg or ByteReg) among nodes.
+    """
+    return {a: colors[a.val] for a in nodes
+            if type(a).__name__ in ('Reg', 'ByteReg') and a.val in colors}
+
+def move_related(blocks: Dict[str, List]) -> Dict[Hashable, Set]:
+    """
+    Finds pairs of locations connected by a movq between them.
+    :param blocks: The program's blocks.
+    :return: For each location, the locations it is moved to or from.
+    """
+    related = {}
+    for instrs in blocks.values():
+        for i in instrs:
+            if type(i).__name__ == 'Movq':
+                a, b = i.a1, i.a2
+                if type(a).__name__ in ('Var', 'Reg') and type(b).__name__ in ('Var', 'Reg') \
+                        and a != b:
+                    related.setdefault(a, set()).add(b)
+                    related.setdefault(b, set()).add(a)
+    return related
+
+# ==================================================
+# Heuristics
+# ==================================================
+# A heuristic computes a priority for an uncolored node from its
+# saturation (the number of distinct colors among its neighbors) and its
+# degree; the node with the largest priority is colored next.
+
+def dsatur_priority(saturation: int, degree: int) -> Tuple:
+    return (saturation, degree)
+
+def degree_priority(saturation: int, degree: int) -> Tuple:
+    # largest degree first (Welsh-Powell); ignores saturation
+    return (degree,)
+
+HEURISTICS: Dict[str, Callable[[int, int], Tuple]] = {
+    'dsatur': dsatur_priority,
+    'degree': degree_priority,
+}
+
+# ==================================================
+# Coloring
+# ==================================================
+
+def color_graph(graph, nodes: Optional[Iterable] = None,
+                precolored: Optional[Dict[Hashable, int]] = None,
+                moves: Optional[Dict[Hashable, Set]] = None,
+                heuristic='dsatur',
+                num_registers: Optional[int] = None) -> Dict[Hashable, int]:
+    """
+    Colors an interference graph with DSatur, using a priority queue so that
+    choosing the next node takes O(log V) rather than a scan of every node.
+    :param graph: An InterferenceGraph (from an assignment, or a
+    BitsetInterferenceGraph).
+    :param nodes: The nodes to color; defaults to graph.get_nodes(). Nodes
+    without neighbors should be included too.
+    :param precolored: Colors fixed in advance, e.g. for registers (see
+    register_colors and precolor_registers).
+    :param moves: Move-related nodes (see move_related). When possible, a
+    node gets the same color as a node it is moved to or from, so that the
+    move can be removed.
+    :param heuristic: 'dsatur', 'degree', or a function from (saturation,
+    degree) to a priority.
+    :param num_registers: If given, a move-related color is only preferred
+    when it is a register color (below num_registers), or when the node
+    would be spilled anyway.
+    :return: A dictionary mapping every node (including precolored ones)
+    to its color.
+    """
+    priority = HEURISTICS[heuristic] if isinstance(heuristic, str) else heuristic
+    precolored = precolored or {}
+    moves = moves or {}
+    nodes = list(graph.get_nodes() if nodes is None else nodes)
+    for a in precolored:
+        if a not in nodes:
+            nodes.append(a)
+
+    coloring: Dict[Hashable, int] = {}
+    saturation: Dict[Hashable, Set[int]] = {a: set() for a in nodes}
+    neighbors = {a: graph.neighbors(a) for a in nodes}
+    degree = {a: len(neighbors[a]) for a in nodes}
+
+    def assign(a, c):
+        coloring[a] = c
+        for b in neighbors[a]:
+            if b not in coloring and c not in saturation.setdefault(b, set()):
+                saturation[b].add(c)
+                if b in degree:
+                    push(b)
+
+    # max-heap of (priority, insertion order, node), via negated keys;
+    # entries become stale when a node's saturation grows or it is colored
+    heap = []
+    counter = itertools.count()
+
+    def key(a):
+        return tuple(-k for k in priority(len(saturation[a]), degree[a]))
+
+    def push(a):
+        heapq.heappush(heap, (key(a), next(counter), a))
+
+    for a, c in precolored.items():
+        assign(a, c)
+    for a in nodes:
+        if a not in coloring:
+            push(a)
+
+    while heap:
+        k, _, a = heapq.heappop(heap)
+        if a in coloring or k != key(a):
+            continue
+
+        taken = saturation[a]
+        lowest = 0
+        while lowest in taken:
+            lowest += 1
+        c = lowest
+
+        # move biasing: reuse the color of a move-related node, if allowed
+        biased = [coloring[b] for b in moves.get(a, ())
+                  if b in coloring and coloring[b] >= 0 and coloring[b] not in taken]
+        if biased:
+            best = min(biased)
+            if num_registers is None or best < num_registers or lowest >= num_registers:
+                c = best
+
+        assign(a, c)
+
+    return coloring
+
+def count_spills(coloring: Dict[Hashable, int], num_registers: int) -> int:
+    """
+    Returns the number of variables colored with a stack location.
+    """
+    return sum(1 for a, c in coloring.items()
+               if c >= num_registers and type(a).__name__ in ('Var', 'VecVar'))
+
+def count_moves_removed(coloring: Dict[Hashable, int], moves: Dict[Hashable, Set]) -> int:
+    """
+    Returns the number of move-related pairs that received the same color.
+    """
+    pairs = {frozenset((a, b)) for a, bs in moves.items() for b in bs}
+    return sum(1 for p in pairs
+               if len(p) == 2 and len({coloring.get(a, object()) for a in p}) == 1)
@@ -0,0 +1,220 @@
+from dataclasses import replace
+from typing import Dict, List, Set
+
+from .python_ast import *
+
+# ==================================================
+# Constant folding and propagation
+# ==================================================
+# An optimization pass on the Python-subset AST (python_ast.Program),
+# meant to run after typecheck and before remove complex operands:
+#
+#     compiler_passes = {
+#         'typecheck': typecheck,
+#         'fold constants': ConstantFolder(),
+#         'remove complex opera*': rco,
+#         ...
+#     }
+#
+# It folds primitives whose arguments are constants, propagates constants
+# and copies (x = 5, y = x) through straight-line code, and replaces an if
+# or while whose condition became a constant by the branch that runs.
+#
+# Propagation is conservative around control flow: after an if, only the
+# facts that hold after both branches are kept, and a while loop forgets
+# every variable assigned in its body. Function bodies start with no facts.
+#
+# Folded arithmetic results must fit in a 32-bit immediate; larger results
+# are left to be computed at run time. "and"/"or" are only simplified in
+# ways that keep every call in the program.
+
+IMMEDIATE_MIN = -2**31
+IMMEDIATE_MAX = 2**31 - 1
+
+ARITHMETIC = {
+    'add': lambda a, b: a + b,
+    'sub': lambda a, b: a - b,
+    'mult': lambda a, b: a * b,
+}
+
+COMPARISONS = {
+    'eq': lambda a, b: a == b,
+    'noteq': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+}
+
+Env = Dict[str, Expr]
+
+def is_int(e) -> bool:
+    # bool is a subclass of int, but True + 1 is not well-typed here
+    return isinstance(e, Constant) and type(e.val) is int
+
+def is_bool(e, value: bool) -> bool:
+    return isinstance(e, Constant) and type(e.val) is bool and e.val == value
+
+def is_pure(e) -> bool:
+    # whether evaluating e has no effect other than computing its value
+    match e:
+        case Constant(_) | Var(_):
+            return True
+        case Prim(_, args):
+            return all(is_pure(a) for a in args)
+        case FieldRef(lhs, _):
+            return is_pure(lhs)
+        case _:
+            return False
+
+def assigned_vars(stmts: List[Stmt]) -> Set[str]:
+    """
+    Returns the variables assigned anywhere in a list of statements,
+    including nested blocks but not function definitions.
+    """
+    result = set()
+    for s in stmts:
+        match s:
+            case Assign(x, _):
+                result.add(x)
+            case If(_, then_stmts, else_stmts):
+                result |= assigned_vars(then_stmts) | assigned_vars(else_stmts)
+            case While(_, body):
+                result |= assigned_vars(body)
+            case For(x, _, body):
+                result.add(x)
+                result |= assigned_vars(body)
+    return result
+
+class ConstantFolder:
+    """
+    Folds and propagates constants in a program. Callable as a compiler
+    pass; changes counts, over every program optimized by this object, the
+    primitives folded, variable uses replaced, and ifs and whiles removed.
+    """
+    changes: Dict[str, int]
+
+    def __init__(self):
+        self.changes = {'folded': 0, 'propagated': 0, 'dead branches': 0}
+
+    def __call__(self, program: Program) -> Program:
+        return Program(self.fold_stmts(program.stmts, {}))
+
+    # ------------------------------------------------------------
+    # Statements
+
+    def kill(self, x: str, env: Env):
+        # forget what is known about x, and the copies of x
+        env.pop(x, None)
+        for y in [y for y, e in env.items() if e == Var(x)]:
+            del env[y]
+
+    def fold_stmts(self, stmts: List[Stmt], env: Env) -> List[Stmt]:
+        result = []
+        for s in stmts:
+            result.extend(self.fold_stmt(s, env))
+        return result
+
+    def fold_stmt(self, s: Stmt, env: Env) -> List[Stmt]:
+        match s:
+            case Assign(x, rhs):
+                new_rhs = self.fold_expr(rhs, env)
+                self.kill(x, env)
+                if isinstance(new_rhs, Constant) or \
+                        (isinstance(new_rhs, Var) and new_rhs.name != x):
+                    env[x] = new_rhs
+                return [Assign(x, new_rhs)]
+            case Print(e):
+                return [Print(self.fold_expr(e, env))]
+            case Return(e):
+                return [Return(self.fold_expr(e, env))]
+            case If(condition, then_stmts, else_stmts):
+                new_condition = self.fold_expr(condition, env)
+                if isinstance(new_condition, Constant):
+                    self.changes['dead branches'] += 1
+                    return self.fold_stmts(then_stmts if new_condition.val else else_stmts, env)
+
+                then_env, else_env = dict(env), dict(env)
+                new_then = self.fold_stmts(then_stmts, then_env)
+                new_else = self.fold_stmts(else_stmts, else_env)
+                env.clear()
+                env.update({x: e for x, e in then_env.items() if else_env.get(x) == e})
+                return [If(new_condition, new_then, new_else)]
+            case While(condition, body):
+                for x in assigned_vars(body):
+                    self.kill(x, env)
+                new_condition = self.fold_expr(condition, env)
+                if is_bool(new_condition, False):
+                    self.changes['dead branches'] += 1
+                    return []
+                return [While(new_condition, self.fold_stmts(body, dict(env)))]
+            case FunctionDef(name, params, body, return_type):
+                return [FunctionDef(name, params, self.fold_stmts(body, {}), return_type)]
+            case _:
+                for x in assigned_vars([s]):
+                    self.kill(x, env)
+                return [s]
+
+    # ------------------------------------------------------------
+    # Expressions
+
+    def fold_expr(self, e: Expr, env: Env) -> Expr:
+        match e:
+            case Var(x):
+                if x in env:
+                    self.changes['propagated'] += 1
+                    return env[x]
+                return e
+            case Prim(op, args):
+                new = self.fold_prim(op, [self.fold_expr(a, env) for a in args])
+                if not isinstance(new, Prim) or new.op != op:
+                    self.changes['folded'] += 1
+                return new
+            case Call(function, args):
+                return Call(self.fold_expr(function, env), [self.fold_expr(a, env) for a in args])
+            case FieldRef(lhs, field):
+                return FieldRef(self.fold_expr(lhs, env), field)
+            case _:
+                return e
+
+    def fold_prim(self, op: str, args: List[Expr]) -> Expr:
+        if op in ARITHMETIC:
+            a, b = args
+            if is_int(a) and is_int(b):
+                value = ARITHMETIC[op](a.val, b.val)
+                if IMMEDIATE_MIN <= value <= IMMEDIATE_MAX:
+                    return Constant(value)
+            # x + 0, 0 + x, x - 0, x * 1, 1 * x
+            if op in ('add', 'sub') and is_int(b) and b.val == 0:
+                return a
+            if op == 'add' and is_int(a) and a.val == 0:
+                return b
+            if op == 'mult' and is_int(b) and b.val == 1:
+                return a
+            if op == 'mult' and is_int(a) and a.val == 1:
+                return b
+        elif op in COMPARISONS:
+            a, b = args
+            if isinstance(a, Constant) and isinstance(b, Constant):
+                return Constant(COMPARISONS[op](a.val, b.val))
+        elif op == 'usub':
+            a, = args
+            if is_int(a) and IMMEDIATE_MIN <= -a.val <= IMMEDIATE_MAX:
+                return Constant(-a.val)
+        elif op == 'not':
+            a, = args
+            if isinstance(a, Constant):
+                return Constant(not a.val)
+        elif op in ('and', 'or'):
+            a, b = args
+            # the value that decides the result on its own, and the neutral one
+            absorbing = op == 'or'
+            if is_bool(a, not absorbing):
+                return b
+            if is_bool(b, not absorbing):
+                return a
+            if is_bool(a, absorbing) and is_pure(b):
+                return a
+            if is_bool(b, absorbing) and is_pure(a):
+                return b
+        return Prim(op, args)
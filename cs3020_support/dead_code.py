@@ -0,0 +1,127 @@
+from dataclasses import replace
+from typing import Dict, Iterable, List, Optional
+
+from .liveness import CALLER_SAVED_REGISTERS, Liveness
+from .peephole import FLAG_SETTERS, flags_dead_after
+
+# ==================================================
+# Dead code elimination
+# ==================================================
+# A pass over pseudo-x86 programs (X86Program, or X86ProgramDefs with one
+# X86FunctionDef per function) that deletes instructions whose only effect
+# is to write a variable that is never read afterwards, meant to run after
+# select instructions, before allocate registers:
+#
+#     compiler_passes = {
+#         ...
+#         'select instructions': select_instructions,
+#         'remove dead code': DeadCodeEliminator(),
+#         'allocate registers': allocate_registers,
+#         ...
+#     }
+#
+# Only writes to variables are removed. Instructions with other effects
+# are kept: calls, jumps and returns, pushes and pops, stores to memory
+# (Deref, GlobalVal), and writes to registers, whose uses (e.g. %rax as
+# the return value, or argument registers) are not all visible here. An
+# instruction that sets the flags is only removed if no later instruction
+# reads them.
+
+# Instructions that only write their destination (and maybe the flags)
+REMOVABLE = {'Movq', 'Movzbq', 'Leaq', 'Addq', 'Subq', 'Imulq', 'Andq', 'Orq', 'Xorq', 'Cmpq'}
+
+def kind(x) -> str:
+    return type(x).__name__
+
+class DeadCodeEliminator:
+    """
+    Removes dead instructions, using the liveness engine and iterating to
+    a fixpoint: removing an instruction can make the instructions that
+    computed its operands dead, in the same block or in earlier ones.
+    Callable as a compiler pass; removed counts the instructions removed
+    over every program processed by this object.
+    """
+    removed: int
+
+    def __init__(self, caller_saved=CALLER_SAVED_REGISTERS):
+        """
+        :param caller_saved: Names of the registers a call may overwrite.
+        """
+        self.caller_saved = caller_saved
+        self.removed = 0
+
+    def __call__(self, program):
+        return self.eliminate_program(program)
+
+    def eliminate_program(self, program):
+        match kind(program):
+            case 'X86Program':
+                return replace(program, blocks=self.eliminate_blocks(program.blocks))
+            case 'X86ProgramDefs':
+                return replace(program, defs=[replace(d, blocks=self.eliminate_blocks(d.blocks))
+                                              for d in program.defs])
+            case _:
+                raise Exception('remove dead code: unknown program', program)
+
+    def eliminate_blocks(self, blocks: Dict[str, List],
+                         live_at_exit: Optional[Dict[str, Iterable]] = None) -> Dict[str, List]:
+        """
+        Removes the dead instructions of a program's blocks.
+        :param blocks: The program's blocks.
+        :param live_at_exit: For labels outside the program, the locations
+        live when jumping to them.
+        :return: The new blocks.
+        """
+        blocks = dict(blocks)
+        liveness = Liveness(blocks, live_at_exit, self.caller_saved)
+        changed = True
+        while changed:
+            changed = False
+            for label in liveness.postorder(list(blocks)):
+                new = self.sweep(liveness, label)
+                if len(new) < len(blocks[label]):
+                    self.removed += len(blocks[label]) - len(new)
+                    blocks[label] = new
+                    # re-solves the blocks that can reach this one
+                    liveness.update_block(label, new)
+                    changed = True
+        return blocks
+
+    def is_dead(self, i, live_after: int, liveness: Liveness, block: List, index: int) -> bool:
+        name = kind(i)
+        if name not in REMOVABLE:
+            return False
+        if name in FLAG_SETTERS and not flags_dead_after(block, index):
+            return False
+        if name == 'Cmpq':
+            return True
+        dest = i.a2
+        if kind(dest) not in ('Var', 'VecVar'):
+            return False
+        j = liveness.ids.get(dest)
+        return j is None or not live_after >> j & 1
+
+    def sweep(self, liveness: Liveness, label: str) -> List:
+        """
+        Walks a block backwards, dropping dead instructions; the operands of
+        a dropped instruction do not become live.
+        :return: The instructions that remain.
+        """
+        block = liveness.blocks[label]
+        instr_bits = liveness.instr_bits[label]
+        live = 0
+        kept = []
+        for index in range(len(block) - 1, -1, -1):
+            i = block[index]
+            name = kind(i)
+            if name in ('Jmp', 'JmpIf'):
+                target_live = liveness.target_live(i.label)
+                live = target_live if name == 'Jmp' else live | target_live
+            elif self.is_dead(i, live, liveness, block, index):
+                continue
+            else:
+                r, w = instr_bits[index]
+                live = (live & ~w) | r
+            kept.append(i)
+        kept.reverse()
+        return kept
@@ -1,49 +1,163 @@
+import sys
+import time
 from collections import defaultdict
 from dataclasses import dataclass
+from functools import lru_cache
 
 from .parser_x86 import x86_parser, x86_parser_instrs
+from .x86_decode import *
+from .x86_memory import *
+from .x86_gc import CheneyCollector, GCStats
+from .limits import CHECK_INTERVAL, ExecutionLimitExceeded, ExecutionLimits
+from .x86_profile import ExecutionProfile, build_profile, instr_name
 
 import pandas as pd
 
+# Returned by an instruction handler to stop execution
+HALT = sys.maxsize
+
+# Function pointers stored in flat memory are encoded as "code addresses":
+# CODE_BASE + 8 * (index of the label's first instruction)
+CODE_BASE = 0x400000
+
+# Number of decoded programs kept by load_program
+PROGRAM_CACHE_SIZE = 128
+
+@lru_cache(maxsize=PROGRAM_CACHE_SIZE)
+def load_program(s: str) -> X86Code:
+    """
+    Parses and decodes an x86 program. Results are cached by the program
+    text, so running the same program again skips parsing and decoding.
+    The returned X86Code is shared between callers and must not be modified.
+    :param s: The program, as a string.
+    :return: The decoded and linked program.
+    """
+    # most programs come from print_x86, which decode_text handles directly
+    code = decode_text(s)
+    if code is None:
+        code = decode_program(x86_parser.parse(s))
+    return code
+
 @dataclass
 class FunPointer:
     fun_name: str
 
+class RegisterView:
+    """
+    A dictionary-style view of the emulator's register file, keyed by
+    register name. Only registers that have been assigned are listed.
+    """
+    def __init__(self, regs):
+        self.regs = regs
+
+    def __getitem__(self, name):
+        return self.regs[REGISTER_NUMBERS[name]]
+
+    def __setitem__(self, name, v):
+        self.regs[REGISTER_NUMBERS[name]] = v
+
+    def keys(self):
+        return [REGISTERS[i] for i, v in enumerate(self.regs) if v is not None]
+
+    def copy(self):
+        return defaultdict(lambda: None, {k: self[k] for k in self.keys()})
+
 class X86Emulator:
-    def __init__(self, logging=True):
-        self.registers = defaultdict(lambda: None)
-        self.memory = defaultdict(lambda: None)
+    def __init__(self, logging=True, memory=None, stack_size=DEFAULT_STACK_SIZE,
+                 limits: ExecutionLimits = None, profile=False):
+        """
+        :param logging: Print the machine state after each runtime call.
+        :param memory: 'flat' stores memory in fixed-size word arrays (the
+        stack, root stack and heap), and raises an error on out-of-bounds
+        accesses. 'dict' stores memory in a dictionary keyed by address, at
+        the addresses used by earlier versions of the emulator; this is
+        convenient for debugging, since any address can be written. None
+        (the default) uses 'flat' for eval_program, and 'dict' if the
+        emulator's first run is eval_instructions, so that the state tables
+        of instruction snippets show the same addresses as before.
+        :param stack_size: The size of the stack in flat memory, in bytes.
+        :param limits: A budget of instructions and a time limit for each
+        run; exceeding either raises ExecutionLimitExceeded. None for no
+        limits.
+        :param profile: Count the instructions executed, by block, opcode
+        and call target, and the memory accesses; see execution_profile().
+        Runs are slower when profiling.
+        """
+        self.regs = [None] * len(REGISTERS)
+        self.registers = RegisterView(self.regs)
         self.variables = defaultdict(lambda: None)
         self.logging = logging
-        self.registers['rbp'] = 1000
-        self.registers['rsp'] = 1000
+        self.limits = limits
+        self.steps = None
+        self.profiling = profile
+        self.profile = None
+
+        self.stack_size = stack_size
+        # whether the memory model is still to be picked by the first run
+        self.default_memory = memory is None
+        self.set_memory(memory or 'flat')
+
+        self.code = X86Code([], {})
+        self.gc = None
 
         self.global_vals = {}
+
+        self.dispatch = [None] * NUM_OPCODES
+        for op, fn in handlers.items():
+            self.dispatch[op] = fn.__get__(self)
+
+        self.runtime_functions = {
+            'print_int': self.call_print_int,
+            'initialize': self.call_initialize,
+            'collect': self.call_collect,
+        }
     
+    def set_memory(self, memory: str):
+        """
+        Sets up empty memory of the given model ('flat' or 'dict'), and
+        points %rsp and %rbp at the top of its stack.
+        """
+        if memory == 'flat':
+            self.layout = FLAT_LAYOUT
+            self.memory = FlatMemory()
+            self.memory.encode = self.encode_word
+            self.memory.add_region('stack', self.layout.stack_top - self.stack_size, self.stack_size)
+        elif memory == 'dict':
+            self.layout = LEGACY_LAYOUT
+            self.memory = defaultdict(lambda: None)
+        else:
+            raise ValueError(f'unknown memory model: {memory}')
+
+        self.regs[RBP] = self.layout.stack_top
+        self.regs[RSP] = self.layout.stack_top
+
     def log(self, s):
         if self.logging:
             print(s)
     
     def eval_program(self, s):
-        p = x86_parser.parse(s)
-        
-        assert p.data == 'prog'
-        blocks = {}
+        """
+        Runs a program, starting at "main".
+        :param s: The program, either as a string or as an x86 program AST
+        (an X86Program or X86ProgramDefs), which is run without printing it.
+        :return: The list of values printed by the program.
+        """
+        self.default_memory = False
+
+        # decode the program and lay out its blocks for execution
+        if isinstance(s, str):
+            code = load_program(s)
+        else:
+            code = decode_ast_program(s)
         output = []
 
-        # transform the program into a dict of blocks
-        for b in p.children:
-            assert b.data == 'block'
-            block_name, *instrs = b.children
-            name = str(block_name)
-            blocks[name] = instrs
+        for name in code.labels:
             self.global_vals[name] = FunPointer(name)
 
         self.log('============================== STARTING EXECUTION ==============================')
     
         # start evaluating at "main"
-        self.eval_instrs(blocks['main'], blocks,
-                         output)
+        self.run(code, code.labels['main'], output)
 
         self.log('FINAL STATE:')
         if self.logging:
@@ -58,22 +172,24 @@ class X86Emulator:
         p = x86_parser_instrs.parse(s)
 
         assert p.data == 'instrs'
-        blocks = {}
+        code = link([('', decode_instrs(p.children))])
         output = []
 
+        if self.default_memory:
+            self.set_memory('dict')
+            self.default_memory = False
+
+        # unset words and registers read as None in the snapshots
         orig_memory = self.memory.copy()
         orig_registers = self.registers.copy()
         orig_variables = self.variables.copy()
 
-        
-
         self.log('Executing instructions:')
         self.log(s)
 
         self.log('============================== STARTING EXECUTION ==============================')
     
-        # start evaluating at "main"
-        self.eval_instrs(p.children, blocks, output)
+        self.run(code, 0, output)
 
         self.log('FINAL STATE:')
         if self.logging:
@@ -91,13 +207,17 @@ class X86Emulator:
 
         all_changes = changes_memory + changes_registers + changes_variables
 
-        changes_df = pd.DataFrame(all_changes, columns=['Location', 'Old', 'New'])
+        # object columns, so that None is not shown as NaN and integers
+        # are not shown as floats
+        changes_df = pd.DataFrame(all_changes, columns=['Location', 'Old', 'New'], dtype=object)
         
         return changes_df
 
     def diff_dicts(self, d_after, d_orig):
+        keys_after = list(d_after.keys())
+        keys_removed = set(d_orig.keys()) - set(keys_after)
         keys_diff = []
-        for k in d_after.keys():
+        for k in keys_after + sorted(keys_removed, key=str):
             if d_orig[k] != d_after[k]:
                 keys_diff.append(k)
         return keys_diff
@@ -119,265 +239,367 @@ class X86Emulator:
         for k, v in mem.items():
             self.log(f' {k}:\t {v}')
 
-    def eval_imm(self, e):
-        if e.data == 'int_a':
-            return int(e.children[0])
-        elif e.data == 'neg_a':
-            return -self.eval_imm(e.children[0])
-        else:
-            raise Exception('eval_imm: unknown immediate:', e)
+    def encode_word(self, v):
+        if isinstance(v, FunPointer):
+            return CODE_BASE + 8 * self.label_index(v.fun_name)
+        return encode_word(v)
 
-    
     def eval_arg(self, a):
-        if a.data == 'reg_a':
-            return self.registers[str(a.children[0])]
-        elif a.data == 'var_a':
-            return self.variables[str(a.children[0])]
-        elif a.data == 'int_a':
-            return self.eval_imm(a.children[0])
-        elif a.data == 'mem_a':
-            offset, reg = a.children
-            addr = self.registers[reg]
-            offset_addr = addr + self.eval_imm(offset)
-            return self.memory[offset_addr]
-        elif a.data == 'global_val_a':
-            loc, reg = a.children
-            assert str(reg) == 'rip', a
-            return self.global_vals[str(loc)]
-
+        kind = a[0]
+        if kind == REG:
+            return self.regs[a[1]]
+        elif kind == IMM:
+            return a[1]
+        elif kind == MEM:
+            return self.memory[self.regs[a[2]] + a[1]]
+        elif kind == VAR:
+            return self.variables[a[1]]
+        elif kind == GLOBAL:
+            return self.global_vals[a[1]]
+        elif kind == DIRECT_MEM:
+            return self.memory[self.regs[a[1]]]
         else:
             raise RuntimeError(f'Unknown arg in eval_arg: {a}')
 
     def store_arg(self, a, v):
-        if a.data == 'reg_a':
-            self.registers[str(a.children[0])] = v
-        elif a.data == 'var_a':
-            self.variables[str(a.children[0])] = v
-        elif a.data == 'mem_a':
-            offset, reg = a.children
-            addr = self.registers[reg]
-            offset_addr = addr + self.eval_imm(offset)
-            self.memory[offset_addr] = v
-        elif a.data == 'direct_mem_a':
-            reg = a.children[0]
-            addr = self.registers[reg]
-            self.memory[addr] = v
-        elif a.data == 'global_val_a':
-            loc, reg = a.children
-            assert str(reg) == 'rip', a
-            self.global_vals[str(loc)] = v
-
+        kind = a[0]
+        if kind == REG:
+            self.regs[a[1]] = v
+        elif kind == MEM:
+            self.memory[self.regs[a[2]] + a[1]] = v
+        elif kind == VAR:
+            self.variables[a[1]] = v
+        elif kind == DIRECT_MEM:
+            self.memory[self.regs[a[1]]] = v
+        elif kind == GLOBAL:
+            self.global_vals[a[1]] = v
         else:
             raise RuntimeError(f'Unknown arg in store_arg: {a}')
 
-    def eval_instrs(self, instrs, blocks, output):
-        for instr in instrs:
-            #log('Evaluating instruction:', instr.pretty())
-            if instr.data == 'pushq':
-                a = instr.children[0]
-                self.registers['rsp'] = self.registers['rsp'] - 8
-                v = self.eval_arg(a)
-                self.memory[self.registers['rsp']] = v
-
-            elif instr.data == 'popq':
-                a = instr.children[0]
-                v = self.memory[self.registers['rsp']]
-                self.registers['rsp'] = self.registers['rsp'] + 8
-                self.store_arg(a, v)
-
-            elif instr.data == 'movq':
-                a1, a2 = instr.children
-                v = self.eval_arg(a1)
-                self.store_arg(a2, v)
-
-            elif instr.data == 'movzbq':
-                a1, a2 = instr.children
-                v = self.eval_arg(a1)
-                self.store_arg(a2, v)
-
-            elif instr.data == 'salq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v2 << v1)
-
-            elif instr.data == 'sarq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v2 >> v1)
-
-            elif instr.data == 'addq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v1 + v2)
-
-            elif instr.data == 'subq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v2 - v1)
-
-            elif instr.data == 'imulq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v2 * v1)
-
-            elif instr.data == 'andq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v1 and v2)
-
-            elif instr.data == 'orq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v1 or v2)
-
-            elif instr.data == 'xorq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, v1 ^ v2)
-
-            elif instr.data == 'negq':
-                a1 = instr.children[0]
-                v1 = self.eval_arg(a1)
-                self.store_arg(a1, (- v1))
-
-            elif instr.data in ['jmp', 'je', 'jl', 'jle', 'jg', 'jge']:
-                target = str(instr.children[0])
-                perform_jump = False
-
-                if instr.data == 'jmp':
-                    perform_jump = True
-                elif instr.data == 'je' and self.registers['EFLAGS'] == 'e':
-                    perform_jump = True
-                elif instr.data == 'jl' and self.registers['EFLAGS'] == 'l':
-                    perform_jump = True
-                elif instr.data == 'jle' and self.registers['EFLAGS'] in ['l', 'e']:
-                    perform_jump = True
-                elif instr.data == 'jg' and self.registers['EFLAGS'] == 'g':
-                    perform_jump = True
-                elif instr.data == 'jge' and self.registers['EFLAGS'] in ['g', 'e']:
-                    perform_jump = True
-
-                if perform_jump:
-                    self.eval_instrs(blocks[target], blocks, output)
-                    return # after jumping, toss continuation
-
-            elif instr.data in ['sete', 'setl', 'setle', 'setg', 'setge']:
-                a1 = instr.children[0]
-
-                if instr.data == 'sete' and self.registers['EFLAGS'] == 'e':
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setl' and self.registers['EFLAGS'] == 'l':
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setle' and self.registers['EFLAGS'] in ['l', 'e']:
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setg' and self.registers['EFLAGS'] == 'g':
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setge' and self.registers['EFLAGS'] in ['g', 'e']:
-                    self.store_arg(a1, 1)
-                else:
-                    self.store_arg(a1, 0)
-
-
-            elif instr.data == 'callq':
-                target = str(instr.children[0])
-                if target == 'print_int':
-                    self.log(f'CALL TO print_int: {self.registers["rdi"]}')
-                    output.append(self.registers['rdi'])
-                    if self.logging:
-                        print(self.print_state())
-
-                elif target == 'initialize':
-                    self.log(f'CALL TO initialize: {self.registers["rdi"]}, {self.registers["rsi"]}')
-                    rootstack_size = self.registers['rdi']
-                    heap_size = self.registers['rsi']
-
-                    rs_begin = 2000
-                    rs_end = rs_begin + rootstack_size
-
-                    fromspace_begin = 100000
-                    fromspace_end = fromspace_begin + heap_size
-
-                    self.global_vals = { **self.global_vals,
-                        'rootstack_begin': rs_begin,
-                        'rootstack_end': rs_end,
-                        'free_ptr': fromspace_begin,
-                        'fromspace_begin': fromspace_begin,
-                        'fromspace_end': fromspace_end
-                    }
-
-                    if self.logging:
-                        print(self.print_state())
-
-
-                elif target == 'collect':
-                    self.log(f'CALL TO collect: need {self.registers["rsi"]} bytes')
-
-                    needed = self.registers["rsi"]
-                    fsb = self.global_vals['fromspace_begin']
-                    fse = self.global_vals['fromspace_end']
-
-                    current_space = fse - fsb
-
-                    new_space = current_space
-                    while new_space - current_space < needed:
-                        new_space = new_space * 2
-
-                    new_fse = fsb + new_space
-                    self.global_vals['fromspace_end'] = new_fse
-
-                    if self.logging:
-                        print(self.print_state())
-
-                else:
-                    self.eval_instrs(blocks[target], blocks, output)
-
-            elif instr.data == 'retq':
-                return
-
-            elif instr.data == 'cmpq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-
-                if v1 == v2:
-                    self.registers['EFLAGS'] = 'e'
-                elif v2 < v1:
-                    self.registers['EFLAGS'] = 'l'
-                elif v2 > v1:
-                    self.registers['EFLAGS'] = 'g'
-                else:
-                    raise RuntimeError(f'failed comparison: {instr}')
-
-            elif instr.data == 'leaq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                assert isinstance(v1, FunPointer)
-                self.store_arg(a2, v1)
-
-            elif instr.data == 'indirect_callq':
-                v = self.eval_arg(instr.children[0])
-                assert isinstance(v, FunPointer)
-                target = v.fun_name
-                self.eval_instrs(blocks[target], blocks, output)
-
-            elif instr.data == 'indirect_jmp':
-                v = self.eval_arg(instr.children[0])
-                assert isinstance(v, FunPointer)
-                target = v.fun_name
-                self.eval_instrs(blocks[target], blocks, output)
-                return # after jumping, toss continuation
-
+    def run(self, code: X86Code, pc: int, output):
+        """
+        Executes a linked program, starting at index pc, until the outermost
+        function returns or control falls off the end of the program.
+        Jumps and calls update the program counter in place; calls push
+        their return address on an explicit return stack, so running time
+        and call depth do not depend on Python's recursion limit.
+        :param code: The linked program.
+        :param pc: The index of the first instruction to execute.
+        :param output: A list that collects the values printed by print_int.
+        """
+        self.code = code
+        self.output = output
+        self.return_stack = []
+
+        instrs = code.instrs
+        dispatch = self.dispatch
+        n = len(instrs)
+        if self.profiling:
+            self.run_profiled(instrs, dispatch, pc)
+            return
+        if self.limits is not None:
+            self.run_limited(instrs, dispatch, pc)
+            return
+        while pc < n:
+            instr = instrs[pc]
+            pc = dispatch[instr[0]](instr, pc + 1)
+
+    def run_limited(self, instrs, dispatch, pc: int):
+        """
+        The loop of run, counting instructions. It runs in chunks of at most
+        CHECK_INTERVAL instructions, checking the limits between chunks, so
+        the inner loop only adds a bounds check to each instruction.
+        Sets self.steps to the number of instructions executed.
+        """
+        max_steps = self.limits.max_steps
+        seconds = self.limits.seconds
+        start = time.monotonic()
+        n = len(instrs)
+        steps = 0
+        self.steps = 0
+        while pc < n:
+            chunk = CHECK_INTERVAL
+            if max_steps is not None:
+                chunk = min(chunk, max_steps - steps)
+                if chunk <= 0:
+                    raise self.limit_exceeded('steps', pc, steps, start)
+            for i in range(chunk):
+                instr = instrs[pc]
+                pc = dispatch[instr[0]](instr, pc + 1)
+                if pc >= n:
+                    steps += i + 1
+                    break
             else:
-                raise RuntimeError(f'Unknown instruction: {instr.data}')
+                steps += chunk
+            self.steps = steps
+            if seconds is not None and pc < n and time.monotonic() - start > seconds:
+                raise self.limit_exceeded('time', pc, steps, start)
+
+    def run_profiled(self, instrs, dispatch, pc: int):
+        """
+        The loop of run, counting the executions of each instruction and
+        the targets of indirect calls, and then building self.profile.
+        Also enforces the limits, if any.
+        """
+        n = len(instrs)
+        counts = [0] * n
+        indirect_calls = defaultdict(int)
+        start = time.monotonic()
+        steps = 0
+        check_at = self.next_limit_check(0)
+        try:
+            while pc < n:
+                if steps == check_at:
+                    self.check_limits(pc, steps, start)
+                    check_at = self.next_limit_check(steps)
+                instr = instrs[pc]
+                counts[pc] += 1
+                steps += 1
+                next_pc = dispatch[instr[0]](instr, pc + 1)
+                if instr[0] == INDIRECT_CALLQ:
+                    indirect_calls[next_pc] += 1
+                pc = next_pc
+        finally:
+            # also kept when the program fails or runs out of steps
+            self.steps = steps
+            self.profile = build_profile(self.code, counts, indirect_calls)
+
+    def next_limit_check(self, steps: int) -> int:
+        # the step count at which run_profiled next checks the limits
+        if self.limits is None:
+            return -1
+        check_at = steps + CHECK_INTERVAL
+        if self.limits.max_steps is not None:
+            check_at = min(check_at, self.limits.max_steps)
+        return check_at
+
+    def check_limits(self, pc: int, steps: int, start: float):
+        max_steps, seconds = self.limits.max_steps, self.limits.seconds
+        if max_steps is not None and steps >= max_steps:
+            raise self.limit_exceeded('steps', pc, steps, start)
+        if seconds is not None and time.monotonic() - start > seconds:
+            raise self.limit_exceeded('time', pc, steps, start)
+
+    def limit_exceeded(self, reason: str, pc: int, steps: int, start: float) -> ExecutionLimitExceeded:
+        label, offset = self.code.locate(pc)
+        location = f'{label}+{offset} ({instr_name(self.code.instrs[pc])})'
+        return ExecutionLimitExceeded(reason, steps, time.monotonic() - start, location, pc=pc)
+
+    def execution_profile(self) -> ExecutionProfile:
+        """
+        Returns the profile of the last run, if the emulator was created
+        with profile=True; otherwise None.
+        """
+        return self.profile
+
+    # ==================================================
+    # Instruction handlers, indexed by opcode in self.dispatch
+    # ==================================================
+    # Each handler receives the decoded instruction and the index of the
+    # following instruction, and returns the index to execute next.
+
+    def exec_pushq(self, instr, pc):
+        self.regs[RSP] = self.regs[RSP] - 8
+        v = self.eval_arg(instr[1])
+        self.memory[self.regs[RSP]] = v
+        return pc
+
+    def exec_popq(self, instr, pc):
+        v = self.memory[self.regs[RSP]]
+        self.regs[RSP] = self.regs[RSP] + 8
+        self.store_arg(instr[1], v)
+        return pc
+
+    def exec_movq(self, instr, pc):
+        self.store_arg(instr[2], self.eval_arg(instr[1]))
+        return pc
+
+    def exec_binop(self, instr, pc):
+        op, a1, a2 = instr
+        v1 = self.eval_arg(a1)
+        v2 = self.eval_arg(a2)
+        self.store_arg(a2, binops[op](v1, v2))
+        return pc
+
+    def exec_negq(self, instr, pc):
+        a1 = instr[1]
+        self.store_arg(a1, (- self.eval_arg(a1)))
+        return pc
+
+    def exec_cmpq(self, instr, pc):
+        v1 = self.eval_arg(instr[1])
+        v2 = self.eval_arg(instr[2])
+
+        if v1 == v2:
+            self.regs[EFLAGS] = 'e'
+        elif v2 < v1:
+            self.regs[EFLAGS] = 'l'
+        elif v2 > v1:
+            self.regs[EFLAGS] = 'g'
+        else:
+            raise RuntimeError(f'failed comparison: {instr}')
+        return pc
+
+    def exec_leaq(self, instr, pc):
+        v1 = self.eval_arg(instr[1])
+        assert isinstance(v1, FunPointer)
+        self.store_arg(instr[2], v1)
+        return pc
+
+    def exec_jmp(self, instr, pc):
+        return self.jump_target(instr[1])
+
+    def exec_jcc(self, instr, pc):
+        _, cond, target = instr
+        if self.regs[EFLAGS] in cond:
+            return self.jump_target(target)
+        return pc
+
+    def exec_setcc(self, instr, pc):
+        _, cond, a1 = instr
+        if self.regs[EFLAGS] in cond:
+            self.store_arg(a1, 1)
+        else:
+            self.store_arg(a1, 0)
+        return pc
+
+    def exec_callq(self, instr, pc):
+        label = instr[1][1]
+        if label in self.runtime_functions:
+            self.runtime_functions[label]()
+            return pc
+        self.return_stack.append(pc)
+        return self.jump_target(instr[1])
+
+    def exec_indirect_callq(self, instr, pc):
+        target = self.code_target(self.eval_arg(instr[1]))
+        self.return_stack.append(pc)
+        return target
+
+    def exec_indirect_jmp(self, instr, pc):
+        return self.code_target(self.eval_arg(instr[1]))
+
+    def exec_retq(self, instr, pc):
+        if self.return_stack:
+            return self.return_stack.pop()
+        return HALT
+
+    def jump_target(self, a):
+        target = a[2]
+        if target is None:
+            raise RuntimeError(f'Unknown jump target: {a[1]}')
+        return target
+
+    def label_index(self, label):
+        if label not in self.code.labels:
+            raise RuntimeError(f'Unknown jump target: {label}')
+        return self.code.labels[label]
+
+    def code_target(self, v):
+        # the target of an indirect jump or call is either a FunPointer or,
+        # if it has been through flat memory, an encoded code address
+        if isinstance(v, FunPointer):
+            return self.label_index(v.fun_name)
+        elif isinstance(v, int) and v >= CODE_BASE and (v - CODE_BASE) % 8 == 0 \
+                and (v - CODE_BASE) // 8 < len(self.code.instrs):
+            return (v - CODE_BASE) // 8
+        else:
+            raise RuntimeError(f'Invalid indirect jump target: {v}')
+
+    # ==================================================
+    # Runtime functions (implemented in runtime.c for gcc)
+    # ==================================================
+
+    def call_print_int(self):
+        self.log(f'CALL TO print_int: {self.regs[RDI]}')
+        self.output.append(self.regs[RDI])
+        if self.logging:
+            print(self.print_state())
+
+    def call_initialize(self):
+        self.log(f'CALL TO initialize: {self.regs[RDI]}, {self.regs[RSI]}')
+        rootstack_size = self.regs[RDI]
+        heap_size = self.regs[RSI]
+
+        rs_begin = self.layout.rootstack_begin
+        rs_end = rs_begin + rootstack_size
+
+        if isinstance(self.memory, FlatMemory):
+            self.memory.add_region('rootstack', rs_begin, rootstack_size)
+
+        self.gc = CheneyCollector(self.memory, self.layout, heap_size)
+
+        self.global_vals = { **self.global_vals,
+            'rootstack_begin': rs_begin,
+            'rootstack_end': rs_end,
+            'free_ptr': self.gc.free_ptr,
+            'fromspace_begin': self.gc.fromspace_begin,
+            'fromspace_end': self.gc.fromspace_end
+        }
+
+        if self.logging:
+            print(self.print_state())
+
+    def call_collect(self):
+        rootstack_ptr = self.regs[RDI]
+        needed = self.regs[RSI]
+        self.log(f'CALL TO collect: rootstack pointer {rootstack_ptr}, need {needed} bytes')
+
+        if self.gc is None:
+            raise RuntimeError('collect called before initialize')
+
+        rs_begin = self.global_vals['rootstack_begin']
+        rs_end = self.global_vals['rootstack_end']
+        if not isinstance(rootstack_ptr, int) or not rs_begin <= rootstack_ptr <= rs_end:
+            raise RuntimeError(f'collect: %rdi should hold the root stack pointer, '
+                               f'but it is {rootstack_ptr}')
+
+        self.gc.free_ptr = self.global_vals['free_ptr']
+        self.gc.collect(rs_begin, rootstack_ptr, needed)
+
+        self.global_vals['free_ptr'] = self.gc.free_ptr
+        self.global_vals['fromspace_begin'] = self.gc.fromspace_begin
+        self.global_vals['fromspace_end'] = self.gc.fromspace_end
+
+        self.log(f'GC STATS: {self.gc.stats}')
+        if self.logging:
+            print(self.print_state())
 
+    def gc_stats(self) -> GCStats:
+        """
+        Returns statistics about the garbage collections performed so far.
+        """
+        return self.gc.stats if self.gc else GCStats()
+
+
+binops = {
+    ADDQ: lambda v1, v2: v1 + v2,
+    SUBQ: lambda v1, v2: v2 - v1,
+    IMULQ: lambda v1, v2: v2 * v1,
+    ANDQ: lambda v1, v2: v1 and v2,
+    ORQ: lambda v1, v2: v1 or v2,
+    XORQ: lambda v1, v2: v1 ^ v2,
+    SALQ: lambda v1, v2: v2 << v1,
+    SARQ: lambda v1, v2: v2 >> v1,
+}
+
+handlers = {
+    PUSHQ: X86Emulator.exec_pushq,
+    POPQ: X86Emulator.exec_popq,
+    MOVQ: X86Emulator.exec_movq,
+    MOVZBQ: X86Emulator.exec_movq,
+    NEGQ: X86Emulator.exec_negq,
+    CMPQ: X86Emulator.exec_cmpq,
+    LEAQ: X86Emulator.exec_leaq,
+    JMP: X86Emulator.exec_jmp,
+    JCC: X86Emulator.exec_jcc,
+    SETCC: X86Emulator.exec_setcc,
+    CALLQ: X86Emulator.exec_callq,
+    INDIRECT_CALLQ: X86Emulator.exec_indirect_callq,
+    INDIRECT_JMP: X86Emulator.exec_indirect_jmp,
+    RETQ: X86Emulator.exec_retq,
+    **{op: X86Emulator.exec_binop for op in binops}
+}
 
 
 prog1 = """
@@ -526,6 +748,6 @@ if __name__ == "__main__":
         emu = X86Emulator(logging=True)
         emu.eval_program(prog)
 
-    emu = X86Emulator(logging=False)
+    emu = X86Emulator(logging=False, memory='dict')
     for i in instrs:
         print(emu.eval_instructions(i))
@@ -0,0 +1,157 @@
+from typing import Dict, Hashable, Iterable, Iterator, List, Set
+
+from .python import print_ast
+
+def iter_bits(bits: int) -> Iterator[int]:
+    """
+    Yields the positions of the set bits of a non-negative integer, lowest first.
+    """
+    # scanning the binary string is linear in the size of the bitset;
+    # clearing the lowest bit one at a time would copy the integer each time
+    s = bin(bits)[:1:-1]
+    i = s.find('1')
+    while i >= 0:
+        yield i
+        i = s.find('1', i + 1)
+
+class BitsetInterferenceGraph:
+    """
+    An interference graph with the same interface as the InterferenceGraph
+    class in each assignment, for graphs with many nodes. Nodes (variables
+    and registers) are interned to integer ids, and the neighbors of each
+    node are stored as a bitset in a Python int, so adding an edge is two
+    bit operations and degree queries do not build any sets.
+
+    To use it in an assignment, replace the import in compiler.py with:
+
+        from cs3020_support.interference_graph import BitsetInterferenceGraph as InterferenceGraph
+    """
+    ids: Dict[Hashable, int]
+    nodes: List[Hashable]     # indexed by id; None for nodes removed by merge
+    adjacency: List[int]
+
+    def __init__(self):
+        self.ids = {}
+        self.nodes = []
+        self.adjacency = []
+
+    def node_id(self, a) -> int:
+        """
+        Returns the integer id of a node, adding the node if it is new.
+        """
+        i = self.ids.get(a)
+        if i is None:
+            i = len(self.nodes)
+            self.ids[a] = i
+            self.nodes.append(a)
+            self.adjacency.append(0)
+        return i
+
+    def add_node(self, a):
+        self.node_id(a)
+
+    def add_edge(self, a, b):
+        if a != b:
+            i, j = self.node_id(a), self.node_id(b)
+            self.adjacency[i] |= 1 << j
+            self.adjacency[j] |= 1 << i
+
+    def add_interference(self, written: Iterable, live: Iterable):
+        """
+        Adds an edge between each written location and each live location
+        (other than itself). This is the bulk form of the usual rule for
+        building the graph: for an instruction that writes w, add an edge
+        between w and every variable live after the instruction.
+        :param written: The locations written by an instruction.
+        :param live: The locations live after the instruction.
+        """
+        live_ids = [self.node_id(v) for v in live]
+        live_bits = 0
+        for j in live_ids:
+            live_bits |= 1 << j
+
+        adjacency = self.adjacency
+        for w in written:
+            i = self.node_id(w)
+            bit = 1 << i
+            mask = live_bits & ~bit
+            if mask:
+                adjacency[i] |= mask
+                for j in live_ids:
+                    if j != i:
+                        adjacency[j] |= bit
+
+    def add_clique(self, nodes: Iterable):
+        """
+        Adds an edge between every pair of distinct nodes.
+        """
+        ids = [self.node_id(a) for a in nodes]
+        bits = 0
+        for i in ids:
+            bits |= 1 << i
+        for i in ids:
+            self.adjacency[i] |= bits & ~(1 << i)
+
+    def merge(self, a, b):
+        """
+        Merges node b into node a (coalescing them): a gets all of b's
+        neighbors, and b is removed from the graph.
+        """
+        i, j = self.node_id(a), self.node_id(b)
+        bit_i, bit_j = 1 << i, 1 << j
+        adjacency = self.adjacency
+        for k in iter_bits(adjacency[j]):
+            adjacency[k] = (adjacency[k] & ~bit_j) | bit_i
+        adjacency[i] = (adjacency[i] | adjacency[j]) & ~bit_i & ~bit_j
+        adjacency[j] = 0
+        del self.ids[b]
+        self.nodes[j] = None
+
+    def neighbors(self, a) -> Set:
+        i = self.ids.get(a)
+        if i is None:
+            return set()
+        nodes = self.nodes
+        return {nodes[j] for j in iter_bits(self.adjacency[i])}
+
+    def neighbor_bits(self, a) -> int:
+        """
+        Returns the neighbors of a node as a bitset of node ids.
+        """
+        i = self.ids.get(a)
+        return 0 if i is None else self.adjacency[i]
+
+    def interferes(self, a, b) -> bool:
+        i = self.ids.get(a)
+        j = self.ids.get(b)
+        return i is not None and j is not None and bool(self.adjacency[i] >> j & 1)
+
+    def degree(self, a) -> int:
+        return self.neighbor_bits(a).bit_count()
+
+    def degrees(self) -> Dict:
+        """
+        Returns a dictionary mapping each node to its degree.
+        """
+        return {a: bits.bit_count() for a, bits in zip(self.nodes, self.adjacency)
+                if a is not None}
+
+    def get_nodes(self) -> Set:
+        return set(self.ids)
+
+    def num_edges(self) -> int:
+        return sum(bits.bit_count() for bits in self.adjacency) // 2
+
+    def edges(self) -> Iterator:
+        """
+        Yields each edge once, as a pair of nodes.
+        """
+        nodes = self.nodes
+        for i, bits in enumerate(self.adjacency):
+            # only report each edge from its lower-numbered end
+            for j in iter_bits(bits >> (i + 1)):
+                yield nodes[i], nodes[i + 1 + j]
+
+    def __str__(self):
+        strings = [print_ast(a) + ' -- ' + print_ast(b) for a, b in self.edges()]
+        return 'InterferenceGraph{\n ' + ',\n '.join(strings) + '\n}'
@@ -0,0 +1,82 @@
+import time
+from ast import unparse
+from dataclasses import dataclass
+from typing import Optional
+
+# ==================================================
+# Execution limits
+# ==================================================
+# A wrong jump condition or loop test can make a compiled program, or a
+# test program, run forever. Both the emulator (X86Emulator) and the
+# reference interpreters take an optional ExecutionLimits: a budget of
+# steps (instructions executed, or statements executed by an interpreter)
+# and a wall-clock limit. When either is exceeded, they raise
+# ExecutionLimitExceeded, which says where the program was.
+#
+# The clock is only read every CHECK_INTERVAL steps, so limits cost little
+# more than counting; a time limit can be overshot by that many steps.
+
+CHECK_INTERVAL = 4096
+
+@dataclass
+class ExecutionLimits:
+    max_steps: Optional[int] = None    # None for no budget
+    seconds: Optional[float] = None    # None for no time limit
+
+class ExecutionLimitExceeded(RuntimeError):
+    """
+    Raised when a program runs out of steps or time.
+    """
+    def __init__(self, reason: str, steps: int, seconds: float, location: str,
+                 pc: Optional[int] = None, lineno: Optional[int] = None):
+        """
+        :param reason: 'steps' or 'time'.
+        :param steps: The steps executed so far.
+        :param seconds: The time spent so far.
+        :param location: Where the program was, in words.
+        :param pc: For the emulator, the index of the next instruction.
+        :param lineno: For an interpreter, the line of the next statement.
+        """
+        self.reason = reason
+        self.steps = steps
+        self.seconds = seconds
+        self.location = location
+        self.pc = pc
+        self.lineno = lineno
+        super().__init__(f'{reason} limit exceeded after {steps} steps '
+                         f'({seconds:.2f} s), at {location}')
+
+class StepGuard:
+    """
+    Enforces ExecutionLimits in an interpreter, which calls step before
+    executing each statement.
+    """
+    def __init__(self, limits: ExecutionLimits):
+        self.limits = limits
+        self.steps = 0
+        self.start = time.monotonic()
+        self.next_check = CHECK_INTERVAL
+        if limits.max_steps is not None:
+            self.next_check = min(self.next_check, limits.max_steps)
+
+    def step(self, stmt):
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.check(stmt)
+
+    def check(self, stmt):
+        limits = self.limits
+        seconds = time.monotonic() - self.start
+        reason = None
+        if limits.max_steps is not None and self.steps > limits.max_steps:
+            reason = 'steps'
+        elif limits.seconds is not None and seconds > limits.seconds:
+            reason = 'time'
+        if reason is not None:
+            lineno = getattr(stmt, 'lineno', None)
+            text = unparse(stmt).splitlines()[0]
+            raise ExecutionLimitExceeded(reason, self.steps - 1, seconds,
+                                         f'line {lineno}: {text}', lineno=lineno)
+        self.next_check = self.steps + CHECK_INTERVAL
+        if limits.max_steps is not None:
+            self.next_check = min(self.next_check, limits.max_steps + 1)
@@ -0,0 +1,354 @@
+import sys
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from .interference_graph import iter_bits
+
+# ==================================================
+# Reads and writes of x86 instructions
+# ==================================================
+# Each assignment has its own copy of x86.py, so instructions and arguments
+# are recognized by class name. The locations tracked are variables and
+# registers; a byte register (%al) counts as its full register (%rax).
+
+CALLER_SAVED_REGISTERS = ['rax', 'rdx', 'rcx', 'rsi', 'rdi', 'r8', 'r9', 'r10', 'r11']
+ARGUMENT_REGISTERS = ['rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9']
+
+# Number of arguments of the runtime functions, so that callq reads the
+# registers holding them
+RUNTIME_ARITY = {'print_int': 1, 'initialize': 2, 'collect': 2}
+
+BYTE_REGISTERS = {'al': 'rax'}
+
+TWO_ARG_UPDATES = {'Addq', 'Subq', 'Imulq', 'Andq', 'Orq', 'Xorq'}
+TWO_ARG_MOVES = {'Movq', 'Movzbq', 'Leaq'}
+
+def make_reg(a, name: str):
+    # builds a Reg from the same x86 module as the argument a
+    return sys.modules[type(a).__module__].Reg(name)
+
+def arg_reads(a) -> List:
+    """
+    Returns the locations read when evaluating an argument.
+    """
+    match type(a).__name__:
+        case 'Var' | 'VecVar' | 'Reg':
+            return [a]
+        case 'ByteReg':
+            return [make_reg(a, BYTE_REGISTERS.get(a.val, a.val))]
+        case 'Deref':
+            return [make_reg(a, a.reg)]
+        case _:
+            return []
+
+def arg_writes(a) -> Tuple[List, List]:
+    """
+    Returns the locations (written, read) when storing to an argument.
+    Storing to memory reads the address register.
+    """
+    match type(a).__name__:
+        case 'Var' | 'VecVar' | 'Reg':
+            return [a], []
+        case 'ByteReg':
+            return [make_reg(a, BYTE_REGISTERS.get(a.val, a.val))], []
+        case 'Deref':
+            return [], [make_reg(a, a.reg)]
+        case _:
+            return [], []
+
+def reads_writes(i, caller_saved=CALLER_SAVED_REGISTERS) -> Tuple[List, List]:
+    """
+    Returns the locations read and written by a (non-jump) instruction.
+    :param i: An x86 instruction.
+    :param caller_saved: Names of the registers a call may overwrite.
+    :return: A pair (reads, writes).
+    """
+    name = type(i).__name__
+    if name in TWO_ARG_UPDATES:
+        w, r = arg_writes(i.a2)
+        return arg_reads(i.a1) + arg_reads(i.a2) + r, w
+    elif name in TWO_ARG_MOVES:
+        w, r = arg_writes(i.a2)
+        return arg_reads(i.a1) + r, w
+    elif name == 'Cmpq':
+        return arg_reads(i.a1) + arg_reads(i.a2), []
+    elif name == 'Pushq':
+        return arg_reads(i.a1), []
+    elif name in ('Popq', 'Set'):
+        w, r = arg_writes(i.a1 if name == 'Popq' else i.e1)
+        return r, w
+    elif name == 'Callq':
+        n = RUNTIME_ARITY.get(i.label, 0)
+        return ([make_reg(i, r) for r in ARGUMENT_REGISTERS[:n]],
+                [make_reg(i, r) for r in caller_saved])
+    elif name in ('IndirectCallq', 'TailJmp'):
+        reads = arg_reads(i.e1) + [make_reg(i, r) for r in ARGUMENT_REGISTERS[:i.num_args]]
+        writes = [make_reg(i, r) for r in caller_saved] if name == 'IndirectCallq' else []
+        return reads, writes
+    elif name == 'IndirectJmp':
+        # a tail call after prelude & conclusion; the arguments are in registers
+        return arg_reads(i.e1) + [make_reg(i, r) for r in ARGUMENT_REGISTERS], []
+    elif name in ('Retq', 'Jmp', 'JmpIf'):
+        return [], []
+    else:
+        raise RuntimeError(f'reads_writes: unknown instruction {i}')
+
+# ==================================================
+# Liveness analysis
+# ==================================================
+
+class Liveness:
+    """
+    Liveness analysis over a program's blocks (a Dict[str, List[x86.Instr]]),
+    solved with a worklist.
+
+    Locations are interned to integer ids, and sets of locations are stored
+    as bitsets in Python ints. Each block is summarized once by:
+      - gen: the locations it reads before writing them, and
+      - for each jump (Jmp or JmpIf) in it, the target label and the
+        locations written before the jump (kill).
+    so that live_before(block) = gen | OR of (live_before(target) & ~kill).
+    Solving then never needs to look at individual instructions.
+
+    Labels that are not blocks of the program (e.g. "conclusion", before
+    prelude & conclusion runs) are live_at_exit, which defaults to nothing.
+    When a block changes, update_block re-solves only the blocks that can
+    reach it.
+    """
+
+    def __init__(self, blocks: Dict[str, List], live_at_exit: Optional[Dict[str, Iterable]] = None,
+                 caller_saved=CALLER_SAVED_REGISTERS):
+        """
+        :param blocks: The program's blocks.
+        :param live_at_exit: For labels outside the program, the locations
+        live when jumping to them.
+        :param caller_saved: Names of the registers a call may overwrite.
+        """
+        self.caller_saved = caller_saved
+        self.ids: Dict[Hashable, int] = {}
+        self.locations: List[Hashable] = []
+
+        self.blocks: Dict[str, List] = {}
+        # per block: the reads and writes of each instruction, as bitsets
+        self.instr_bits: Dict[str, List[Tuple[int, int]]] = {}
+        self.gen: Dict[str, int] = {}
+        self.jumps: Dict[str, List[Tuple[str, int]]] = {}
+        self.predecessors: Dict[str, Set[str]] = {}
+        self.live_in: Dict[str, int] = {}
+        self.live_after_cache: Dict[str, List[Set]] = {}
+        self.exit_live = {label: self.bits(locs) for label, locs in (live_at_exit or {}).items()}
+
+        # number of block transfer functions evaluated, over all solves
+        self.evaluations = 0
+
+        for label, instrs in blocks.items():
+            self.summarize(label, instrs)
+        self.solve(list(self.blocks))
+
+    # ------------------------------------------------------------
+    # Location sets
+
+    def loc_id(self, a) -> int:
+        i = self.ids.get(a)
+        if i is None:
+            i = len(self.locations)
+            self.ids[a] = i
+            self.locations.append(a)
+        return i
+
+    def bits(self, locs: Iterable) -> int:
+        b = 0
+        for a in locs:
+            b |= 1 << self.loc_id(a)
+        return b
+
+    def to_set(self, bits: int) -> Set:
+        locations = self.locations
+        return {locations[i] for i in iter_bits(bits)}
+
+    # ------------------------------------------------------------
+    # Block summaries
+
+    def summarize(self, label: str, instrs: List):
+        self.blocks[label] = instrs
+        self.live_after_cache.pop(label, None)
+
+        instr_bits = []
+        gen = 0
+        kill = 0
+        jumps = []
+        reachable = True
+        for i in instrs:
+            name = type(i).__name__
+            if name in ('Jmp', 'JmpIf'):
+                instr_bits.append((0, 0))
+                if reachable:
+                    jumps.append((i.label, kill))
+                if name == 'Jmp':
+                    # instructions after an unconditional jump never run
+                    reachable = False
+            else:
+                reads, writes = reads_writes(i, self.caller_saved)
+                r, w = self.bits(reads), self.bits(writes)
+                instr_bits.append((r, w))
+                if reachable:
+                    gen |= r & ~kill
+                    kill |= w
+                    if name in ('Retq', 'TailJmp', 'IndirectJmp'):
+                        reachable = False
+
+        # unlink the old successors, then link the new ones
+        for target, _ in self.jumps.get(label, []):
+            if target in self.predecessors:
+                self.predecessors[target].discard(label)
+        self.instr_bits[label] = instr_bits
+        self.gen[label] = gen
+        self.jumps[label] = jumps
+        self.predecessors.setdefault(label, set())
+        for target, _ in jumps:
+            self.predecessors.setdefault(target, set()).add(label)
+
+    def target_live(self, target: str) -> int:
+        """
+        Returns the locations live when jumping to a label, as a bitset.
+        """
+        if target in self.blocks:
+            return self.live_in.get(target, 0)
+        return self.exit_live.get(target, 0)
+
+    def transfer(self, label: str) -> int:
+        self.evaluations += 1
+        live = self.gen[label]
+        for target, kill in self.jumps[label]:
+            live |= self.target_live(target) & ~kill
+        return live
+
+    # ------------------------------------------------------------
+    # Solving
+
+    def postorder(self, labels: Iterable[str]) -> List[str]:
+        """
+        Orders the given blocks so that, ignoring back edges, each block
+        comes after its successors. This lets a backward analysis converge
+        in as few passes as possible.
+        """
+        wanted = set(labels)
+        order = []
+        visited = set()
+        for root in labels:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self.jumps[root]))]
+            while stack:
+                label, succs = stack[-1]
+                for target, _ in succs:
+                    if target in wanted and target not in visited:
+                        visited.add(target)
+                        stack.append((target, iter(self.jumps[target])))
+                        break
+                else:
+                    stack.pop()
+                    order.append(label)
+        return order
+
+    def solve(self, labels: List[str]):
+        """
+        Recomputes live_in for the given blocks (assuming every other
+        block's live_in is already correct), iterating to a fixpoint.
+        """
+        for label in labels:
+            self.live_in[label] = 0
+            self.live_after_cache.pop(label, None)
+
+        worklist = self.postorder(labels)
+        pending = set(worklist)
+        index = 0
+        while index < len(worklist):
+            label = worklist[index]
+            index += 1
+            pending.discard(label)
+
+            new = self.transfer(label)
+            if new != self.live_in[label]:
+                self.live_in[label] = new
+                self.live_after_cache.pop(label, None)
+                for p in self.predecessors.get(label, ()):
+                    if p in self.blocks and p not in pending:
+                        pending.add(p)
+                        worklist.append(p)
+
+    def reaching(self, label: str) -> List[str]:
+        """
+        Returns the blocks that can reach the given block (including itself).
+        """
+        seen = {label}
+        stack = [label]
+        while stack:
+            for p in self.predecessors.get(stack.pop(), ()):
+                if p not in seen and p in self.blocks:
+                    seen.add(p)
+                    stack.append(p)
+        return [l for l in self.blocks if l in seen]
+
+    def update_block(self, label: str, instrs: List):
+        """
+        Replaces (or adds) one block, and re-analyzes the blocks whose
+        liveness may have changed: those that can reach it.
+        """
+        self.summarize(label, instrs)
+        self.solve(self.reaching(label))
+
+    def remove_block(self, label: str):
+        affected = [l for l in self.reaching(label) if l != label]
+        for target, _ in self.jumps.pop(label, []):
+            if target in self.predecessors:
+                self.predecessors[target].discard(label)
+        for d in (self.blocks, self.instr_bits, self.gen, self.live_in, self.live_after_cache):
+            d.pop(label, None)
+        self.solve(affected)
+
+    # ------------------------------------------------------------
+    # Results
+
+    def live_before_block(self, label: str) -> Set:
+        return self.to_set(self.live_in[label])
+
+    def live_after_bits(self, label: str) -> List[int]:
+        """
+        Returns the live-after set of each instruction in a block, as bitsets.
+        """
+        live = 0
+        result = []
+        for i, (r, w) in zip(reversed(self.blocks[label]), reversed(self.instr_bits[label])):
+            result.append(live)
+            name = type(i).__name__
+            if name in ('Jmp', 'JmpIf'):
+                target_live = self.target_live(i.label)
+                live = target_live if name == 'Jmp' else live | target_live
+            else:
+                live = (live & ~w) | r
+        result.reverse()
+        return result
+
+    def live_after(self, label: str) -> List[Set]:
+        """
+        Returns the live-after set of each instruction in a block.
+        """
+        if label not in self.live_after_cache:
+            self.live_after_cache[label] = [self.to_set(b) for b in self.live_after_bits(label)]
+        return self.live_after_cache[label]
+
+    def live_after_sets(self) -> Dict[str, List[Set]]:
+        return {label: self.live_after(label) for label in self.blocks}
+
+def live_after_sets(blocks: Dict[str, List], live_at_exit: Optional[Dict[str, Iterable]] = None,
+                    caller_saved=CALLER_SAVED_REGISTERS) -> Dict[str, List[Set]]:
+    """
+    Computes the live-after set of every instruction in a program.
+    :param blocks: The program's blocks.
+    :param live_at_exit: For labels outside the program (e.g. "conclusion"),
+    the locations live when jumping to them.
+    :param caller_saved: Names of the registers a call may overwrite.
+    :return: For each block, a list with the live-after set of each instruction.
+    """
+    return Liveness(blocks, live_at_exit, caller_saved).live_after_sets()
@@ -1,6 +1,10 @@
 from lark import Lark
 
-x86_parser = Lark(r"""
+# A single grammar serves both whole programs ("prog", a list of labeled
+# blocks) and bare instruction sequences ("instrs"). With cache=True, Lark
+# saves the generated LALR tables in the system temp directory, keyed by a
+# hash of the grammar, so later imports load them instead of rebuilding.
+x86_lark = Lark(r"""
     ?instr: "movq" arg "," arg -> movq
           | "addq" arg "," arg -> addq
           | "imulq" arg "," arg -> imulq
@@ -52,65 +56,24 @@ x86_parser = Lark(r"""
          | "al" | "rip"
 
     prog: block*
+    instrs: instr*
 
     %import common.NUMBER
     %import common.CNAME
 
     %import common.WS
     %ignore WS
-    """, start='prog', parser='lalr')
+    """, start=['prog', 'instrs'], parser='lalr', cache=True)
 
-x86_parser_instrs = Lark(r"""
-    ?instr: "movq" arg "," arg -> movq
-          | "addq" arg "," arg -> addq
-          | "imulq" arg "," arg -> imulq
-          | "andq" arg "," arg -> andq
-          | "orq" arg "," arg -> orq
-          | "subq" arg "," arg -> subq
-          | "cmpq" arg "," arg -> cmpq
-          | "xorq" arg "," arg -> xorq
-          | "leaq" arg "," arg -> leaq
-          | "negq" arg -> negq
-          | "jmp" CNAME -> jmp
-          | "jmp" "*" arg -> indirect_jmp
-          | "je" CNAME -> je
-          | "jl" CNAME -> jl
-          | "jle" CNAME -> jle
-          | "jg" CNAME -> jg
-          | "jge" CNAME -> jge
-          | "sete" arg -> sete
-          | "setl" arg -> setl
-          | "setle" arg -> setle
-          | "setg" arg -> setg
-          | "setge" arg -> setge
-          | "movzbq" arg "," arg -> movzbq
-          | "xorq" arg "," arg -> xorq
-          | "callq" CNAME -> callq
-          | "callq" "*" arg -> indirect_callq
-          | "pushq" arg -> pushq
-          | "popq" arg -> popq
-          | "retq" -> retq
-
-    instrs: instr*
-
-    ?arg: "$" atom -> int_a
-        | "%" reg -> reg_a
-        | "#" CNAME -> var_a
-        | "(" "%" reg ")" -> direct_mem_a
-        | atom "(" "%" reg ")" -> mem_a
-        | CNAME "(" "%" reg ")" -> global_val_a
+class X86Parser:
+    """
+    Parses x86 text starting from one of the grammar's start symbols.
+    """
+    def __init__(self, start: str):
+        self.start = start
 
-    ?atom: NUMBER -> int_a
-         | "-" atom  -> neg_a
-
-    !?reg: "rsp" | "rbp" | "rax" | "rbx" | "rcx" | "rdx" | "rsi" | "rdi" 
-         | "r8" | "r9" | "r10" | "r11" | "r12" | "r13" | "r14" | "r15"
-         | "al" | "rip"
-
-    %import common.NUMBER
-    %import common.CNAME
-
-    %import common.WS
-    %ignore WS
-    """, start='instrs', parser='lalr')
+    def parse(self, s: str):
+        return x86_lark.parse(s, start=self.start)
 
+x86_parser = X86Parser('prog')
+x86_parser_instrs = X86Parser('instrs')
@@ -0,0 +1,237 @@
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional
+
+# ==================================================
+# Peephole optimization
+# ==================================================
+# A table-driven peephole pass over x86 programs (X86Program, or
+# X86ProgramDefs with one X86FunctionDef per function), meant to run after
+# prelude & conclusion, just before the program is printed:
+#
+#     compiler_passes = {
+#         ...
+#         'prelude & conclusion': prelude_and_conclusion,
+#         'peephole': PeepholeOptimizer(),
+#         'print x86': x86.print_x86
+#     }
+#
+# Each rule matches a window of consecutive instructions in a block and
+# returns the instructions to put in its place. Each assignment has its own
+# copy of x86.py, so instructions are recognized by class name, and new
+# ones are built from the classes of the instructions they replace.
+#
+# Removing a jump to the next block relies on the blocks being laid out in
+# order, so no pass that reorders blocks may run after this one.
+
+@dataclass
+class Context:
+    block: List              # the instructions of the block
+    index: int               # the position of the window in the block
+    next_label: Optional[str]  # the label of the block laid out next, if any
+    blocks: Optional[Dict[str, List]] = None  # every block of the function, if known
+
+@dataclass
+class Rule:
+    name: str
+    size: int                # the number of instructions matched
+    rewrite: Callable[[List, Context], Optional[List]]  # None if no match
+
+def kind(x) -> str:
+    return type(x).__name__
+
+def is_imm(a, value: int) -> bool:
+    return kind(a) == 'Immediate' and a.val == value
+
+def mentions_register(a, reg: str) -> bool:
+    # whether an argument is a register, or a memory reference using it
+    match kind(a):
+        case 'Reg' | 'ByteReg':
+            return a.val == reg
+        case 'Deref':
+            return a.reg == reg
+        case _:
+            return False
+
+FLAG_SETTERS = {'Addq', 'Subq', 'Imulq', 'Cmpq', 'Andq', 'Orq', 'Xorq'}
+
+def flags_dead_after(block: List, index: int) -> bool:
+    """
+    Whether the flags set by the instruction at index are overwritten
+    before any instruction in the block reads them. Calls and returns
+    clobber the flags; at a jump or the end of the block, the flags are
+    assumed to be live.
+    """
+    for i in block[index + 1:]:
+        k = kind(i)
+        if k in ('JmpIf', 'Set'):
+            return False
+        if k in FLAG_SETTERS or k in ('Callq', 'IndirectCallq', 'Retq', 'TailJmp', 'IndirectJmp'):
+            return True
+        if k == 'Jmp':
+            return False
+    return False
+
+def flags_read_at(blocks: Optional[Dict[str, List]], label: str) -> bool:
+    """
+    Whether the flags may be read after jumping to label, before an
+    instruction sets them: by a jcc or set<cc> in the block, or in the
+    blocks it jumps to. Labels outside blocks (or any label, if blocks is
+    None) are assumed to read them.
+    """
+    seen = set()
+    while blocks is not None and label in blocks and label not in seen:
+        seen.add(label)
+        for i in blocks[label]:
+            k = kind(i)
+            if k in ('JmpIf', 'Set'):
+                return True
+            if k in FLAG_SETTERS or k in ('Callq', 'IndirectCallq', 'Retq', 'TailJmp', 'IndirectJmp'):
+                return False
+            if k == 'Jmp':
+                label = i.label
+                break
+        else:
+            # falls off the end of the block without reading them
+            return False
+    # a label outside blocks reads them; a cycle of jumps does not
+    return label not in seen
+
+# ------------------------------------------------------------
+# Rules
+
+def self_move(w: List, ctx: Context) -> Optional[List]:
+    # movq a, a
+    i, = w
+    if kind(i) == 'Movq' and i.a1 == i.a2:
+        return []
+
+def useless_arith(w: List, ctx: Context) -> Optional[List]:
+    # addq $0, a / subq $0, a / imulq $1, a, when the flags are not used
+    i, = w
+    if ((kind(i) in ('Addq', 'Subq') and is_imm(i.a1, 0))
+            or (kind(i) == 'Imulq' and is_imm(i.a1, 1))):
+        if flags_dead_after(ctx.block, ctx.index):
+            return []
+
+def move_back(w: List, ctx: Context) -> Optional[List]:
+    # movq a, b; movq b, a: the second move copies back the value just copied
+    i, j = w
+    if kind(i) == 'Movq' and kind(j) == 'Movq' and i.a1 == j.a2 and i.a2 == j.a1:
+        a, b = i.a1, i.a2
+        # an address computed from the overwritten register changes meaning
+        if not (kind(a) == 'Deref' and mentions_register(b, a.reg)) and \
+                not (kind(b) == 'Deref' and mentions_register(a, b.reg)):
+            return [i]
+
+def jump_to_next(w: List, ctx: Context) -> Optional[List]:
+    # jmp L at the end of a block that is followed by block L
+    i, = w
+    if kind(i) == 'Jmp' and ctx.index == len(ctx.block) - 1 and i.label == ctx.next_label:
+        return []
+
+def jump_over_jump(w: List, ctx: Context) -> Optional[List]:
+    # jcc L1; jmp L2, where L1 is the next block: jump only when not cc
+    # (only for the conditions whose negation can be printed)
+    i, j = w
+    negated = {'l': 'ge', 'ge': 'l', 'le': 'g', 'g': 'le'}
+    if kind(i) == 'JmpIf' and kind(j) == 'Jmp' and i.cc in negated and \
+            ctx.index + 1 == len(ctx.block) - 1 and i.label == ctx.next_label:
+        return [replace(i, cc=negated[i.cc], label=j.label)]
+
+def compare_bool(w: List, ctx: Context) -> Optional[List]:
+    # set<cc> %al; movzbq %al, x; cmpq $0, x; je L1; jmp L2, from lowering
+    # "if x" where x = a comparison: the flags of the original comparison
+    # are still set, so jump on them directly (x stays assigned). L1 and L2
+    # then start with other flags than those of cmpq $0, x, so neither may
+    # read the flags before setting them.
+    s, m, c, je, jmp = w
+    if kind(s) == 'Set' and kind(m) == 'Movzbq' and kind(c) == 'Cmpq' and \
+            kind(je) == 'JmpIf' and kind(jmp) == 'Jmp' and je.cc == 'e' and \
+            m.a1 == s.e1 and c.a2 == m.a2 and (is_imm(c.a1, 0) or is_imm(c.a1, 1)) and \
+            not flags_read_at(ctx.blocks, je.label) and not flags_read_at(ctx.blocks, jmp.label):
+        if is_imm(c.a1, 0):
+            # x == 0 exactly when cc was false
+            return [s, m, replace(je, cc=s.cc, label=jmp.label), replace(jmp, label=je.label)]
+        else:
+            return [s, m, replace(je, cc=s.cc), jmp]
+
+DEFAULT_RULES = [
+    Rule('self move', 1, self_move),
+    Rule('useless arithmetic', 1, useless_arith),
+    Rule('move back', 2, move_back),
+    Rule('compare bool', 5, compare_bool),
+    Rule('jump over jump', 2, jump_over_jump),
+    Rule('jump to next block', 1, jump_to_next),
+]
+
+# ------------------------------------------------------------
+# The pass
+
+class PeepholeOptimizer:
+    """
+    Applies a table of rules until none matches. Callable as a compiler
+    pass; hits counts how many times each rule was applied, over every
+    program optimized by this object.
+    """
+    rules: List[Rule]
+    hits: Dict[str, int]
+
+    def __init__(self, rules: Optional[List[Rule]] = None):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.hits = {r.name: 0 for r in self.rules}
+        self.max_size = max((r.size for r in self.rules), default=1)
+
+    def __call__(self, program):
+        return self.optimize_program(program)
+
+    def optimize_program(self, program):
+        """
+        Optimizes every block of an X86Program or X86ProgramDefs.
+        """
+        match kind(program):
+            case 'X86Program':
+                return replace(program, blocks=self.optimize_blocks(program.blocks))
+            case 'X86ProgramDefs':
+                return replace(program, defs=[replace(d, blocks=self.optimize_blocks(d.blocks))
+                                              for d in program.defs])
+            case _:
+                raise Exception('peephole: unknown program', program)
+
+    def optimize_blocks(self, blocks: Dict[str, List]) -> Dict[str, List]:
+        labels = list(blocks)
+        next_labels = dict(zip(labels, labels[1:] + [None]))
+        return {label: self.optimize_block(instrs, next_labels[label], blocks)
+                for label, instrs in blocks.items()}
+
+    def optimize_block(self, instrs: List, next_label: Optional[str] = None,
+                       blocks: Optional[Dict[str, List]] = None) -> List:
+        """
+        Optimizes one block.
+        :param instrs: The block's instructions.
+        :param next_label: The label of the block laid out after this one.
+        :param blocks: Every block of the function, so that rules can look at
+        the targets of jumps; rules that need them do not apply without.
+        No rule makes a block read flags it did not read before, so the
+        blocks as they were before the pass will do.
+        :return: The new instructions.
+        """
+        block = list(instrs)
+        index = 0
+        while index < len(block):
+            for rule in self.rules:
+                window = block[index:index + rule.size]
+                if len(window) < rule.size:
+                    continue
+                new = rule.rewrite(window, Context(block, index, next_label, blocks))
+                if new is not None:
+                    block[index:index + rule.size] = new
+                    self.hits[rule.name] += 1
+                    # a rewrite can complete a pattern that starts earlier
+                    index = max(index - self.max_size + 1, 0)
+                    break
+            else:
+                index += 1
+        return block
+
+    def total_hits(self) -> int:
+        return sum(self.hits.values())
@@ -0,0 +1,124 @@
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict, fields, is_dataclass
+from typing import List
+
+import pandas as pd
+
+# ==================================================
+# Program size
+# ==================================================
+
+def program_size(program):
+    """
+    Measures the size of a program produced by a compiler pass. Works for
+    every intermediate language (Python ASTs, Cif and x86), and for the
+    assembly text produced by print_x86.
+    :param program: The program.
+    :return: A tuple (nodes, instrs, vars): the number of AST nodes, the
+    number of statements or instructions, and the number of distinct
+    variable names.
+    """
+    if isinstance(program, str):
+        lines = [l for l in program.splitlines() if l.strip()]
+        return 0, sum(1 for l in lines if not l.rstrip().endswith(':')), 0
+
+    nodes = 0
+    instrs = 0
+    variables = set()
+
+    # explicit stack, since generated programs can be deeply nested
+    stack = [program]
+    while stack:
+        o = stack.pop()
+        if isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif isinstance(o, dict):
+            stack.extend(o.values())
+        elif is_dataclass(o) and not isinstance(o, type):
+            nodes += 1
+            class_names = {c.__name__ for c in type(o).__mro__}
+            if 'Instr' in class_names or 'Stmt' in class_names:
+                instrs += 1
+            if 'Var' in class_names:
+                variables.add(getattr(o, 'var', None) or getattr(o, 'name', None))
+            stack.extend(getattr(o, f.name) for f in fields(o))
+
+    return nodes, instrs, len(variables)
+
+# ==================================================
+# Profiler
+# ==================================================
+
+@dataclass
+class PassProfile:
+    name: str
+    seconds: float      # wall-clock time of the pass
+    peak_bytes: int     # peak memory allocated during the pass (0 if not traced)
+    nodes: int          # AST nodes in the pass's output
+    instrs: int         # statements or instructions in the pass's output
+    vars: int           # distinct variable names in the pass's output
+
+class PassProfiler:
+    """
+    Records the cost of each compiler pass. Pass a PassProfiler to
+    run_compiler to enable it, e.g.:
+
+        profiler = PassProfiler()
+        run_compiler(program, profiler=profiler)
+        print(profiler.table())
+    """
+
+    def __init__(self, trace_memory: bool = True):
+        """
+        :param trace_memory: Measure peak allocation with tracemalloc. This
+        makes passes noticeably slower, so the times are less accurate.
+        """
+        self.trace_memory = trace_memory
+        self.passes: List[PassProfile] = []
+
+    def run_pass(self, name: str, pass_fn, program):
+        """
+        Runs one compiler pass, recording its cost.
+        :param name: The name of the pass.
+        :param pass_fn: The pass.
+        :param program: The input program.
+        :return: The output of the pass.
+        """
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+
+        start = time.perf_counter()
+        try:
+            output = pass_fn(program)
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = 0
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                peak = max(peak - baseline, 0)
+                if started_tracing:
+                    tracemalloc.stop()
+
+        nodes, instrs, variables = program_size(output)
+        self.passes.append(PassProfile(name, elapsed, peak, nodes, instrs, variables))
+        return output
+
+    def report(self) -> List[dict]:
+        """
+        Returns the recorded profile as a list of dicts, one per pass.
+        """
+        return [asdict(p) for p in self.passes]
+
+    def to_json(self) -> str:
+        return json.dumps(self.report(), indent=2)
+
+    def table(self) -> pd.DataFrame:
+        return pd.DataFrame(self.report(),
+                            columns=[f.name for f in fields(PassProfile)])
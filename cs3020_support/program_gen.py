@@ -0,0 +1,299 @@
+import argparse
+import random
+from dataclasses import dataclass, fields
+from typing import Dict, List
+
+# ==================================================
+# Synthetic benchmark programs
+# ==================================================
+# Generates random programs in the source language of each assignment,
+# with knobs that control their size. Every program terminates, only uses
+# features its assignment's interpreter supports, and keeps every value
+# well within 64 bits, so compiled and interpreted results can be compared.
+#
+# All int variables are assigned at the start of the program and their sum
+# is printed at the end, so num_vars variables are live throughout.
+
+LANGUAGES = ['Lvar', 'Lif', 'Lwhile', 'Ltup', 'Lfun']
+
+# The source language of each assignment
+ASSIGNMENT_LANGUAGES = {
+    'a2': 'Lvar',
+    'a3': 'Lvar',
+    'a4': 'Lif',
+    'a5': 'Lwhile',
+    'a6': 'Ltup',
+    'a7': 'Lfun',
+}
+
+# Values are kept below this bound, so that sums of all variables fit in 64 bits
+VALUE_LIMIT = 2**40
+# Largest constant added by a single statement
+MAX_CONST = 10
+
+@dataclass
+class ProgramShape:
+    num_vars: int = 8       # int variables, all live at the end of the program
+    length: int = 20        # simple statements in each block
+    depth: int = 1          # nesting depth of if/while statements
+    trip_count: int = 10    # iterations of each while loop (and recursion depth, in Lfun)
+    tuple_size: int = 3     # elements in each tuple (Ltup)
+    call_depth: int = 2     # length of the chain of function calls (Lfun)
+
+class ProgramGenerator:
+    def __init__(self, language: str, shape: ProgramShape, seed: int = 0):
+        assert language in LANGUAGES, f'unknown language: {language}'
+        self.language = language
+        self.shape = shape
+        self.rng = random.Random(seed)
+        self.lines = []
+        self.indent = 0
+        self.num_loops = 0
+
+        level = LANGUAGES.index(language)
+        self.has_if = level >= 1
+        self.has_while = level >= 2
+        self.has_tuples = level >= 3
+        self.has_funs = level >= 4
+
+        self.vars = [f'v{i}' for i in range(max(shape.num_vars, 1))]
+        num_tuples = max(shape.num_vars // 4, 1) if self.has_tuples else 0
+        self.tuples = [f't{i}' for i in range(num_tuples)]
+        self.pairs = [f'p{i}' for i in range(num_tuples)]
+
+        # upper bounds on the absolute value of every variable (for tuples,
+        # of their elements)
+        self.bounds: Dict[str, int] = {}
+
+    # ------------------------------------------------------------
+    # Helpers
+
+    def emit(self, line: str):
+        self.lines.append('    ' * self.indent + line)
+
+    def const(self) -> int:
+        return self.rng.randint(0, MAX_CONST)
+
+    def var(self) -> str:
+        return self.rng.choice(self.vars)
+
+    def max_bound(self) -> int:
+        return max(self.bounds.values(), default=0)
+
+    def statements_executed(self, depth: int) -> int:
+        # an upper bound on the statements executed by one run of a block
+        n = max(self.shape.length, 1) + 1
+        if depth > 0:
+            n += max(self.shape.trip_count, 1) * self.statements_executed(depth - 1) + 1
+        return n
+
+    def loop_increment(self) -> int:
+        # the most a single statement inside a loop can add to any value
+        k = MAX_CONST
+        if self.has_funs:
+            k = max(k, 2 * MAX_CONST * self.shape.call_depth, self.shape.trip_count)
+        return k
+
+    # ------------------------------------------------------------
+    # Expressions
+
+    def condition(self) -> str:
+        a, b = self.var(), self.var()
+        c = self.const()
+        return self.rng.choice([f'{a} < {b}',
+                                f'{a} == {c}',
+                                f'{a} >= {b}',
+                                f'not ({a} > {b})',
+                                f'({a} < {b}) and ({b} <= {c})',
+                                f'({a} == {b}) or ({a} > {c})'])
+
+    def assign(self, in_loop: bool):
+        """
+        Emits an assignment to an int variable. Inside loops, only forms
+        that add a bounded amount to the largest value are used.
+        """
+        x, a, b = self.var(), self.var(), self.var()
+        c = self.const()
+        bounds = self.bounds
+
+        forms = [(f'{x} = {c}', c),
+                 (f'{x} = {a}', bounds[a]),
+                 (f'{x} = {a} + {c}', bounds[a] + c)]
+        if self.has_while:
+            forms.append((f'{x} = {a} - {c}', bounds[a] + c))
+        if self.has_tuples:
+            t = self.rng.choice(self.tuples)
+            p = self.rng.choice(self.pairs)
+            j = self.rng.randrange(self.shape.tuple_size)
+            forms.append((f'{x} = {t}[{j}]', bounds[t]))
+            forms.append((f'{x} = {p}[0][{j}]', bounds[p]))
+        if self.has_funs:
+            d = self.shape.call_depth
+            forms.append((f'{x} = f0({c}, {a})', bounds[a] + d * 2 * MAX_CONST))
+            forms.append((f'{x} = rec({self.shape.trip_count}, {a})',
+                          bounds[a] + self.shape.trip_count))
+        if not in_loop:
+            forms.append((f'{x} = {a} + {b}', bounds[a] + bounds[b]))
+            if self.has_tuples:
+                forms.append((f'{x} = {p}[0][{j}] + {p}[1]', 2 * bounds[p]))
+            if self.has_if:
+                forms.append((f'{x} = {a} * {c}', bounds[a] * c))
+
+        line, bound = self.rng.choice(forms)
+        if bound >= VALUE_LIMIT:
+            line, bound = f'{x} = {c}', c
+        self.emit(line)
+        self.bounds[x] = bound
+
+    def assign_tuple(self):
+        elems = [self.var() for _ in range(self.shape.tuple_size)]
+        if self.rng.random() < 0.5:
+            t = self.rng.choice(self.tuples)
+            self.emit(f'{t} = ({", ".join(elems)},)' if len(elems) == 1
+                      else f'{t} = ({", ".join(elems)})')
+            self.bounds[t] = max(self.bounds[e] for e in elems)
+        else:
+            p = self.rng.choice(self.pairs)
+            t = self.rng.choice(self.tuples)
+            self.emit(f'{p} = ({t}, {elems[0]})')
+            self.bounds[p] = max(self.bounds[t], self.bounds[elems[0]])
+
+    # ------------------------------------------------------------
+    # Statements
+
+    def block(self, depth: int, iterations: int):
+        """
+        Emits a block of shape.length simple statements, plus one nested
+        if or while statement if depth > 0.
+        :param depth: The remaining nesting depth.
+        :param iterations: How many times the block runs (1 outside loops).
+        """
+        in_loop = iterations > 1
+        n = max(self.shape.length, 1)
+        nested_at = self.rng.randrange(n) if depth > 0 else -1
+
+        for i in range(n):
+            if i == nested_at:
+                self.nested(depth, iterations)
+
+            r = self.rng.random()
+            if self.has_tuples and r < 0.2:
+                self.assign_tuple()
+            elif not in_loop and r > 0.9:
+                self.emit(f'print({self.var()})')
+            else:
+                self.assign(in_loop)
+
+    def nested(self, depth: int, iterations: int):
+        # In the Lfun interpreter, an if statement returns from the
+        # enclosing block, so Lfun programs only use if in function bodies
+        kinds = []
+        if self.has_if and not self.has_funs:
+            kinds.append('if')
+        if self.has_while:
+            kinds.append('while')
+        if not kinds:
+            return
+
+        if self.rng.choice(kinds) == 'if':
+            self.emit(f'if {self.condition()}:')
+            before = dict(self.bounds)
+            self.indent += 1
+            self.block(depth - 1, iterations)
+            then_bounds = self.bounds
+            self.bounds = before
+            self.indent -= 1
+            self.emit('else:')
+            self.indent += 1
+            self.block(depth - 1, iterations)
+            self.indent -= 1
+            self.bounds = {x: max(b, then_bounds[x]) for x, b in self.bounds.items()}
+        else:
+            i = f'i{self.num_loops}'
+            self.num_loops += 1
+            total = iterations * max(self.shape.trip_count, 1)
+
+            # each statement adds at most loop_increment to the largest value
+            start_bound = self.max_bound()
+            executed = total * self.statements_executed(depth - 1)
+            end_bound = start_bound + executed * self.loop_increment()
+            assert end_bound < VALUE_LIMIT, 'loop trip counts are too large'
+
+            self.emit(f'{i} = 0')
+            self.emit(f'while {i} < {self.shape.trip_count}:')
+            self.indent += 1
+            self.block(depth - 1, total)
+            self.emit(f'{i} = {i} + 1')
+            self.indent -= 1
+            self.bounds = {x: end_bound for x in self.bounds}
+
+    def functions(self):
+        """
+        Emits the functions used by Lfun programs: a chain f0 -> f1 -> ...
+        of shape.call_depth calls, and a recursive function rec.
+        """
+        d = max(self.shape.call_depth, 1)
+        for k in range(d):
+            self.emit(f'def f{k}(n: int, x: int) -> int:')
+            self.indent += 1
+            self.emit(f'y = x + {self.const()}')
+            if k == d - 1:
+                self.emit('return y + n')
+            else:
+                self.emit(f'z = f{k + 1}(n, y)')
+                self.emit('return z + n')
+            self.indent -= 1
+            self.emit('')
+
+        self.emit('def rec(n: int, acc: int) -> int:')
+        self.indent += 1
+        self.emit('if n <= 0:')
+        self.emit('    return acc')
+        self.emit('else:')
+        self.emit('    return rec(n - 1, acc + 1)')
+        self.indent -= 1
+        self.emit('')
+
+    def program(self) -> str:
+        if self.has_funs:
+            self.functions()
+
+        for x in self.vars:
+            c = self.const()
+            self.emit(f'{x} = {c}')
+            self.bounds[x] = c
+        for t in self.tuples:
+            elems = [self.var() for _ in range(self.shape.tuple_size)]
+            self.emit(f'{t} = ({", ".join(elems)},)' if len(elems) == 1
+                      else f'{t} = ({", ".join(elems)})')
+            self.bounds[t] = max(self.bounds[e] for e in elems)
+        for p, t in zip(self.pairs, self.tuples):
+            x = self.var()
+            self.emit(f'{p} = ({t}, {x})')
+            self.bounds[p] = max(self.bounds[t], self.bounds[x])
+
+        self.block(self.shape.depth, 1)
+        self.emit(f'print({" + ".join(self.vars)})')
+        return '\n'.join(self.lines) + '\n'
+
+def generate_program(language: str, shape: ProgramShape = None, seed: int = 0) -> str:
+    """
+    Generates a random program in one of the source languages.
+    :param language: One of LANGUAGES ('Lvar', 'Lif', 'Lwhile', 'Ltup', 'Lfun').
+    :param shape: The size knobs; defaults to ProgramShape().
+    :param seed: The random seed.
+    :return: The program, as a string of Python code.
+    """
+    return ProgramGenerator(language, shape or ProgramShape(), seed).program()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a random benchmark program')
+    parser.add_argument('language', choices=LANGUAGES)
+    parser.add_argument('--seed', type=int, default=0)
+    for f in fields(ProgramShape):
+        parser.add_argument('--' + f.name.replace('_', '-'), type=int, default=f.default)
+    args = parser.parse_args()
+
+    shape = ProgramShape(**{f.name: getattr(args, f.name) for f in fields(ProgramShape)})
+    print(generate_program(args.language, shape, args.seed), end='')
@@ -0,0 +1,497 @@
+import bisect
+import heapq
+import sys
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from .coloring import (color_graph, move_related, precolor_registers, register_colors)
+from .interference_graph import BitsetInterferenceGraph, iter_bits
+from .liveness import Liveness
+
+# ==================================================
+# Register allocation strategies
+# ==================================================
+# Two ways of assigning homes to the variables of a pseudo-x86 program
+# (a Dict[str, List[x86.Instr]] of blocks, before patch instructions):
+#
+#   'coloring':    build the interference graph and color it (coloring.py)
+#   'coalescing':  the same, after conservatively coalescing moves
+#   'linear scan': allocate registers in one pass over live intervals,
+#                  without building an interference graph
+#
+# Both produce a coloring with the conventions of coloring.py: colors
+# 0..k-1 are the allocatable registers (caller-saved, then callee-saved),
+# and colors k and above are stack locations. The strategy is chosen for
+# each call of allocate_homes, so both can be compared on the same program.
+#
+# Tuple variables (VecVar) are never given registers: they are placed on
+# the root stack (%r15), where the garbage collector can find them.
+
+def is_var(a) -> bool:
+    return type(a).__name__ == 'Var'
+
+def is_vec_var(a) -> bool:
+    return type(a).__name__ == 'VecVar'
+
+# ==================================================
+# Live intervals
+# ==================================================
+
+@dataclass
+class Interval:
+    location: Hashable
+    start: int
+    end: int
+
+def live_intervals(liveness: Liveness, order: List[str]) -> Tuple[List[Interval], Dict[Hashable, List[int]]]:
+    """
+    Numbers the instructions of the program, with the blocks laid out in the
+    given order, and finds where each location is live. Instruction n reads
+    its arguments at point 2n and writes its results at point 2n+1, the
+    point of its live-after set.
+
+    A variable's interval runs from the first to the last point where it is
+    live. It is found from the variables live into each block, live when
+    each jump is taken, and read or written by each instruction, without
+    visiting the live-after set of every instruction. Intervals are
+    conservative: a variable may be dead at some points inside its interval.
+
+    Registers are often live only briefly (e.g. %rdi before a callq), so for
+    them the individual points are kept instead.
+    :param liveness: The liveness analysis of the program.
+    :param order: The labels of the blocks, in layout order.
+    :return: The intervals of the variables, sorted by start, and the
+    sorted points where each register is live.
+    """
+    locations = liveness.locations
+    registers = [j for j, a in enumerate(locations) if type(a).__name__ == 'Reg']
+    register_points: Dict[int, List[int]] = {j: [] for j in registers}
+    bounds: Dict[int, List[int]] = {}
+
+    def extend(j, point):
+        b = bounds.get(j)
+        if b is None:
+            bounds[j] = [point, point]
+        elif point < b[0]:
+            b[0] = point
+        elif point > b[1]:
+            b[1] = point
+
+    n = 0
+    for label in order:
+        instr_bits = liveness.instr_bits[label]
+        if not instr_bits:
+            continue
+        live_after = liveness.live_after_bits(label)
+        live_in = liveness.live_in[label]
+        for j in iter_bits(live_in):
+            extend(j, 2 * n)
+        for j in iter_bits(live_after[-1]):
+            extend(j, 2 * (n + len(instr_bits)) - 1)
+
+        before = live_in
+        for i, (r, w), after in zip(liveness.blocks[label], instr_bits, live_after):
+            out = after
+            if type(i).__name__ in ('Jmp', 'JmpIf'):
+                # what the target needs is live until the jump is taken; a
+                # block ending in a jump has nothing live after it, so without
+                # this a variable live around a loop would end at its last read
+                out |= liveness.target_live(i.label)
+                for j in iter_bits(out):
+                    extend(j, 2 * n + 1)
+            for j in iter_bits(r):
+                extend(j, 2 * n)
+            for j in iter_bits(w):
+                extend(j, 2 * n + 1)
+            for j in registers:
+                if (before | r) >> j & 1:
+                    register_points[j].append(2 * n)
+                if (out | w) >> j & 1:
+                    register_points[j].append(2 * n + 1)
+            before = after
+            n += 1
+
+    intervals = [Interval(locations[j], b[0], b[1]) for j, b in bounds.items()
+                 if is_var(locations[j]) or is_vec_var(locations[j])]
+    intervals.sort(key=lambda iv: (iv.start, iv.end))
+    return intervals, {locations[j]: ps for j, ps in register_points.items()}
+
+def block_order(liveness: Liveness) -> List[str]:
+    # reverse postorder: blocks mostly come after the blocks jumping to them,
+    # which keeps intervals short in straight-line and loop code
+    return list(reversed(liveness.postorder(list(liveness.blocks))))
+
+def assign_slots(intervals: Iterable[Interval]) -> Dict[Hashable, int]:
+    """
+    Gives each interval a stack slot, reusing the slots of intervals that
+    have ended. The intervals must be sorted by start.
+    :return: A dictionary mapping each location to its slot (0, 1, ...).
+    """
+    slots = {}
+    # min-heap of (end of the last interval in the slot, slot)
+    free = []
+    for iv in intervals:
+        if free and free[0][0] < iv.start:
+            _, s = heapq.heappop(free)
+        else:
+            s = len(free)
+        slots[iv.location] = s
+        heapq.heappush(free, (iv.end, s))
+    return slots
+
+# ==================================================
+# Graph coloring
+# ==================================================
+
+def build_interference(liveness: Liveness) -> BitsetInterferenceGraph:
+    """
+    Builds the interference graph of a program: each location written by an
+    instruction interferes with each location live after it, except that
+    the source of a movq does not interfere with its destination.
+    """
+    graph = BitsetInterferenceGraph()
+    locations = liveness.locations
+    for a in locations:
+        graph.add_node(a)
+
+    for label, instrs in liveness.blocks.items():
+        for i, (r, w), after in zip(instrs, liveness.instr_bits[label],
+                                    liveness.live_after_bits(label)):
+            if not w:
+                continue
+            if type(i).__name__ == 'Movq' and i.a1 in liveness.ids:
+                after &= ~(1 << liveness.ids[i.a1])
+            graph.add_interference([locations[j] for j in iter_bits(w)],
+                                   [locations[j] for j in iter_bits(after)])
+    return graph
+
+def coloring_allocation(liveness: Liveness, colors: Dict[str, int]) -> Dict[Hashable, int]:
+    """
+    Colors the variables of a program with DSatur, biased towards removing moves.
+    :param liveness: The liveness analysis of the program.
+    :param colors: The color of each register (see register_colors).
+    :return: The color of each variable and register.
+    """
+    graph = build_interference(liveness)
+    num_registers = sum(1 for c in colors.values() if c >= 0)
+    nodes = [a for a in liveness.locations if not is_vec_var(a)]
+    return color_graph(graph, nodes,
+                       precolored=precolor_registers(nodes, colors),
+                       moves=move_related(liveness.blocks),
+                       num_registers=num_registers)
+
+# ==================================================
+# Coalescing
+# ==================================================
+# Conservative coalescing merges the two ends of a movq into one node when
+# that cannot make the graph harder to color with k registers, so that they
+# get the same home and the movq becomes a self-move (removed by
+# remove_self_moves). Nodes are merged if they pass either test:
+#   - Briggs: the merged node has fewer than k neighbors of degree >= k;
+#   - George: each neighbor of one node already interferes with the other
+#     or has degree < k.
+# A variable is merged into a register only by the George test. Degrees
+# do not count the registers that are never allocated (e.g. %rax).
+
+def coalesce(graph: BitsetInterferenceGraph, moves: Dict[Hashable, set],
+             colors: Dict[str, int], num_registers: int) -> Dict[Hashable, Hashable]:
+    """
+    Coalesces move-related nodes of an interference graph, in place.
+    :param graph: The interference graph.
+    :param moves: Move-related nodes (see coloring.move_related).
+    :param colors: The color of each register (see register_colors).
+    :param num_registers: The number of allocatable registers, k.
+    :return: A dictionary mapping each merged node to the node it was merged
+    into (which may itself have been merged later; see find_alias).
+    """
+    alias: Dict[Hashable, Hashable] = {}
+    adjacency = graph.adjacency
+    k = num_registers
+
+    def is_register(a):
+        return type(a).__name__ == 'Reg'
+
+    # registers that are never allocated do not take up a color
+    unallocated = 0
+    for a, i in graph.ids.items():
+        if is_register(a) and colors.get(a.val, -1) < 0:
+            unallocated |= 1 << i
+
+    def significant(j, common: int) -> bool:
+        # whether node j has degree >= k after merging; common neighbors of
+        # the two merged nodes lose one neighbor
+        if unallocated >> j & 1:
+            return False
+        if is_register(graph.nodes[j]):
+            return True
+        return (adjacency[j] & ~unallocated).bit_count() - (common >> j & 1) >= k
+
+    def briggs(i, j) -> bool:
+        common = adjacency[i] & adjacency[j]
+        count = 0
+        for t in iter_bits(adjacency[i] | adjacency[j]):
+            if significant(t, common):
+                count += 1
+                if count >= k:
+                    return False
+        return True
+
+    def george(r, j) -> bool:
+        return all(adjacency[r] >> t & 1 or not significant(t, 0)
+                   for t in iter_bits(adjacency[j]))
+
+    pairs = {frozenset((a, b)) for a, bs in moves.items() for b in bs}
+    pairs = [tuple(p) for p in pairs if len(p) == 2]
+    changed = True
+    while changed:
+        changed = False
+        remaining = []
+        for a, b in pairs:
+            a, b = find_alias(alias, a), find_alias(alias, b)
+            if a == b or a not in graph.ids or b not in graph.ids:
+                continue
+            if is_register(b):
+                a, b = b, a
+            if is_register(b) or (is_register(a) and colors.get(a.val, -1) < 0):
+                # two registers, or a register that is never allocated
+                continue
+            i, j = graph.ids[a], graph.ids[b]
+            if adjacency[i] >> j & 1:
+                continue
+            if is_register(a):
+                ok = george(i, j)
+            elif briggs(i, j) or george(i, j):
+                ok = True
+            elif george(j, i):
+                a, b = b, a
+                ok = True
+            else:
+                ok = False
+            if ok:
+                graph.merge(a, b)
+                alias[b] = a
+                changed = True
+            else:
+                remaining.append((a, b))
+        pairs = remaining
+    return alias
+
+def find_alias(alias: Dict[Hashable, Hashable], a) -> Hashable:
+    while a in alias:
+        a = alias[a]
+    return a
+
+def coalescing_allocation(liveness: Liveness, colors: Dict[str, int]) -> Dict[Hashable, int]:
+    """
+    Like coloring_allocation, but coalesces move-related variables before
+    coloring the graph.
+    """
+    graph = build_interference(liveness)
+    num_registers = sum(1 for c in colors.values() if c >= 0)
+    moves = move_related(liveness.blocks)
+    alias = coalesce(graph, moves, colors, num_registers)
+
+    nodes = [a for a in liveness.locations if not is_vec_var(a) and a not in alias]
+    remaining_moves = {}
+    for a, bs in moves.items():
+        a = find_alias(alias, a)
+        for b in bs:
+            b = find_alias(alias, b)
+            if a != b:
+                remaining_moves.setdefault(a, set()).add(b)
+    coloring = color_graph(graph, nodes,
+                           precolored=precolor_registers(nodes, colors),
+                           moves=remaining_moves,
+                           num_registers=num_registers)
+    for a in alias:
+        coloring[a] = coloring[find_alias(alias, a)]
+    return coloring
+
+# ==================================================
+# Linear scan
+# ==================================================
+
+def linear_scan_allocation(liveness: Liveness, colors: Dict[str, int],
+                           order: Optional[List[str]] = None) -> Dict[Hashable, int]:
+    """
+    Allocates registers by linear scan (Poletto & Sarkar). Intervals are
+    visited in order of their start; each gets the lowest free register
+    that is not live (or clobbered, e.g. by a callq) anywhere inside the
+    interval. When no register is free, the interval that ends last among
+    the current one and those holding a suitable register is spilled.
+    :param liveness: The liveness analysis of the program.
+    :param colors: The color of each register (see register_colors).
+    :param order: The layout order of the blocks; defaults to reverse postorder.
+    :return: The color of each variable and register.
+    """
+    intervals, points = live_intervals(liveness, order or block_order(liveness))
+    intervals = [iv for iv in intervals if is_var(iv.location)]
+    num_registers = sum(1 for c in colors.values() if c >= 0)
+
+    coloring: Dict[Hashable, int] = {}
+    # the points where each allocatable register is in use by the program
+    register_points: List[List[int]] = [[] for _ in range(num_registers)]
+    for a, ps in points.items():
+        if a.val in colors:
+            c = colors[a.val]
+            coloring[a] = c
+            if c >= 0:
+                register_points[c] = ps
+
+    def register_free(c: int, iv: Interval) -> bool:
+        ps = register_points[c]
+        k = bisect.bisect_left(ps, iv.start)
+        return k == len(ps) or ps[k] > iv.end
+
+    active: List[Interval] = []
+    free = set(range(num_registers))
+    spilled: List[Interval] = []
+
+    for iv in intervals:
+        # expire the intervals that ended before this one starts
+        still_active = []
+        for other in active:
+            if other.end < iv.start:
+                free.add(coloring[other.location])
+            else:
+                still_active.append(other)
+        active = still_active
+
+        candidates = [c for c in free if register_free(c, iv)]
+        if candidates:
+            c = min(candidates)
+            free.remove(c)
+            coloring[iv.location] = c
+            active.append(iv)
+            continue
+
+        victims = [other for other in active if register_free(coloring[other.location], iv)]
+        victim = max(victims, key=lambda other: other.end, default=None)
+        if victim is not None and victim.end > iv.end:
+            coloring[iv.location] = coloring.pop(victim.location)
+            active.remove(victim)
+            active.append(iv)
+            spilled.append(victim)
+        else:
+            spilled.append(iv)
+
+    spilled.sort(key=lambda iv: (iv.start, iv.end))
+    for a, s in assign_slots(spilled).items():
+        coloring[a] = num_registers + s
+    return coloring
+
+# ==================================================
+# Homes
+# ==================================================
+
+ALLOCATION_STRATEGIES = {
+    'coloring': coloring_allocation,
+    'coalescing': coalescing_allocation,
+    'linear scan': linear_scan_allocation,
+}
+
+@dataclass
+class Allocation:
+    homes: Dict[Hashable, Any]      # the home (Reg or Deref) of each variable
+    coloring: Dict[Hashable, int]
+    callee_saved_used: List[str]    # to be saved in the prelude, in this order
+    stack_slots: int                # 8-byte slots below the saved registers
+    root_stack_slots: int           # 8-byte slots on the root stack
+
+    def stack_space(self) -> int:
+        """
+        Returns the number of bytes to subtract from %rsp in the prelude,
+        after pushing %rbp and the callee-saved registers, so that %rsp
+        stays 16-byte aligned.
+        """
+        pushed = 8 * len(self.callee_saved_used)
+        total = pushed + 8 * self.stack_slots
+        return (total + 15) // 16 * 16 - pushed
+
+def allocate_homes(blocks: Dict[str, List], caller_saved_registers: List[str],
+                   callee_saved_registers: List[str], strategy: str = 'coloring',
+                   live_at_exit: Optional[Dict[str, Iterable]] = None) -> Allocation:
+    """
+    Assigns a home to each variable of a pseudo-x86 program.
+    Variables on the stack are placed below the saved callee-saved
+    registers: the i-th slot is at -8 * (len(callee_saved_used) + i + 1)(%rbp).
+    Tuple variables are placed on the root stack: the i-th slot is at
+    -8 * (i + 1)(%r15).
+    :param blocks: The program's blocks.
+    :param caller_saved_registers: E.g. constants.caller_saved_registers.
+    :param callee_saved_registers: E.g. constants.callee_saved_registers.
+    :param strategy: 'coloring', 'coalescing' or 'linear scan'.
+    :param live_at_exit: For labels outside the program (e.g. "conclusion"),
+    the locations live when jumping to them.
+    :return: The allocation.
+    """
+    if strategy not in ALLOCATION_STRATEGIES:
+        raise Exception(f'allocate_homes: unknown strategy {strategy}')
+
+    colors = register_colors(caller_saved_registers, callee_saved_registers)
+    liveness = Liveness(blocks, live_at_exit, caller_saved=caller_saved_registers + ['rax'])
+    coloring = ALLOCATION_STRATEGIES[strategy](liveness, colors)
+
+    register_names = {c: r for r, c in colors.items()}
+    num_registers = sum(1 for c in colors.values() if c >= 0)
+    variables = [a for a in coloring if is_var(a)]
+    used = {coloring[a] for a in variables}
+    callee_saved_used = [r for r in callee_saved_registers
+                         if r in colors and colors[r] in used]
+    stack_colors = sorted(c for c in used if c >= num_registers)
+    stack_slot = {c: s for s, c in enumerate(stack_colors)}
+
+    homes = {}
+    for a in variables:
+        # make arguments of the same x86 module as the program
+        x86 = sys.modules[type(a).__module__]
+        c = coloring[a]
+        if c < num_registers:
+            homes[a] = x86.Reg(register_names[c])
+        else:
+            homes[a] = x86.Deref('rbp', -8 * (len(callee_saved_used) + stack_slot[c] + 1))
+
+    intervals, _ = live_intervals(liveness, block_order(liveness))
+    root_slots = assign_slots(iv for iv in intervals if is_vec_var(iv.location))
+    for a, s in root_slots.items():
+        x86 = sys.modules[type(a).__module__]
+        homes[a] = x86.Deref('r15', -8 * (s + 1))
+
+    return Allocation(homes=homes,
+                      coloring=coloring,
+                      callee_saved_used=callee_saved_used,
+                      stack_slots=len(stack_colors),
+                      root_stack_slots=len(set(root_slots.values())))
+
+def apply_homes(blocks: Dict[str, List], homes: Dict[Hashable, Any]) -> Dict[str, List]:
+    """
+    Replaces each variable in a program's instructions with its home.
+    :param blocks: The program's blocks.
+    :param homes: The home of each variable (e.g. Allocation.homes).
+    :return: The new blocks.
+    """
+    def replace_args(i):
+        changes = {}
+        for f in fields(i):
+            v = getattr(i, f.name)
+            if (is_var(v) or is_vec_var(v)) and v in homes:
+                changes[f.name] = homes[v]
+        return replace(i, **changes) if changes else i
+
+    return {label: [replace_args(i) for i in instrs] for label, instrs in blocks.items()}
+
+def remove_self_moves(blocks: Dict[str, List]) -> Tuple[Dict[str, List], int]:
+    """
+    Removes the moves whose source and destination are the same location
+    (e.g. movq %rcx, %rcx after two variables got the same register).
+    Meant to be called in patch instructions.
+    :param blocks: The program's blocks, after assigning homes.
+    :return: The new blocks, and the number of instructions removed.
+    """
+    removed = 0
+    new_blocks = {}
+    for label, instrs in blocks.items():
+        new_instrs = [i for i in instrs if not (type(i).__name__ == 'Movq' and i.a1 == i.a2)]
+        removed += len(instrs) - len(new_instrs)
+        new_blocks[label] = new_instrs
+    return new_blocks, removed
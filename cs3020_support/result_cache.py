@@ -0,0 +1,158 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import tempfile
+from typing import Any, Callable, Tuple
+
+# ==================================================
+# Cache of reference interpreter results
+# ==================================================
+# The test runner interprets every test program on every run, although the
+# programs and the interpreter rarely change while a compiler is being
+# worked on. This cache keeps the interpreter's result for each program on
+# disk, keyed by a hash of:
+#   - the program's source text, and
+#   - the interpreter's version: the source of its module, and of the
+#     modules of this package it uses (e.g. closure_interpreter.py).
+# Editing a test or the interpreter therefore never returns a stale result.
+#
+# Each entry is one pickle file, written to a temporary file and renamed
+# into place, so parallel test runners can share a cache directory: a
+# reader sees either the whole entry or none. evict() deletes the least
+# recently used entries (reading an entry updates its modification time)
+# when there are more than max_entries; the test runner calls it once per
+# run, after the tests, rather than after every write, since it lists the
+# whole directory. Only successful results are cached; an interpreter that
+# raises (e.g. ExecutionLimitExceeded) is run again next time.
+
+CACHE_FORMAT = 1
+
+def module_source_hash(module_name: str) -> str:
+    module = sys.modules.get(module_name)
+    try:
+        source = inspect.getsource(module)
+    except (TypeError, OSError):
+        source = ''
+    return hashlib.sha256(source.encode()).hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def interpreter_version(interpreter: Callable) -> str:
+    """
+    Hashes the source of an interpreter's module, and of the modules of
+    this package that it refers to.
+    """
+    module_name = interpreter.__module__
+    modules = {module_name}
+    package = __name__.split('.')[0]
+    for value in vars(sys.modules[module_name]).values():
+        name = value.__name__ if inspect.ismodule(value) else getattr(value, '__module__', None)
+        if isinstance(name, str) and name.split('.')[0] == package:
+            modules.add(name)
+    h = hashlib.sha256(f'{CACHE_FORMAT}:{interpreter.__qualname__}'.encode())
+    for name in sorted(modules):
+        h.update(f'{name}:{module_source_hash(name)}'.encode())
+    return h.hexdigest()
+
+class ResultCache:
+    """
+    An on-disk cache of interpreter results; see above.
+    """
+    directory: str
+    max_entries: int
+
+    def __init__(self, directory: str, max_entries: int = 1000):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def key(self, program: str, interpreter: Callable) -> str:
+        h = hashlib.sha256(interpreter_version(interpreter).encode())
+        h.update(program.encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        :return: (True, the result) if the cache has the key, otherwise
+        (False, None).
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return False, None
+        except Exception:
+            # a damaged entry; drop it
+            self.remove(path)
+            return False, None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True, value
+
+    def put(self, key: str, value: Any):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            # not every result can be pickled; those are not cached
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            self.remove(tmp)
+            raise
+
+    def evict(self):
+        """
+        Deletes the least recently used entries, down to max_entries.
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.pickle'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            self.remove(path)
+
+    def remove(self, path: str):
+        # another runner may have removed it already
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def lookup_or_run(self, program: str, interpreter: Callable,
+                      run: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns the cached result of an interpreter on a program, or runs
+        it and caches the result.
+        :param program: The program's source text.
+        :param interpreter: The interpreter, whose version is part of the key.
+        :param run: Runs the interpreter on the program.
+        :return: The result, and whether it came from the cache.
+        """
+        key = self.key(program, interpreter)
+        hit, value = self.get(key)
+        if hit:
+            return value, True
+        value = run()
+        self.put(key, value)
+        return value, False
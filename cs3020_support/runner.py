@@ -0,0 +1,288 @@
+import argparse
+import inspect
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from ast import parse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+import pandas as pd
+
+from . import eval_x86
+from .limits import ExecutionLimitExceeded, ExecutionLimits
+from .profiling import PassProfiler
+from .result_cache import ResultCache
+
+# ==================================================
+# Running a single test
+# ==================================================
+
+class TestTimeout(Exception):
+    pass
+
+# The interpreter and the emulator stop themselves at the time limit, and
+# say where the program was; the alarm, a little later, stops everything
+# else (e.g. a compiler pass that loops)
+ALARM_GRACE = 1.0
+
+@dataclass
+class TestResult:
+    name: str
+    status: str                         # 'passed', 'failed', 'error' or 'timeout'
+    interpreter_result: Any = None
+    interpreter_cached: bool = False     # whether interpreter_result came from the cache
+    x86_output: Any = None
+    binary_status: Optional[str] = None  # None if the binary was not run
+    binary_output: Optional[str] = None
+    error: Optional[str] = None          # the traceback, if status is 'error'
+    limit: Optional[str] = None          # where a step or time limit was exceeded
+    seconds: float = 0.0
+    profile: Optional[List[dict]] = None # per-pass profile, with --profile
+
+def expected_stdout(expected: List[Any]) -> str:
+    return ''.join(f'{int(i)}\n' for i in expected)
+
+def raise_timeout(signum, frame):
+    raise TestTimeout()
+
+def run_test(path: str, run_compiler, interpreter, single_result: bool,
+             run_gcc: bool, runtime: str, timeout: float, profile: bool = False,
+             cache: Optional[ResultCache] = None, max_steps: Optional[int] = None) -> TestResult:
+    """
+    Runs one test program: interprets it, compiles it, runs the compiled
+    program in the emulator, and optionally builds and runs it with gcc.
+    Runs in a worker process.
+    :param path: The path of the test program.
+    :param run_compiler: The compiler's run_compiler function.
+    :param interpreter: The reference interpreter (e.g. eval_Lif).
+    :param single_result: True if the interpreter returns a single value
+    rather than the list of printed values.
+    :param run_gcc: Also assemble the program with gcc and run the binary.
+    :param runtime: The path of the compiled runtime (runtime.o).
+    :param timeout: Time limit for the test, in seconds.
+    :param profile: Record the cost of each compiler pass.
+    :param cache: A cache of interpreter results, or None to always run
+    the interpreter.
+    :param max_steps: The number of statements the interpreter, and the
+    number of instructions the emulator, may execute; None for no limit.
+    :return: The result of the test.
+    """
+    result = TestResult(os.path.basename(path), 'failed')
+    start = time.perf_counter()
+
+    # SIGALRM is not available on Windows; there, only the gcc and binary
+    # steps are time-limited
+    use_alarm = hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout + ALARM_GRACE)
+
+    def limits() -> ExecutionLimits:
+        return ExecutionLimits(max_steps, max(0.0, timeout - (time.perf_counter() - start)))
+
+    def interpret(program: str):
+        tree = parse(program)
+        # older interpreters (before Lif) take no limits
+        if 'limits' in inspect.signature(interpreter).parameters:
+            return interpreter(tree, limits=limits())
+        return interpreter(tree)
+
+    try:
+        with open(path) as f:
+            program = f.read()
+
+        if cache is None:
+            interpreter_result = interpret(program)
+        else:
+            interpreter_result, result.interpreter_cached = \
+                cache.lookup_or_run(program, interpreter, lambda: interpret(program))
+        result.interpreter_result = interpreter_result
+        expected = [interpreter_result] if single_result else interpreter_result
+
+        if profile:
+            profiler = PassProfiler()
+            x86_program = run_compiler(program, logging=False, emit_asm=run_gcc,
+                                       profiler=profiler)
+            result.profile = profiler.report()
+        else:
+            x86_program = run_compiler(program, logging=False, emit_asm=run_gcc)
+        emu = eval_x86.X86Emulator(logging=False, limits=limits())
+        result.x86_output = emu.eval_program(x86_program)
+
+        if result.x86_output == expected:
+            result.status = 'passed'
+
+        if run_gcc:
+            # each test gets its own directory, so binaries don't collide
+            with tempfile.TemporaryDirectory() as tmp:
+                asm_file_name = os.path.join(tmp, result.name + '.s')
+                binary_name = os.path.join(tmp, 'a.out')
+                with open(asm_file_name, 'w') as output_file:
+                    output_file.write(x86_program)
+
+                gcc_result = subprocess.run(['gcc', '-g', runtime, asm_file_name, '-o', binary_name],
+                                            text=True, capture_output=True, timeout=timeout)
+                if gcc_result.returncode != 0:
+                    result.binary_status = 'gcc error'
+                    result.binary_output = gcc_result.stderr
+                else:
+                    binary_result = subprocess.run([binary_name], text=True,
+                                                   capture_output=True, timeout=timeout)
+                    result.binary_output = binary_result.stdout
+                    if binary_result.stdout == expected_stdout(expected):
+                        result.binary_status = 'passed'
+                    else:
+                        result.binary_status = 'failed'
+
+    except (TestTimeout, subprocess.TimeoutExpired):
+        result.status = 'timeout'
+    except ExecutionLimitExceeded as e:
+        result.status = 'timeout'
+        engine = 'interpreter' if result.interpreter_result is None else 'emulator'
+        result.limit = f'{engine}: {e}'
+    except Exception:
+        result.status = 'error'
+        result.error = traceback.format_exc()
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    result.seconds = time.perf_counter() - start
+    return result
+
+# ==================================================
+# Running a test suite
+# ==================================================
+
+def print_result(r: TestResult):
+    print(f'Testing program {r.name}...')
+    if r.status == 'passed':
+        print('Test passed')
+    elif r.status == 'failed':
+        print('Test failed! **************************************************')
+        print('Interpreter result:', r.interpreter_result)
+        print('Compiled x86 result:', r.x86_output)
+    elif r.status == 'timeout':
+        print('Test timed out! **************************************************')
+        if r.limit is not None:
+            print('In the', r.limit)
+    else:
+        print('Test failed with error! **************************************************')
+        print(r.error, end='')
+
+    if r.binary_status == 'passed':
+        print('Binary test passed')
+    elif r.binary_status is not None:
+        print('Binary test failed! ************************************************')
+        print('Interpreter result:', r.interpreter_result)
+        print('Binary output:', r.binary_output)
+    print()
+
+def summary_table(results: List[TestResult]) -> pd.DataFrame:
+    rows = [{'Test': r.name,
+             'Status': r.status,
+             'Binary': r.binary_status if r.binary_status is not None else '',
+             'Seconds': round(r.seconds, 3)}
+            for r in results]
+    return pd.DataFrame(rows, columns=['Test', 'Status', 'Binary', 'Seconds'])
+
+def profile_table(results: List[TestResult]) -> pd.DataFrame:
+    """
+    Summarizes the per-pass profiles of a test suite: total time, and the
+    largest peak allocation and output size of each pass over all tests.
+    """
+    rows = [p for r in results if r.profile for p in r.profile]
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows)
+    table = df.groupby('name', sort=False).agg(seconds=('seconds', 'sum'),
+                                               max_peak_bytes=('peak_bytes', 'max'),
+                                               max_nodes=('nodes', 'max'),
+                                               max_instrs=('instrs', 'max'),
+                                               max_vars=('vars', 'max'))
+    return table.reset_index()
+
+def run_tests(run_compiler, interpreter, single_result: bool = False, args=None) -> List[TestResult]:
+    """
+    Runs every test program in a directory in parallel, then prints the
+    details of each test and a summary table. Called by each assignment's
+    run_tests.py; see --help for the command-line options.
+    :param run_compiler: The compiler's run_compiler function.
+    :param interpreter: The reference interpreter (e.g. eval_Lif).
+    :param single_result: True if the interpreter returns a single value
+    rather than the list of printed values.
+    :param args: Command-line arguments (defaults to sys.argv).
+    :return: The list of test results, in order of file name.
+    """
+    parser = argparse.ArgumentParser(description='Run the compiler on each test program')
+    parser.add_argument('--run-gcc', action='store_true',
+                        help='Also run the compiled programs in hardware. '
+                             'You must compile the runtime first and place it in the parent directory')
+    parser.add_argument('--runtime', default=os.path.join('..', 'runtime.o'),
+                        help='Path of the compiled runtime')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of tests to run in parallel')
+    parser.add_argument('-t', '--timeout', type=float, default=60,
+                        help='Time limit for each test, in seconds')
+    parser.add_argument('--max-steps', type=int, default=None,
+                        help='Number of statements the interpreter, and of instructions the '
+                             'emulator, may execute in each test (default: no limit)')
+    parser.add_argument('--tests', default='tests',
+                        help='Directory containing the test programs')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record the time, memory and output size of each compiler pass')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always run the interpreter, instead of reusing its results '
+                             'from previous runs')
+    parser.add_argument('--cache-dir', default='.interpreter_cache',
+                        help='Directory of the interpreter result cache')
+    parser.add_argument('--cache-size', type=int, default=1000,
+                        help='Number of interpreter results to keep in the cache')
+    parser.add_argument('names', nargs='*',
+                        help='Run only these tests (e.g. test1.py)')
+    args = parser.parse_args(args)
+
+    file_names = sorted(f for f in os.listdir(args.tests) if f.endswith('.py'))
+    if args.names:
+        file_names = [f for f in file_names if f in args.names]
+    paths = [os.path.join(args.tests, f) for f in file_names]
+    runtime = os.path.abspath(args.runtime)
+    cache = None if args.no_cache else ResultCache(args.cache_dir, args.cache_size)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(run_test, path, run_compiler, interpreter, single_result,
+                                   args.run_gcc, runtime, args.timeout, args.profile, cache, args.max_steps)
+                   for path in paths]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    if cache is not None:
+        cache.evict()
+
+    for r in results:
+        print_result(r)
+
+    passed = sum(r.status == 'passed' for r in results)
+    print('==================================================')
+    print(' Summary')
+    print('==================================================')
+    print(summary_table(results).to_string(index=False))
+    print(f'{passed}/{len(results)} tests passed in {elapsed:.2f} s ({args.jobs} workers)')
+    if cache is not None:
+        cached = sum(r.interpreter_cached for r in results)
+        print(f'{cached}/{len(results)} interpreter results reused from {args.cache_dir}')
+
+    if args.profile:
+        print()
+        print('==================================================')
+        print(' Compiler passes')
+        print('==================================================')
+        print(profile_table(results).to_string(index=False))
+    sys.stdout.flush()
+    return results
@@ -0,0 +1,127 @@
+import sys
+from dataclasses import replace
+from typing import Callable, Dict, List
+
+from .liveness import ARGUMENT_REGISTERS
+
+# ==================================================
+# Tail calls (Lfun)
+# ==================================================
+# A call is in tail position when its value is returned right away, as in
+#
+#     def count(n: int, acc: int) -> int:
+#         if n == 0:
+#             return acc
+#         else:
+#             return count(n - 1, acc + 1)
+#
+# The caller has nothing left to do, so instead of calling and then
+# returning, it can remove its own frame and jump to the callee, which
+# returns directly to the caller's caller. Recursion through tail calls
+# then runs in constant stack space. The steps, one per pass:
+#
+#   explicate control:    "return f(args)" in tail position becomes the Cif
+#                         statement TailCall(f, args), which ends its block
+#                         like Return. TailCallDetector finds the remaining
+#                         "x = f(args); return x" sequences.
+#   select instructions:  TailCall becomes moves of the arguments into the
+#                         argument registers and TailJmp(f, n), see
+#                         select_tail_call.
+#   prelude & conclusion: each TailJmp becomes the function's conclusion
+#                         without its retq, followed by "jmp *%rax", see
+#                         expand_tail_jumps.
+#
+# Each assignment has its own copy of cif.py and x86.py, so statements and
+# instructions are recognized by class name, and new ones are built from
+# the module of the node they replace.
+
+def kind(x) -> str:
+    return type(x).__name__
+
+def module_of(x):
+    return sys.modules[type(x).__module__]
+
+class TailCallDetector:
+    """
+    Turns the calls in tail position of a Cif program (a CProgram with one
+    CFunctionDef per function) into TailCall statements: a block ending in
+    "return f(args)", or in "x = f(args); return x". Meant to run right
+    after explicate control, for an explicate control that produces these
+    forms; main is left alone, since its conclusion sets the exit code.
+    Callable as a compiler pass; found counts the tail calls created over
+    every program processed by this object.
+    """
+    found: int
+
+    def __init__(self):
+        self.found = 0
+
+    def __call__(self, program):
+        return replace(program, defs=[d if d.name == 'main' else
+                                      replace(d, blocks={label: self.detect_block(stmts)
+                                                         for label, stmts in d.blocks.items()})
+                                      for d in program.defs])
+
+    def detect_block(self, stmts: List) -> List:
+        if not stmts or kind(stmts[-1]) != 'Return':
+            return stmts
+        ret = stmts[-1]
+        if kind(ret.exp) == 'Call':
+            call, rest = ret.exp, stmts[:-1]
+        elif len(stmts) >= 2 and kind(ret.exp) == 'Var' and kind(stmts[-2]) == 'Assign' and \
+                stmts[-2].var == ret.exp.var and kind(stmts[-2].exp) == 'Call':
+            call, rest = stmts[-2].exp, stmts[:-2]
+        else:
+            return stmts
+        cif = module_of(ret)
+        if not hasattr(cif, 'TailCall'):
+            raise Exception('detect tail calls: cif.py has no TailCall statement')
+        self.found += 1
+        return rest + [cif.TailCall(call.func, call.args)]
+
+def select_tail_call(stmt, select_atm: Callable, x86) -> List:
+    """
+    Selects the instructions for a TailCall statement.
+    :param stmt: The TailCall, with atomic function and arguments.
+    :param select_atm: The function that selects an x86 argument for an atom.
+    :param x86: The x86 module whose instructions to build.
+    :return: The moves of the arguments into the argument registers, and
+    the TailJmp.
+    """
+    if len(stmt.args) > len(ARGUMENT_REGISTERS):
+        raise Exception('select_tail_call: too many arguments', stmt)
+    instrs = [x86.Movq(select_atm(a), x86.Reg(r)) for a, r in zip(stmt.args, ARGUMENT_REGISTERS)]
+    return instrs + [x86.TailJmp(select_atm(stmt.func), len(stmt.args))]
+
+def expand_tail_jumps(blocks: Dict[str, List], conclusion: List) -> Dict[str, List]:
+    """
+    Replaces each TailJmp in a function's blocks with the function's
+    conclusion and an indirect jump. The target is first moved to %rax,
+    which the conclusion does not use, since its home (a callee-saved
+    register, or a stack location) is restored or freed by the conclusion;
+    the arguments are already in the argument registers, which the
+    conclusion does not touch either.
+    :param blocks: The blocks of one function, after patch instructions.
+    :param conclusion: The function's conclusion: it frees the stack frame
+    and the root stack frame, restores the callee-saved registers and
+    %rbp, and ends with retq.
+    :return: The new blocks.
+    """
+    teardown = conclusion[:-1] if conclusion and kind(conclusion[-1]) == 'Retq' else conclusion
+    result = {}
+    for label, instrs in blocks.items():
+        new = []
+        for i in instrs:
+            if kind(i) == 'TailJmp':
+                x86 = module_of(i)
+                rax = x86.Reg('rax')
+                if kind(i.e1) == 'FunRef':
+                    new.append(x86.Leaq(i.e1, rax))
+                elif i.e1 != rax:
+                    new.append(x86.Movq(i.e1, rax))
+                new.extend(teardown)
+                new.append(x86.IndirectJmp(rax))
+            else:
+                new.append(i)
+        result[label] = new
+    return result
@@ -127,6 +127,10 @@ class TailJmp(Instr):
     e1: Arg
     num_args: int
 
+@dataclass(frozen=True, eq=True)
+class IndirectJmp(Instr):
+    e1: Arg
+
 @dataclass(frozen=True, eq=True)
 class Jmp(Instr):
     label: str
@@ -179,6 +183,8 @@ def print_x86(program: X86Program) -> str:
                 return f'{offset}(%{register})'
             case GlobalVal(x):
                 return f'{x}(%rip)'
+            case FunRef(label):
+                return f'{label}(%rip)'
             case _:
                 raise Exception('print_arg', a)
 
@@ -214,6 +220,8 @@ def print_x86(program: X86Program) -> str:
                 return f'callq *{print_arg(a1)}'
             case Retq():
                 return f'retq'
+            case IndirectJmp(a1):
+                return f'jmp *{print_arg(a1)}'
             case Jmp(label):
                 return f'jmp {label}'
             case JmpIf(cc, label):
@@ -0,0 +1,392 @@
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# ==================================================
+# Decoded instruction format
+# ==================================================
+# The emulator does not execute Lark trees directly. Instead, each block
+# is decoded once into a list of compact tuples:
+#
+#   instr   ::= (opcode, a1, a2)
+#   operand ::= (IMM, value, None) | (REG, regnum, None) | (VAR, name, None)
+#             | (MEM, offset, regnum) | (DIRECT_MEM, regnum, None)
+#             | (GLOBAL, name, None) | (LABEL, name, target)
+#
+# Registers are numbered by their position in REGISTERS. Unused operand
+# slots are None. Conditional jumps and set instructions
+# carry their condition code as a frozenset of EFLAGS values that satisfy
+# it, so the emulator only needs a membership test.
+#
+# Decoded blocks are then linked into an X86Code object: one flat list of
+# instructions in program order, plus a table mapping each label to its
+# index in that list. Linking fills in the target slot of each LABEL operand
+# with the index of the label, so jumps do not need a dictionary lookup.
+
+# Opcodes
+(MOVQ, MOVZBQ, ADDQ, SUBQ, IMULQ, ANDQ, ORQ, XORQ, SALQ, SARQ, NEGQ,
+ CMPQ, LEAQ, PUSHQ, POPQ, JMP, JCC, SETCC, CALLQ, INDIRECT_CALLQ,
+ INDIRECT_JMP, RETQ) = range(22)
+
+NUM_OPCODES = 22
+
+# Operand kinds
+IMM, REG, VAR, MEM, DIRECT_MEM, GLOBAL, LABEL = range(7)
+
+# Register numbers. EFLAGS is not a real operand, but the emulator keeps
+# it in the register file alongside the others.
+REGISTERS = ['rsp', 'rbp', 'rax', 'rbx', 'rcx', 'rdx', 'rsi', 'rdi',
+             'r8', 'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15',
+             'al', 'rip', 'EFLAGS']
+REGISTER_NUMBERS = {r: i for i, r in enumerate(REGISTERS)}
+(RSP, RBP, RAX, RBX, RCX, RDX, RSI, RDI) = range(8)
+R15 = REGISTER_NUMBERS['r15']
+EFLAGS = REGISTER_NUMBERS['EFLAGS']
+
+Operand = Tuple[int, object, object]
+DecodedInstr = Tuple[int, Operand, Operand]
+
+OPCODES = {
+    'movq': MOVQ,
+    'movzbq': MOVZBQ,
+    'addq': ADDQ,
+    'subq': SUBQ,
+    'imulq': IMULQ,
+    'andq': ANDQ,
+    'orq': ORQ,
+    'xorq': XORQ,
+    'salq': SALQ,
+    'sarq': SARQ,
+    'negq': NEGQ,
+    'cmpq': CMPQ,
+    'leaq': LEAQ,
+    'pushq': PUSHQ,
+    'popq': POPQ,
+    'jmp': JMP,
+    'callq': CALLQ,
+    'indirect_callq': INDIRECT_CALLQ,
+    'indirect_jmp': INDIRECT_JMP,
+    'retq': RETQ,
+}
+
+CONDITIONS = {
+    'e': frozenset(['e']),
+    'l': frozenset(['l']),
+    'le': frozenset(['l', 'e']),
+    'g': frozenset(['g']),
+    'ge': frozenset(['g', 'e']),
+}
+
+def decode_imm(e) -> int:
+    if e.data == 'int_a':
+        return int(e.children[0])
+    elif e.data == 'neg_a':
+        return -decode_imm(e.children[0])
+    else:
+        raise Exception('decode_imm: unknown immediate:', e)
+
+def decode_arg(a) -> Operand:
+    if a.data == 'reg_a':
+        return (REG, REGISTER_NUMBERS[str(a.children[0])], None)
+    elif a.data == 'var_a':
+        return (VAR, str(a.children[0]), None)
+    elif a.data == 'int_a':
+        return (IMM, decode_imm(a.children[0]), None)
+    elif a.data == 'mem_a':
+        offset, reg = a.children
+        return (MEM, decode_imm(offset), REGISTER_NUMBERS[str(reg)])
+    elif a.data == 'direct_mem_a':
+        return (DIRECT_MEM, REGISTER_NUMBERS[str(a.children[0])], None)
+    elif a.data == 'global_val_a':
+        loc, reg = a.children
+        assert str(reg) == 'rip', a
+        return (GLOBAL, str(loc), None)
+    else:
+        raise RuntimeError(f'Unknown arg in decode_arg: {a}')
+
+def decode_instr(instr) -> DecodedInstr:
+    name = instr.data
+    if name in ('jmp', 'callq'):
+        return (OPCODES[name], (LABEL, str(instr.children[0]), None), None)
+    elif name in ('je', 'jl', 'jle', 'jg', 'jge'):
+        return (JCC, CONDITIONS[name[1:]], (LABEL, str(instr.children[0]), None))
+    elif name in ('sete', 'setl', 'setle', 'setg', 'setge'):
+        return (SETCC, CONDITIONS[name[3:]], decode_arg(instr.children[0]))
+    elif name in OPCODES:
+        args = [decode_arg(a) for a in instr.children]
+        a1 = args[0] if len(args) > 0 else None
+        a2 = args[1] if len(args) > 1 else None
+        return (OPCODES[name], a1, a2)
+    else:
+        raise RuntimeError(f'Unknown instruction: {name}')
+
+def decode_instrs(instrs) -> List[DecodedInstr]:
+    return [decode_instr(i) for i in instrs]
+
+# ==================================================
+# Linking
+# ==================================================
+
+@dataclass
+class X86Code:
+    """
+    A decoded and linked x86 program. The program counter is an index into
+    instrs; falling off the end of a block continues with the next block,
+    as it does on hardware.
+    """
+    instrs: List[DecodedInstr]
+    labels: Dict[str, int]
+
+    def locate(self, pc: int) -> Tuple[str, int]:
+        """
+        Converts a program counter into a (block label, offset) pair.
+        """
+        starts = sorted((i, l) for l, i in self.labels.items())
+        idx = bisect_right(starts, (pc, chr(0x10ffff))) - 1
+        if idx < 0:
+            return (None, pc)
+        start, label = starts[idx]
+        return (label, pc - start)
+
+def link_instr(instr: DecodedInstr, labels: Dict[str, int]) -> DecodedInstr:
+    # targets that are not defined in the program (e.g. runtime functions
+    # like print_int) are left as None
+    op, a1, a2 = instr
+    if op in (JMP, CALLQ):
+        return (op, (LABEL, a1[1], labels.get(a1[1])), a2)
+    elif op == JCC:
+        return (op, a1, (LABEL, a2[1], labels.get(a2[1])))
+    else:
+        return instr
+
+def link(blocks: List[Tuple[str, List[DecodedInstr]]]) -> X86Code:
+    """
+    Lays out decoded blocks in order and resolves jump and call targets.
+    :param blocks: A list of (label, decoded instructions) pairs.
+    :return: The linked program.
+    """
+    instrs = []
+    labels = {}
+    for label, block in blocks:
+        # directives like ".globl main" show up as empty blocks; they must
+        # not move a label that is defined by a real block
+        if block or label not in labels:
+            labels[label] = len(instrs)
+        instrs.extend(block)
+
+    return X86Code([link_instr(i, labels) for i in instrs], labels)
+
+def decode_program(p) -> X86Code:
+    """
+    Decodes a parsed x86 program (a 'prog' tree from x86_parser).
+    :param p: A Lark tree produced by x86_parser.
+    :return: The decoded and linked program.
+    """
+    assert p.data == 'prog'
+    blocks = []
+    for b in p.children:
+        assert b.data == 'block'
+        block_name, *instrs = b.children
+        blocks.append((str(block_name), decode_instrs(instrs)))
+    return link(blocks)
+
+# ==================================================
+# Decoding x86 ASTs directly
+# ==================================================
+# The emulator can also run X86Program objects without printing them first.
+# Each assignment has its own copy of x86.py, so instructions and arguments
+# are recognized by class name rather than by class.
+
+AST_OPCODES = {
+    'Movq': MOVQ,
+    'Movzbq': MOVZBQ,
+    'Addq': ADDQ,
+    'Subq': SUBQ,
+    'Imulq': IMULQ,
+    'Andq': ANDQ,
+    'Orq': ORQ,
+    'Xorq': XORQ,
+    'Cmpq': CMPQ,
+    'Leaq': LEAQ,
+    'Pushq': PUSHQ,
+    'Popq': POPQ,
+    'IndirectCallq': INDIRECT_CALLQ,
+}
+
+def decode_ast_arg(a) -> Operand:
+    match type(a).__name__:
+        case 'Immediate':
+            return (IMM, a.val, None)
+        case 'Reg' | 'ByteReg':
+            return (REG, REGISTER_NUMBERS[a.val], None)
+        case 'Var' | 'VecVar':
+            return (VAR, a.var, None)
+        case 'Deref':
+            return (MEM, a.offset, REGISTER_NUMBERS[a.reg])
+        case 'GlobalVal':
+            return (GLOBAL, a.val, None)
+        case 'FunRef':
+            return (GLOBAL, a.label, None)
+        case _:
+            raise RuntimeError(f'Unknown arg in decode_ast_arg: {a}')
+
+def decode_ast_instr(i) -> DecodedInstr:
+    name = type(i).__name__
+    if name in ('Callq', 'Jmp'):
+        return (OPCODES[name.lower()], (LABEL, i.label, None), None)
+    elif name == 'JmpIf':
+        return (JCC, CONDITIONS[i.cc], (LABEL, i.label, None))
+    elif name == 'Set':
+        return (SETCC, CONDITIONS[i.cc], decode_ast_arg(i.e1))
+    elif name == 'Retq':
+        return (RETQ, None, None)
+    elif name == 'IndirectCallq':
+        return (INDIRECT_CALLQ, decode_ast_arg(i.e1), None)
+    elif name == 'IndirectJmp':
+        return (INDIRECT_JMP, decode_ast_arg(i.e1), None)
+    elif name in AST_OPCODES:
+        args = [decode_ast_arg(getattr(i, f)) for f in ('a1', 'a2') if hasattr(i, f)]
+        a1 = args[0] if len(args) > 0 else None
+        a2 = args[1] if len(args) > 1 else None
+        return (AST_OPCODES[name], a1, a2)
+    else:
+        # TailJmp is a pseudo-instruction; prelude & conclusion expands it
+        # into the function's conclusion followed by an IndirectJmp
+        raise RuntimeError(f'Unknown instruction: {i}')
+
+def decode_ast_program(program) -> X86Code:
+    """
+    Decodes an X86Program, or an X86ProgramDefs (whose functions' blocks
+    are laid out one after another).
+    :param program: An x86 program AST.
+    :return: The decoded and linked program.
+    """
+    if hasattr(program, 'defs'):
+        blocks = [(label, block) for d in program.defs for label, block in d.blocks.items()]
+    else:
+        blocks = list(program.blocks.items())
+    return link([(label, [decode_ast_instr(i) for i in block]) for label, block in blocks])
+
+# ==================================================
+# Decoding print_x86 output directly
+# ==================================================
+# print_x86 emits one directive, label or instruction per line, with
+# arguments separated by ", ". decode_text recognizes exactly that format
+# and decodes it without building a parse tree. Anything else (several
+# instructions on a line, unusual spacing, .align, ...) makes it return
+# None, and the caller falls back to the Lark parser.
+
+CNAME_RE = re.compile(r'[A-Za-z_]\w*\Z')
+INT_RE = re.compile(r'-?\d+\Z')
+MEM_RE = re.compile(r'(-?\d+)\(%(\w+)\)\Z')
+GLOBAL_RE = re.compile(r'([A-Za-z_]\w*)\(%rip\)\Z')
+
+TWO_ARG_INSTRS = {'movq', 'movzbq', 'addq', 'subq', 'imulq', 'andq', 'orq',
+                  'xorq', 'salq', 'sarq', 'cmpq', 'leaq'}
+ONE_ARG_INSTRS = {'negq', 'pushq', 'popq'}
+JCC_INSTRS = {'je', 'jl', 'jle', 'jg', 'jge'}
+SETCC_INSTRS = {'sete', 'setl', 'setle', 'setg', 'setge'}
+
+# Words the grammar treats as keywords, which it would not accept as labels
+KEYWORDS = (TWO_ARG_INSTRS | ONE_ARG_INSTRS | JCC_INSTRS | SETCC_INSTRS
+            | {'jmp', 'callq', 'retq'} | set(REGISTERS[:-1]))
+
+def decode_text_arg(a: str) -> Optional[Operand]:
+    c = a[:1]
+    if c == '%':
+        if a[1:] in REGISTER_NUMBERS and a[1:] != 'EFLAGS':
+            return (REG, REGISTER_NUMBERS[a[1:]], None)
+    elif c == '$':
+        if INT_RE.match(a, 1):
+            return (IMM, int(a[1:]), None)
+    elif c == '#':
+        if CNAME_RE.match(a, 1):
+            return (VAR, a[1:], None)
+    elif c == '(':
+        if a[1:2] == '%' and a[-1:] == ')' and a[2:-1] in REGISTER_NUMBERS \
+                and a[2:-1] != 'EFLAGS':
+            return (DIRECT_MEM, REGISTER_NUMBERS[a[2:-1]], None)
+    else:
+        m = MEM_RE.match(a)
+        if m and m.group(2) in REGISTER_NUMBERS and m.group(2) != 'EFLAGS':
+            return (MEM, int(m.group(1)), REGISTER_NUMBERS[m.group(2)])
+        m = GLOBAL_RE.match(a)
+        if m and m.group(1) not in KEYWORDS:
+            return (GLOBAL, m.group(1), None)
+    return None
+
+def decode_text_instr(line: str, arg_cache: Dict[str, Operand]) -> Optional[DecodedInstr]:
+    name, _, rest = line.partition(' ')
+    args = rest.split(', ') if rest else []
+
+    if name in TWO_ARG_INSTRS or name in ONE_ARG_INSTRS or name in SETCC_INSTRS:
+        expected = 2 if name in TWO_ARG_INSTRS else 1
+        if len(args) != expected:
+            return None
+        decoded = []
+        for a in args:
+            d = arg_cache.get(a)
+            if d is None:
+                d = decode_text_arg(a)
+                if d is None:
+                    return None
+                arg_cache[a] = d
+            decoded.append(d)
+        if name in SETCC_INSTRS:
+            return (SETCC, CONDITIONS[name[3:]], decoded[0])
+        return (OPCODES[name], decoded[0], decoded[1] if expected == 2 else None)
+    elif name in ('jmp', 'callq') or name in JCC_INSTRS:
+        if len(args) != 1:
+            return None
+        target = args[0]
+        if target[:1] == '*':
+            if name == 'jmp' or name == 'callq':
+                d = decode_text_arg(target[1:])
+                return None if d is None else (OPCODES['indirect_' + name], d, None)
+            return None
+        if not CNAME_RE.match(target) or target in KEYWORDS:
+            return None
+        if name in JCC_INSTRS:
+            return (JCC, CONDITIONS[name[1:]], (LABEL, target, None))
+        return (OPCODES[name], (LABEL, target, None), None)
+    elif name == 'retq' and not args:
+        return (RETQ, None, None)
+    return None
+
+def decode_text(s: str) -> Optional[X86Code]:
+    """
+    Decodes a program in the format printed by print_x86, without using
+    the Lark parser.
+    :param s: The program, as a string.
+    :return: The decoded and linked program, or None if the text is not
+    in print_x86 format.
+    """
+    blocks = []
+    block = None
+    arg_cache = {}
+    for line in s.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        elif line[-1] == ':':
+            label = line[:-1]
+            if not CNAME_RE.match(label) or label in KEYWORDS:
+                return None
+            block = []
+            blocks.append((label, block))
+        elif line.startswith('.globl '):
+            label = line[7:]
+            if not CNAME_RE.match(label) or label in KEYWORDS:
+                return None
+            blocks.append((label, []))
+            block = None
+        elif block is None:
+            # instructions must follow a label
+            return None
+        else:
+            instr = decode_text_instr(line, arg_cache)
+            if instr is None:
+                return None
+            block.append(instr)
+    return link(blocks)
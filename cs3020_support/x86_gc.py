@@ -0,0 +1,215 @@
+import time
+from dataclasses import dataclass, asdict
+
+from .x86_memory import FlatMemory, MemoryLayout
+
+# ==================================================
+# Tuple tags (see runtime.c)
+# ==================================================
+# #b|- 7 bit unused -|- 50 bit field [50, 0] -| 6 bits length -| 1 bit isNotForwarding Pointer
+# If the bottom-most bit is zero, the tag is really a forwarding pointer.
+# Otherwise, the next 6 bits give the length of the tuple, and the next
+# 50 bits say which of its fields are pointers.
+
+TAG_IS_NOT_FORWARD_MASK = 1
+TAG_LENGTH_MASK = 126
+TAG_LENGTH_RSHIFT = 1
+TAG_PTR_BITFIELD_RSHIFT = 7
+TAG_PTR_BITFIELD_MASK = 2**50 - 1
+
+ANY_TAG_MASK = 7
+ANY_TAG_PTR = 0
+ANY_TAG_VEC = 2
+
+def is_forwarding(tag: int) -> bool:
+    return not (tag & TAG_IS_NOT_FORWARD_MASK)
+
+def get_length(tag: int) -> int:
+    return (tag & TAG_LENGTH_MASK) >> TAG_LENGTH_RSHIFT
+
+def get_ptr_bitfield(tag: int) -> int:
+    return (tag >> TAG_PTR_BITFIELD_RSHIFT) & TAG_PTR_BITFIELD_MASK
+
+def any_tag(v: int) -> int:
+    return v & ANY_TAG_MASK
+
+def to_ptr(v: int) -> int:
+    if any_tag(v) == ANY_TAG_PTR:
+        return v
+    else:
+        return v & ~ANY_TAG_MASK
+
+# ==================================================
+# Collector
+# ==================================================
+
+@dataclass
+class GCStats:
+    collections: int = 0       # calls to collect
+    bytes_copied: int = 0      # total bytes copied into tospace
+    bytes_requested: int = 0   # total bytes requested by callers of collect
+    pause_time: float = 0.0    # total seconds spent in collect
+    max_pause: float = 0.0     # longest single call to collect, in seconds
+    heap_resizes: int = 0      # collections that had to grow the heap
+    heap_size: int = 0         # current size of each space, in bytes
+
+    def to_dict(self):
+        return asdict(self)
+
+class CheneyCollector:
+    """
+    Cheney's copying collector over the emulator's heap, following the
+    algorithm in runtime.c. The heap is two equally-sized spaces; collect
+    copies everything reachable from the root stack into tospace, then
+    swaps the spaces. If that does not free enough room, both spaces are
+    grown by doubling and the live data is copied again.
+
+    Spaces are placed at layout.heap_begin + k * layout.space_stride, for
+    increasing k, so a grown space never overlaps an old one.
+    """
+
+    def __init__(self, memory, layout: MemoryLayout, heap_size: int):
+        self.memory = memory
+        self.layout = layout
+        self.next_space = 0
+
+        self.fromspace_begin = self.new_space(heap_size)
+        self.fromspace_end = self.fromspace_begin + heap_size
+        self.tospace_begin = self.new_space(heap_size)
+        self.tospace_end = self.tospace_begin + heap_size
+        self.free_ptr = self.fromspace_begin
+
+        self.stats = GCStats(heap_size=heap_size)
+
+    def new_space(self, size: int) -> int:
+        begin = self.layout.heap_begin + self.next_space * self.layout.space_stride
+        assert size <= self.layout.space_stride, f'heap space of {size} bytes is too large'
+        if isinstance(self.memory, FlatMemory):
+            self.memory.add_region(f'heap{self.next_space}', begin, size)
+        self.next_space += 1
+        return begin
+
+    def free_space(self, begin: int, end: int):
+        if isinstance(self.memory, FlatMemory):
+            k = (begin - self.layout.heap_begin) // self.layout.space_stride
+            self.memory.remove_region(f'heap{k}')
+        else:
+            for addr in range(begin, end, 8):
+                self.memory.pop(addr, None)
+
+    def copy_words(self, dst: int, src: int, n: int):
+        if isinstance(self.memory, FlatMemory):
+            src_region = self.memory.find(src)
+            dst_region = self.memory.find(dst)
+            i = (src - src_region.begin) >> 3
+            j = (dst - dst_region.begin) >> 3
+            dst_region.words[j:j + n] = src_region.words[i:i + n]
+        else:
+            for i in range(n):
+                self.memory[dst + 8 * i] = self.memory[src + 8 * i]
+
+    def in_fromspace(self, addr) -> bool:
+        return self.fromspace_begin <= addr < self.fromspace_end
+
+    def is_ptr(self, v) -> bool:
+        # Only integers that point into fromspace are treated as pointers,
+        # so values like function pointers are left alone.
+        return isinstance(v, int) and v != 0 \
+            and any_tag(v) in (ANY_TAG_PTR, ANY_TAG_VEC) \
+            and self.in_fromspace(to_ptr(v))
+
+    def collect(self, rootstack_begin: int, rootstack_ptr: int, bytes_requested: int):
+        """
+        Performs a collection, growing the heap if needed so that at least
+        bytes_requested bytes are free afterwards.
+        :param rootstack_begin: The address of the bottom of the root stack.
+        :param rootstack_ptr: The address just past the last live root.
+        :param bytes_requested: The number of bytes the caller needs.
+        """
+        start = time.perf_counter()
+
+        self.cheney(rootstack_begin, rootstack_ptr)
+
+        if self.fromspace_end - self.free_ptr < bytes_requested:
+            occupied_bytes = self.free_ptr - self.fromspace_begin
+            needed_bytes = occupied_bytes + bytes_requested
+            new_bytes = max(self.fromspace_end - self.fromspace_begin, 8)
+            while new_bytes <= needed_bytes:
+                new_bytes = 2 * new_bytes
+
+            # copy the live data into a larger tospace, then replace the
+            # (now old and too small) tospace with one of the new size
+            self.free_space(self.tospace_begin, self.tospace_end)
+            self.tospace_begin = self.new_space(new_bytes)
+            self.tospace_end = self.tospace_begin + new_bytes
+
+            self.cheney(rootstack_begin, rootstack_ptr)
+
+            self.free_space(self.tospace_begin, self.tospace_end)
+            self.tospace_begin = self.new_space(new_bytes)
+            self.tospace_end = self.tospace_begin + new_bytes
+
+            self.stats.heap_resizes += 1
+            self.stats.heap_size = new_bytes
+
+        elapsed = time.perf_counter() - start
+        self.stats.collections += 1
+        self.stats.bytes_requested += bytes_requested
+        self.stats.pause_time += elapsed
+        self.stats.max_pause = max(self.stats.max_pause, elapsed)
+
+    def cheney(self, rootstack_begin: int, rootstack_ptr: int):
+        memory = self.memory
+        scan_ptr = self.tospace_begin
+        self.free_ptr = self.tospace_begin
+
+        # copy the tuples pointed to by roots, to create the initial queue
+        for root_loc in range(rootstack_begin, rootstack_ptr, 8):
+            self.copy_vector(root_loc)
+
+        # scan tospace breadth-first, copying every tuple it points to
+        while scan_ptr != self.free_ptr:
+            tag = memory[scan_ptr]
+            length = get_length(tag)
+            is_pointer_bits = get_ptr_bitfield(tag)
+
+            for i in range(length):
+                if (is_pointer_bits >> i) & 1:
+                    self.copy_vector(scan_ptr + 8 * (i + 1))
+
+            scan_ptr += 8 * (length + 1)
+
+        # swap the tospace and fromspace
+        self.fromspace_begin, self.tospace_begin = self.tospace_begin, self.fromspace_begin
+        self.fromspace_end, self.tospace_end = self.tospace_end, self.fromspace_end
+
+        if not isinstance(memory, FlatMemory):
+            # in dict mode, drop the garbage left behind in the old space
+            self.free_space(self.tospace_begin, self.tospace_end)
+
+    def copy_vector(self, vector_ptr_loc: int):
+        memory = self.memory
+        old_vector_ptr = memory[vector_ptr_loc]
+        if not self.is_ptr(old_vector_ptr):
+            return
+
+        old_tag = any_tag(old_vector_ptr)
+        old_vector_ptr = to_ptr(old_vector_ptr)
+        tag = memory[old_vector_ptr]
+
+        if is_forwarding(tag):
+            # already copied; the forwarding pointer says where to
+            memory[vector_ptr_loc] = tag | old_tag
+        else:
+            length = get_length(tag)
+            new_vector_ptr = self.free_ptr
+
+            self.copy_words(new_vector_ptr, old_vector_ptr, length + 1)
+
+            self.free_ptr = self.free_ptr + 8 * (length + 1)
+            self.stats.bytes_copied += 8 * (length + 1)
+
+            # leave a forwarding pointer in the old tuple, and update the
+            # location we found the old pointer in
+            memory[old_vector_ptr] = new_vector_ptr
+            memory[vector_ptr_loc] = new_vector_ptr | old_tag
@@ -0,0 +1,163 @@
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import List
+
+# ==================================================
+# Address space layouts
+# ==================================================
+
+@dataclass(frozen=True)
+class MemoryLayout:
+    stack_top: int        # initial value of %rsp and %rbp
+    rootstack_begin: int  # start of the root stack
+    heap_begin: int       # start of the first heap space
+    space_stride: int     # distance between heap spaces (from/to-space)
+
+# Addresses used by the original dictionary-based emulator. Kept for the
+# debug view (memory='dict'), which eval_instructions uses by default, so
+# that notebook exercises see the same addresses as before.
+LEGACY_LAYOUT = MemoryLayout(stack_top=1000,
+                             rootstack_begin=2000,
+                             heap_begin=100000,
+                             space_stride=2**32)
+
+FLAT_LAYOUT = MemoryLayout(stack_top=2**20,
+                           rootstack_begin=2**21,
+                           heap_begin=2**24,
+                           space_stride=2**32)
+
+DEFAULT_STACK_SIZE = 2**19
+
+class X86MemoryError(RuntimeError):
+    pass
+
+def encode_word(v) -> int:
+    """
+    Converts a value into a signed 64-bit integer that can be stored in a
+    word of flat memory. Uninitialized values (None) become 0, and integers
+    wrap around as they would on hardware.
+    """
+    if v is None:
+        return 0
+    elif isinstance(v, int):
+        return ((v + 2**63) % 2**64) - 2**63
+    else:
+        raise X86MemoryError(f'cannot store {v!r} in memory')
+
+# ==================================================
+# Flat memory
+# ==================================================
+
+class MemoryRegion:
+    """
+    A contiguous region of 64-bit words, covering addresses [begin, end).
+    """
+    def __init__(self, name: str, begin: int, size: int):
+        assert size % 8 == 0, f'region {name} has size {size}, not a multiple of 8'
+        self.name = name
+        self.begin = begin
+        self.end = begin + size
+        self.words = array('q', bytes(size))
+
+    def size(self) -> int:
+        return self.end - self.begin
+
+    def __repr__(self):
+        return f'MemoryRegion({self.name}, [{self.begin}, {self.end}))'
+
+class FlatMemory:
+    """
+    Emulated memory made up of a few contiguous regions (the stack, the root
+    stack, and the heap spaces), each stored as an array of 64-bit words.
+    Supports the same subscript interface as the dictionary used in debug
+    mode. Accesses outside every region, or not aligned to 8 bytes, raise
+    an X86MemoryError.
+    """
+    regions: List[MemoryRegion]
+
+    def __init__(self):
+        self.regions = []
+        # the most recently used region, checked first on each access
+        self.last = MemoryRegion('', 0, 0)
+        # converts values that are not 64-bit integers (e.g. function
+        # pointers) into integers before they are stored
+        self.encode = encode_word
+
+    def add_region(self, name: str, begin: int, size: int) -> MemoryRegion:
+        r = MemoryRegion(name, begin, size)
+        for other in self.regions:
+            if r.begin < other.end and other.begin < r.end:
+                raise X86MemoryError(f'region {r} overlaps {other}')
+        self.regions.append(r)
+        return r
+
+    def remove_region(self, name: str):
+        self.regions = [r for r in self.regions if r.name != name]
+        self.last = MemoryRegion('', 0, 0)
+
+    def region(self, name: str) -> MemoryRegion:
+        for r in self.regions:
+            if r.name == name:
+                return r
+        raise KeyError(name)
+
+    def find(self, addr) -> MemoryRegion:
+        try:
+            for r in self.regions:
+                if r.begin <= addr < r.end:
+                    if addr & 7:
+                        raise X86MemoryError(f'unaligned access at address {addr}')
+                    self.last = r
+                    return r
+        except TypeError:
+            raise X86MemoryError(f'invalid address: {addr}')
+        raise X86MemoryError(f'access to unmapped address {addr}')
+
+    def __getitem__(self, addr):
+        r = self.last
+        try:
+            if r.begin <= addr < r.end and not addr & 7:
+                return r.words[(addr - r.begin) >> 3]
+        except TypeError:
+            pass
+        r = self.find(addr)
+        return r.words[(addr - r.begin) >> 3]
+
+    def __setitem__(self, addr, v):
+        r = self.last
+        try:
+            in_last = r.begin <= addr < r.end and not addr & 7
+        except TypeError:
+            in_last = False
+        if not in_last:
+            r = self.find(addr)
+        try:
+            r.words[(addr - r.begin) >> 3] = v
+        except (TypeError, OverflowError):
+            r.words[(addr - r.begin) >> 3] = self.encode(v)
+
+    def keys(self):
+        """
+        Returns the addresses of all non-zero words, in increasing order.
+        """
+        addrs = []
+        for r in sorted(self.regions, key=lambda r: r.begin):
+            addrs.extend(r.begin + 8 * i for i, w in enumerate(r.words) if w != 0)
+        return addrs
+
+    def copy(self):
+        """
+        Returns a snapshot of the non-zero words, as a dictionary in which
+        the other words read as None, like unset words in debug mode.
+        """
+        snapshot = defaultdict(lambda: None)
+        for k in self.keys():
+            snapshot[k] = self[k]
+        return snapshot
+
+    def footprint(self) -> int:
+        """
+        Returns the number of bytes of storage used by all regions.
+        """
+        return sum(r.words.itemsize * len(r.words) for r in self.regions)
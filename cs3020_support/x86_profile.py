@@ -0,0 +1,169 @@
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from .x86_decode import *
+
+# ==================================================
+# Execution profiles
+# ==================================================
+# With profile=True, X86Emulator counts how many times each instruction
+# runs (plus the targets of indirect calls), and builds an
+# ExecutionProfile from these counts when the program finishes. The
+# profile gives the dynamic instruction count, spread over blocks,
+# opcodes and call targets, and the number of memory accesses.
+#
+# Memory accesses are those made by the instructions' operands (Deref and
+# global values, such as free_ptr(%rip)), and by pushq and popq. The
+# return addresses of callq and retq are kept outside of memory by the
+# emulator, and are not counted; neither is the copying done by collect,
+# which is in the emulator's gc_stats().
+
+CONDITION_NAMES = {cond: name for name, cond in CONDITIONS.items()}
+OPCODE_NAMES = {op: name for name, op in OPCODES.items()}
+
+MEMORY_KINDS = (MEM, DIRECT_MEM, GLOBAL)
+
+# Opcodes that read their second operand before writing it
+READ_WRITE = {ADDQ, SUBQ, IMULQ, ANDQ, ORQ, XORQ, SALQ, SARQ}
+
+def instr_name(instr: DecodedInstr) -> str:
+    """
+    The mnemonic of a decoded instruction, e.g. 'movq' or 'jle'.
+    """
+    op = instr[0]
+    if op == JCC:
+        return 'j' + CONDITION_NAMES[instr[1]]
+    elif op == SETCC:
+        return 'set' + CONDITION_NAMES[instr[1]]
+    return OPCODE_NAMES[op]
+
+def memory_accesses(instr: DecodedInstr) -> Tuple[int, int]:
+    """
+    :return: The number of memory reads and writes made by one execution
+    of a decoded instruction.
+    """
+    op, a1, a2 = instr
+    if op in (JMP, JCC, CALLQ, RETQ):
+        return 0, 0
+    # for setcc, a1 is the condition
+    m1 = int(op != SETCC and a1 is not None and a1[0] in MEMORY_KINDS)
+    m2 = int(a2 is not None and a2[0] in MEMORY_KINDS)
+    if op in (MOVQ, MOVZBQ):
+        return m1, m2
+    elif op in READ_WRITE:
+        return m1 + m2, m2
+    elif op == NEGQ:
+        return m1, m1
+    elif op == CMPQ:
+        return m1 + m2, 0
+    elif op == LEAQ:
+        # only computes an address
+        return 0, m2
+    elif op == SETCC:
+        return 0, m2
+    elif op == PUSHQ:
+        return m1, 1
+    elif op == POPQ:
+        return 1, m1
+    else:
+        # indirect calls and jumps
+        return m1, 0
+
+@dataclass
+class ExecutionProfile:
+    instructions: int = 0                                       # instructions executed
+    block_entries: Dict[str, int] = field(default_factory=dict) # runs of each block's first instruction
+    block_instructions: Dict[str, int] = field(default_factory=dict)
+    opcodes: Dict[str, int] = field(default_factory=dict)       # instructions executed, by mnemonic
+    memory_reads: int = 0
+    memory_writes: int = 0
+    calls: Dict[str, int] = field(default_factory=dict)         # callq, direct or indirect, by target
+    collect_calls: int = 0
+    block_memory: Dict[str, Tuple[int, int]] = field(default_factory=dict) # (reads, writes) by block
+
+    def to_dict(self):
+        return asdict(self)
+
+    def block_table(self, sort_by: str = 'Instructions') -> pd.DataFrame:
+        """
+        A table of the blocks that ran, with their entries, instructions
+        executed (also as a share of the total) and memory accesses,
+        sorted by one of its columns, largest first.
+        """
+        rows = [[label, self.block_entries[label], count,
+                 100 * count / max(self.instructions, 1), *self.block_memory[label]]
+                for label, count in self.block_instructions.items()]
+        df = pd.DataFrame(rows, columns=['Block', 'Entries', 'Instructions', 'Share (%)',
+                                         'Memory reads', 'Memory writes'])
+        return df.sort_values(sort_by, ascending=False, kind='stable').reset_index(drop=True)
+
+    def opcode_table(self) -> pd.DataFrame:
+        """
+        A table of the instructions executed by mnemonic, most frequent first.
+        """
+        df = pd.DataFrame(list(self.opcodes.items()), columns=['Opcode', 'Count'])
+        return df.sort_values('Count', ascending=False, kind='stable').reset_index(drop=True)
+
+    def call_table(self) -> pd.DataFrame:
+        """
+        A table of the call targets, most called first.
+        """
+        df = pd.DataFrame(list(self.calls.items()), columns=['Target', 'Calls'])
+        return df.sort_values('Calls', ascending=False, kind='stable').reset_index(drop=True)
+
+def build_profile(code: X86Code, counts: List[int],
+                  indirect_calls: Dict[int, int]) -> ExecutionProfile:
+    """
+    Builds the profile of one run of a program.
+    :param code: The program.
+    :param counts: The number of times each instruction ran, by index.
+    :param indirect_calls: The number of indirect calls to each target
+    instruction, by index.
+    :return: The profile.
+    """
+    profile = ExecutionProfile()
+    instrs = code.instrs
+
+    # the block of each instruction, as in X86Code.locate
+    starts = sorted((i, l) for l, i in code.labels.items())
+    block_of = [None] * len(instrs)
+    for k, (start, label) in enumerate(starts):
+        end = starts[k + 1][0] if k + 1 < len(starts) else len(instrs)
+        for pc in range(start, end):
+            block_of[pc] = label
+
+    for pc, count in enumerate(counts):
+        if count == 0:
+            continue
+        instr = instrs[pc]
+        label = block_of[pc]
+        if label not in profile.block_instructions:
+            profile.block_entries[label] = 0
+            profile.block_instructions[label] = 0
+            profile.block_memory[label] = (0, 0)
+        if pc == code.labels.get(label):
+            profile.block_entries[label] = count
+        profile.block_instructions[label] += count
+        profile.instructions += count
+
+        name = instr_name(instr)
+        profile.opcodes[name] = profile.opcodes.get(name, 0) + count
+
+        reads, writes = memory_accesses(instr)
+        block_reads, block_writes = profile.block_memory[label]
+        profile.block_memory[label] = (block_reads + reads * count, block_writes + writes * count)
+        profile.memory_reads += reads * count
+        profile.memory_writes += writes * count
+
+        if instr[0] == CALLQ:
+            target = instr[1][1]
+            profile.calls[target] = profile.calls.get(target, 0) + count
+
+    for target_pc, count in indirect_calls.items():
+        target = block_of[target_pc]
+        profile.calls[target] = profile.calls.get(target, 0) + count
+
+    profile.collect_calls = profile.calls.get('collect', 0)
+    return profile
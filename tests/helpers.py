@@ -0,0 +1,86 @@
+import importlib.util
+import os
+
+from cs3020_support import x86
+from cs3020_support.benchmarks import (CALLEE_SAVED_REGISTERS, CALLER_SAVED_REGISTERS,
+                                       pseudo_x86_program, with_prelude)
+from cs3020_support.eval_x86 import X86Emulator
+from cs3020_support.limits import ExecutionLimits
+from cs3020_support.register_allocation import allocate_homes, apply_homes, remove_self_moves
+
+# ==================================================
+# Generated pseudo-x86 programs
+# ==================================================
+# The passes over x86 are checked on programs from
+# benchmarks.pseudo_x86_program: chains of loops that update and print
+# variables. Emulating a program before a pass, with its variables, gives
+# the expected output of the program after the pass.
+#
+# With bool_tests, a loop tests a boolean variable and ends in a jmp back
+# to its body, so variables are live around a back edge at the end of a
+# block; without, the loop ends in a conditional jump.
+
+# (number of variables, number of loops, seed, bool_tests)
+PROGRAM_SHAPES = [(n, loops, seed, bool_tests)
+                  for n, loops in [(3, 1), (6, 3), (12, 3), (40, 4)]
+                  for seed in range(4)
+                  for bool_tests in (False, True)]
+
+def shape_id(shape) -> str:
+    n, loops, seed, bool_tests = shape
+    return f'{n}vars-{loops}loops-seed{seed}-{"bool" if bool_tests else "jcc"}'
+
+# More instructions than any generated program executes, so that a
+# miscompiled loop fails the test instead of hanging it
+MAX_STEPS = 10**6
+
+def generated_program(n: int, loops: int, seed: int, bool_tests: bool) -> x86.X86Program:
+    return pseudo_x86_program(n, loops, 2 * n, seed=seed, bool_tests=bool_tests)
+
+def run_x86(program: x86.X86Program) -> list:
+    """
+    Emulates a program (with main and conclusion blocks, see with_prelude)
+    and returns the values it printed.
+    """
+    return X86Emulator(logging=False, limits=ExecutionLimits(MAX_STEPS)).eval_program(program)
+
+def run_counted(program: x86.X86Program):
+    """
+    Like run_x86, but also returns the number of instructions executed.
+    """
+    emu = X86Emulator(logging=False, limits=ExecutionLimits(MAX_STEPS), profile=True)
+    output = emu.eval_program(program)
+    return output, emu.execution_profile().instructions
+
+def run_blocks(blocks) -> list:
+    """
+    Emulates the blocks of a pseudo-x86 program, with their variables.
+    """
+    return run_x86(with_prelude(blocks))
+
+def allocate(blocks, strategy: str = 'coloring') -> x86.X86Program:
+    """
+    Assigns homes to the variables of a pseudo-x86 program, removes the
+    self-moves and adds main and conclusion, ready to be emulated.
+    """
+    allocation = allocate_homes(blocks, CALLER_SAVED_REGISTERS, CALLEE_SAVED_REGISTERS, strategy)
+    allocated, _ = remove_self_moves(apply_homes(blocks, allocation.homes))
+    return with_prelude(allocated, allocation)
+
+# ==================================================
+# Assignment modules
+# ==================================================
+# Each assignment has its own copies of its ASTs (e.g. cif.py) and its own
+# reference interpreter, which are not part of a package; tests load them
+# by path.
+
+def load_assignment_module(assignment: str, name: str):
+    """
+    Loads a module of an assignment, e.g. load_assignment_module('a4', 'cif').
+    """
+    directory = os.path.join(os.path.dirname(__file__), '..', assignment)
+    spec = importlib.util.spec_from_file_location(f'{assignment}_{name}',
+                                                  os.path.join(directory, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
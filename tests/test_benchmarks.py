@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.benchmarks import pass_effect, with_prelude
+from cs3020_support.dead_code import DeadCodeEliminator
+
+from helpers import generated_program
+
+def text_compiler():
+    """
+    A stand-in for a compiler module whose run_compiler returns assembly
+    text even with emit_asm=False, as a7's does. Its "source programs" are
+    seeds of generated pseudo-x86 programs.
+    """
+    compiler = SimpleNamespace()
+    compiler.compiler_passes = {
+        'select instructions': lambda seed: generated_program(12, 3, seed, True),
+        'prelude & conclusion': lambda program: with_prelude(program.blocks),
+        'print x86': x86.print_x86,
+    }
+
+    def run_compiler(program, logging=False, emit_asm=True):
+        for pass_fn in compiler.compiler_passes.values():
+            program = pass_fn(program)
+        return program
+    compiler.run_compiler = run_compiler
+    return compiler
+
+@pytest.mark.parametrize('seed', range(3))
+def test_pass_effect_on_assembly_text(seed):
+    df = pass_effect(text_compiler(), 'remove dead code', DeadCodeEliminator(),
+                     'prelude & conclusion', [(f'seed {seed}', seed)])
+    row = df.iloc[0]
+    assert row['same_output']
+    assert row['instrs_after'] < row['instrs']
+    assert row['executed_after'] < row['executed']
@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from cs3020_support.cfg import CFGSimplifier, successors
+
+from helpers import load_assignment_module
+
+cif = load_assignment_module('a4', 'cif')
+cif_defs = load_assignment_module('a7', 'cif')
+
+# Programs stop after printing this many values, or after this many steps
+# without printing, so that both loops that print forever and loops that
+# never print can be compared
+MAX_PRINTS = 50
+MAX_STEPS = 10**4
+
+def run_cif(blocks, entry: str) -> list:
+    """
+    Runs the blocks of a random CFG (see random_blocks) from the entry
+    block, and returns the values printed, followed by 'stuck' if the
+    program loops without printing.
+    """
+    x = 0
+    output = []
+    label = entry
+    steps = 0
+    while True:
+        for s in blocks[label]:
+            steps += 1
+            if steps > MAX_STEPS:
+                return output + ['stuck']
+            match type(s).__name__:
+                case 'Assign':
+                    x += s.exp.args[1].val
+                case 'Print':
+                    output.append(x)
+                    steps = 0
+                    if len(output) == MAX_PRINTS:
+                        return output
+                case 'Return':
+                    return output
+                case 'Goto':
+                    label = s.label
+                    break
+                case 'If':
+                    label = (s.then_branch if x < s.test.args[1].val else s.else_branch).label
+                    break
+        else:
+            raise Exception('block does not end with a jump', label)
+
+def random_blocks(cif, rng: random.Random, n: int, prefix: str = '') -> dict:
+    """
+    A random CFG on one variable x, with gotos and ifs between any blocks
+    (including loops, empty blocks and unreachable blocks). As from explicate
+    control, the entry block comes last.
+    """
+    x = cif.Var('x')
+    labels = [f'{prefix}start'] + [f'{prefix}block_{k}' for k in range(n)]
+    blocks = {}
+    for label in labels[1:] + labels[:1]:
+        stmts = [rng.choice([cif.Assign('x', cif.Prim('add', [x, cif.Constant(1)])),
+                             cif.Print(x)])
+                 for _ in range(rng.choice([0, 0, 1, 2]))]
+        r = rng.random()
+        if r < 0.15:
+            stmts.append(cif.Return(cif.Constant(0)))
+        elif r < 0.6:
+            stmts.append(cif.Goto(rng.choice(labels)))
+        else:
+            stmts.append(cif.If(cif.Prim('lt', [x, cif.Constant(rng.randint(0, 10))]),
+                                cif.Goto(rng.choice(labels)), cif.Goto(rng.choice(labels))))
+        blocks[label] = stmts
+    return blocks
+
+@pytest.mark.parametrize('seed', range(300))
+def test_simplified_program_prints_the_same(seed):
+    rng = random.Random(seed)
+    program = cif.CProgram(random_blocks(cif, rng, rng.randint(1, 12)))
+    simplifier = CFGSimplifier()
+    simplified = simplifier(program)
+    blocks = simplified.blocks
+
+    assert next(iter(blocks)) == 'start'
+    assert all(label in blocks for stmts in blocks.values() for label in successors(stmts))
+    assert run_cif(blocks, 'start') == run_cif(program.blocks, 'start')
+    assert sum(map(len, blocks.values())) <= sum(map(len, program.blocks.values()))
+
+@pytest.mark.parametrize('seed', range(50))
+def test_functions(seed):
+    rng = random.Random(seed)
+    defs = [cif_defs.CFunctionDef(name, [], random_blocks(cif_defs, rng, rng.randint(1, 8), name))
+            for name in ('main', 'f')]
+    simplified = CFGSimplifier()(cif_defs.CProgram(defs))
+    for d, new in zip(defs, simplified.defs):
+        assert new.name == d.name
+        assert next(iter(new.blocks)) == f'{d.name}start'
+        assert run_cif(new.blocks, f'{d.name}start') == run_cif(d.blocks, f'{d.name}start')
+
+def test_straight_line_blocks_are_merged():
+    x = cif.Var('x')
+    program = cif.CProgram({
+        'block_2': [cif.Print(x), cif.Return(cif.Constant(0))],
+        'block_1': [cif.Goto('block_2')],
+        'start': [cif.Assign('x', cif.Prim('add', [x, cif.Constant(1)])), cif.Goto('block_1')],
+    })
+    simplifier = CFGSimplifier()
+    simplified = simplifier(program)
+    assert simplified.blocks == {'start': [cif.Assign('x', cif.Prim('add', [x, cif.Constant(1)])),
+                                           cif.Print(x), cif.Return(cif.Constant(0))]}
+    assert simplifier.changes['threaded'] == 1
+    assert simplifier.changes['merged'] == 1
@@ -0,0 +1,88 @@
+import ast
+
+import pytest
+
+from cs3020_support.closure_interpreter import ClosureCompiler
+from cs3020_support.limits import ExecutionLimitExceeded, ExecutionLimits
+from cs3020_support.program_gen import ASSIGNMENT_LANGUAGES, ProgramShape, generate_program
+
+from helpers import load_assignment_module
+
+# The reference interpreter of each language, with its closure-compiled version
+ASSIGNMENTS = ['a4', 'a5', 'a6', 'a7']
+INTERPRETERS = {ASSIGNMENT_LANGUAGES[a]: load_assignment_module(a, 'interpreter')
+                for a in ASSIGNMENTS}
+
+INFINITE_LOOP = '''x = 0
+while x < 1:
+    x = x + 0
+    print(x)
+'''
+
+def outcome(eval_fn, tree, limits):
+    # the values printed, or where the program was stopped
+    try:
+        return eval_fn(tree, limits=limits)
+    except ExecutionLimitExceeded as e:
+        return e.reason, e.steps, e.lineno
+
+@pytest.mark.parametrize('language', list(INTERPRETERS))
+@pytest.mark.parametrize('seed', range(5))
+def test_same_outputs_and_steps(language, seed):
+    interpreter = INTERPRETERS[language]
+    tree = ast.parse(generate_program(language, ProgramShape(depth=2), seed))
+    expected = interpreter.eval_Lif(tree)
+    assert interpreter.eval_Lif_compiled(tree) == expected
+    # the same budgets stop both interpreters at the same statement
+    for max_steps in (1, 10, 100, 1000, 10**7):
+        limits = ExecutionLimits(max_steps)
+        assert outcome(interpreter.eval_Lif_compiled, tree, limits) == \
+            outcome(interpreter.eval_Lif, tree, limits)
+
+@pytest.mark.parametrize('language', ['Lwhile', 'Ltup', 'Lfun'])
+def test_infinite_loop_is_stopped(language):
+    interpreter = INTERPRETERS[language]
+    tree = ast.parse(INFINITE_LOOP)
+    limits = ExecutionLimits(max_steps=10000)
+    with pytest.raises(ExecutionLimitExceeded) as e:
+        interpreter.eval_Lif_compiled(tree, limits=limits)
+    assert e.value.reason == 'steps' and e.value.steps == 10000
+    assert outcome(interpreter.eval_Lif, tree, limits) == ('steps', 10000, e.value.lineno)
+
+    with pytest.raises(ExecutionLimitExceeded) as e:
+        interpreter.eval_Lif_compiled(tree, limits=ExecutionLimits(seconds=0.05))
+    assert e.value.reason == 'time'
+
+# g reads y, which f does not mention: it comes from the frame of the
+# caller of f (the top level, or h, which has its own y)
+NESTED_CALLS = '''def g(a: int) -> int:
+    return a + y
+def f(x: int) -> int:
+    z = x + 1
+    return g(z)
+def h(n: int) -> int:
+    y = 100
+    return f(n)
+def count(n: int) -> int:
+    if n == 0:
+        return y
+    else:
+        return 1 + count(n - 1)
+y = 10
+print(f(1))
+print(h(1))
+print(count(5))
+y = 20
+print(f(2))
+'''
+
+def test_calls_find_variables_in_the_calls_in_progress():
+    interpreter = INTERPRETERS['Lfun']
+    tree = ast.parse(NESTED_CALLS)
+    assert interpreter.eval_Lif_compiled(tree) == interpreter.eval_Lif(tree) == [12, 102, 15, 23]
+
+def test_functions_have_their_own_slots():
+    # a call copies the callee's variables, not those of the whole program
+    compiler = ClosureCompiler('Lfun')
+    compiler.compile_stmts(ast.parse(NESTED_CALLS).body)
+    assert list(compiler.slots) == ['g', 'f', 'h', 'count', 'y']
@@ -0,0 +1,77 @@
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.coloring import move_related, register_colors
+from cs3020_support.liveness import Liveness
+from cs3020_support.register_allocation import (allocate_homes, apply_homes, build_interference,
+                                                coalesce, coalescing_allocation, find_alias,
+                                                remove_self_moves)
+
+from helpers import (CALLEE_SAVED_REGISTERS, CALLER_SAVED_REGISTERS, PROGRAM_SHAPES,
+                     generated_program, shape_id)
+
+COLORS = register_colors(CALLER_SAVED_REGISTERS, CALLEE_SAVED_REGISTERS)
+NUM_REGISTERS = sum(1 for c in COLORS.values() if c >= 0)
+
+def test_find_alias():
+    a, b, c, d = (x86.Var(v) for v in 'abcd')
+    alias = {c: b, b: a}
+    assert find_alias(alias, c) == a
+    assert find_alias(alias, b) == a
+    assert find_alias(alias, a) == a
+    assert find_alias(alias, d) == d
+
+def test_remove_self_moves():
+    rcx, rdx = x86.Reg('rcx'), x86.Reg('rdx')
+    blocks = {'start': [x86.Movq(rcx, rcx), x86.Addq(rcx, rcx), x86.Movq(rcx, rdx),
+                        x86.Movq(rdx, rdx), x86.Jmp('conclusion')]}
+    new_blocks, removed = remove_self_moves(blocks)
+    assert removed == 2
+    assert new_blocks == {'start': [x86.Addq(rcx, rcx), x86.Movq(rcx, rdx), x86.Jmp('conclusion')]}
+
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES, ids=shape_id)
+def test_never_merges_interfering_nodes(shape):
+    liveness = Liveness(generated_program(*shape).blocks)
+    original = build_interference(liveness)
+    graph = build_interference(liveness)
+    moves = move_related(liveness.blocks)
+    alias = coalesce(graph, moves, COLORS, NUM_REGISTERS)
+
+    groups = {}
+    for a in original.get_nodes():
+        groups.setdefault(find_alias(alias, a), set()).add(a)
+    for root, group in groups.items():
+        assert root not in alias
+        for a in group:
+            assert not original.neighbors(a) & group, (a, group)
+            if type(a).__name__ == 'Reg':
+                # registers are never merged into each other or away
+                assert a == root and len([b for b in group if type(b).__name__ == 'Reg']) == 1
+        # the merged node interferes with what any member did
+        assert graph.neighbors(root) == {find_alias(alias, b) for a in group
+                                         for b in original.neighbors(a)}
+
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES, ids=shape_id)
+def test_coalesced_coloring(shape):
+    blocks = generated_program(*shape).blocks
+    liveness = Liveness(blocks)
+    graph = build_interference(liveness)
+    coloring = coalescing_allocation(liveness, COLORS)
+    for a, b in graph.edges():
+        if a in coloring and b in coloring:
+            assert coloring[a] != coloring[b], (a, b)
+
+def test_move_becomes_self_move():
+    # a is dead after "movq a, b", so the two can share a home, and b can
+    # live in %rdi
+    a, b = x86.Var('a'), x86.Var('b')
+    blocks = {'start': [x86.Movq(x86.Immediate(1), a),
+                        x86.Movq(a, b),
+                        x86.Addq(x86.Immediate(2), b),
+                        x86.Movq(b, x86.Reg('rdi')),
+                        x86.Callq('print_int'),
+                        x86.Jmp('conclusion')]}
+    allocation = allocate_homes(blocks, CALLER_SAVED_REGISTERS, CALLEE_SAVED_REGISTERS, 'coalescing')
+    assert allocation.homes[a] == allocation.homes[b] == x86.Reg('rdi')
+    _, removed = remove_self_moves(apply_homes(blocks, allocation.homes))
+    assert removed == 2
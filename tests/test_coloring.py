@@ -0,0 +1,59 @@
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.benchmarks import interval_graph
+from cs3020_support.coloring import (HEURISTICS, color_graph, count_moves_removed, count_spills,
+                                     precolor_registers, register_colors)
+from cs3020_support.interference_graph import BitsetInterferenceGraph
+
+from helpers import CALLEE_SAVED_REGISTERS, CALLER_SAVED_REGISTERS
+
+def assert_proper(graph, coloring):
+    for a, b in graph.edges():
+        assert coloring[a] != coloring[b], (a, b)
+
+@pytest.mark.parametrize('heuristic', list(HEURISTICS))
+@pytest.mark.parametrize('n', [1, 10, 200, 1000])
+def test_proper_coloring(heuristic, n):
+    graph, moves = interval_graph(n, max_live=20, seed=n)
+    for m in (None, moves):
+        coloring = color_graph(graph, moves=m, heuristic=heuristic, num_registers=13)
+        assert set(coloring) == graph.get_nodes()
+        assert_proper(graph, coloring)
+        assert min(coloring.values()) >= 0
+        # each node takes the lowest free color, or a neighbor's free one
+        assert max(coloring.values()) <= max(graph.degrees().values())
+
+def test_precolored_registers():
+    colors = register_colors(CALLER_SAVED_REGISTERS, CALLEE_SAVED_REGISTERS)
+    graph, _ = interval_graph(100, max_live=20, seed=1)
+    registers = [x86.Reg(r) for r in ['rax', 'rcx', 'rdx', 'rbx']]
+    variables = sorted(graph.get_nodes(), key=str)
+    for k, r in enumerate(registers):
+        graph.add_interference([r], variables[k::3])
+
+    nodes = list(graph.get_nodes())
+    precolored = precolor_registers(nodes, colors)
+    assert precolored == {r: colors[r.val] for r in registers}
+    coloring = color_graph(graph, nodes, precolored=precolored)
+    assert all(coloring[r] == colors[r.val] for r in registers)
+    assert_proper(graph, coloring)
+
+def test_move_biasing():
+    # x and z interfere; y is free to take either color, and is moved to z
+    x, y, z = x86.Var('x'), x86.Var('y'), x86.Var('z')
+    graph = BitsetInterferenceGraph()
+    graph.add_node(y)
+    graph.add_edge(x, z)
+    moves = {y: {z}, z: {y}}
+
+    coloring = color_graph(graph, [x, y, z])
+    assert count_moves_removed(coloring, moves) == 0
+    coloring = color_graph(graph, [x, y, z], moves=moves)
+    assert coloring[y] == coloring[z]
+    assert count_moves_removed(coloring, moves) == 1
+
+    # with one register, z is spilled; y should not follow it to the stack
+    coloring = color_graph(graph, [x, y, z], moves=moves, num_registers=1)
+    assert coloring[y] == 0
+    assert count_spills(coloring, 1) == 1
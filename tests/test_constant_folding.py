@@ -0,0 +1,132 @@
+import ast
+import glob
+import os
+
+import pytest
+
+from cs3020_support.constant_folding import ConstantFolder
+from cs3020_support.limits import ExecutionLimits
+from cs3020_support.program_gen import ASSIGNMENT_LANGUAGES, ProgramShape, generate_program
+from cs3020_support.python import parse
+from cs3020_support.python_ast import *
+
+from helpers import load_assignment_module
+
+# The folded program is printed back to Python and run by the reference
+# interpreter of the assignment whose language it is in, like the original
+
+# The interpreter of each language (a4's handles Lvar too)
+INTERPRETERS = {language: load_assignment_module(assignment, 'interpreter').eval_Lif
+                for language, assignment in [('Lvar', 'a4'), ('Lif', 'a4'), ('Lwhile', 'a5'),
+                                             ('Ltup', 'a6'), ('Lfun', 'a7')]}
+
+MAX_STEPS = 10**6
+
+OPERATORS = {'add': '+', 'sub': '-', 'mult': '*',
+             'eq': '==', 'noteq': '!=', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>=',
+             'and': 'and', 'or': 'or'}
+
+def to_python(program: Program) -> str:
+    """
+    Prints a program as Python source, which the reference interpreters can
+    run (print_program prints primitives as calls, e.g. add(x, 1)).
+    Negations are printed as subtractions, which every interpreter has.
+    """
+    def type_name(t):
+        # the interpreters ignore annotations, but they must parse
+        if isinstance(t, tuple):
+            return '(' + ', '.join(type_name(a) for a in t) + ',)'
+        return t if isinstance(t, str) else getattr(t, '__name__', str(t))
+
+    def stmts(body, indent):
+        return '\n'.join(stmt(s, indent) for s in body) or ' ' * indent + 'pass'
+
+    def stmt(s, indent):
+        pad = ' ' * indent
+        match s:
+            case Print(e):
+                return f'{pad}print({expr(e)})'
+            case Return(e):
+                return f'{pad}return {expr(e)}'
+            case Assign(x, e):
+                return f'{pad}{x} = {expr(e)}'
+            case If(e, then_stmts, else_stmts):
+                return (f'{pad}if {expr(e)}:\n{stmts(then_stmts, indent + 4)}\n'
+                        f'{pad}else:\n{stmts(else_stmts, indent + 4)}')
+            case While(e, body):
+                return f'{pad}while {expr(e)}:\n{stmts(body, indent + 4)}'
+            case FunctionDef(name, params, body, return_type):
+                params_s = ', '.join(f'{x}: {type_name(t)}' for x, t in params)
+                return (f'{pad}def {name}({params_s}) -> {type_name(return_type)}:\n'
+                        f'{stmts(body, indent + 4)}')
+            case _:
+                raise Exception('to_python', s)
+
+    def expr(e):
+        match e:
+            case Prim('usub', [a]):
+                return f'(0 - {expr(a)})'
+            case Prim('not', [a]):
+                return f'(not {expr(a)})'
+            case Prim('tuple', args):
+                return '(' + ''.join(f'{expr(a)}, ' for a in args) + ')'
+            case Prim('subscript', [a, b]):
+                return f'{expr(a)}[{expr(b)}]'
+            case Prim(op, [a, b]):
+                return f'({expr(a)} {OPERATORS[op]} {expr(b)})'
+            case Constant(c) if type(c) is int and c < 0:
+                return f'(0 - {-c})'
+            case Constant(c):
+                return repr(c)
+            case Var(x):
+                return x
+            case Call(f, args):
+                return f'{expr(f)}({", ".join(expr(a) for a in args)})'
+            case _:
+                raise Exception('to_python', e)
+
+    return '\n'.join(stmt(s, 0) for s in program.stmts) + '\n'
+
+def run(source: str, language: str) -> list:
+    return INTERPRETERS[language](ast.parse(source), limits=ExecutionLimits(MAX_STEPS))
+
+def count_prims(program: Program) -> int:
+    return sum(1 for node in walk(program) if isinstance(node, Prim)
+               and node.op not in ('tuple', 'subscript'))
+
+def walk(node):
+    yield node
+    for value in vars(node).values() if isinstance(node, AST) else ():
+        for child in value if isinstance(value, list) else [value]:
+            if isinstance(child, AST):
+                yield from walk(child)
+
+def check_folding(source: str, language: str):
+    program = parse(source)
+    folder = ConstantFolder()
+    folded = folder(program)
+    assert run(to_python(folded), language) == run(source, language)
+    assert count_prims(folded) <= count_prims(program)
+    return folder
+
+@pytest.mark.parametrize('language', list(INTERPRETERS))
+@pytest.mark.parametrize('seed', range(10))
+def test_generated_programs(language, seed):
+    source = generate_program(language, ProgramShape(depth=2), seed)
+    folder = check_folding(source, language)
+    assert sum(folder.changes.values()) > 0
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+TEST_PROGRAMS = sorted(os.path.relpath(p, ROOT)
+                       for p in glob.glob(os.path.join(ROOT, 'a[2-7]', 'tests', '*.py')))
+
+@pytest.mark.parametrize('path', TEST_PROGRAMS)
+def test_assignment_test_programs(path):
+    assignment = path.split(os.sep)[0]
+    with open(os.path.join(ROOT, path)) as f:
+        check_folding(f.read(), ASSIGNMENT_LANGUAGES[assignment])
+
+def test_folds_to_constants():
+    folded = ConstantFolder()(parse('x = 2 + 3\ny = x * 4\nif y > 10:\n    print(y)\nelse:\n    print(0)\n'))
+    assert folded == Program([Assign('x', Constant(5)), Assign('y', Constant(20)),
+                              Print(Constant(20))])
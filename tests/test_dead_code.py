@@ -0,0 +1,72 @@
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.benchmarks import with_prelude
+from cs3020_support.dead_code import DeadCodeEliminator
+
+from helpers import PROGRAM_SHAPES, allocate, generated_program, run_counted, run_x86, shape_id
+
+a, b, c = x86.Var('a'), x86.Var('b'), x86.Var('c')
+
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES, ids=shape_id)
+def test_optimized_program_prints_the_same(shape):
+    program = generated_program(*shape)
+    eliminator = DeadCodeEliminator()
+    optimized = eliminator(program)
+    output, executed = run_counted(with_prelude(program.blocks))
+    output_after, executed_after = run_counted(with_prelude(optimized.blocks))
+    assert output_after == output
+    # generated programs overwrite some variables before reading them
+    assert eliminator.removed > 0
+    assert executed_after < executed
+    assert sum(map(len, optimized.blocks.values())) == \
+        sum(map(len, program.blocks.values())) - eliminator.removed
+
+    # the pass runs before register allocation
+    assert run_x86(allocate(optimized.blocks)) == output
+
+    # the result is a fixpoint
+    again = DeadCodeEliminator()
+    assert again(optimized) == optimized and again.removed == 0
+
+def test_dead_chain_across_blocks():
+    # b is only computed from a to compute c, which is never read
+    blocks = {
+        'start': [x86.Movq(x86.Immediate(1), a),
+                  x86.Movq(a, b),
+                  x86.Jmp('next')],
+        'next': [x86.Movq(b, c),
+                 x86.Addq(x86.Immediate(2), c),
+                 x86.Movq(x86.Immediate(3), x86.Reg('rdi')),
+                 x86.Callq('print_int'),
+                 x86.Jmp('conclusion')],
+    }
+    eliminator = DeadCodeEliminator()
+    optimized = eliminator(x86.X86Program(blocks))
+    assert optimized.blocks == {'start': [x86.Jmp('next')],
+                                'next': blocks['next'][2:]}
+    assert eliminator.removed == 4
+
+def test_keeps_flags_that_are_read():
+    # cmpq writes no variable, but the jump reads its flags
+    blocks = {
+        'start': [x86.Movq(x86.Immediate(1), a),
+                  x86.Cmpq(x86.Immediate(0), a),
+                  x86.JmpIf('e', 'conclusion'),
+                  x86.Movq(x86.Immediate(1), x86.Reg('rdi')),
+                  x86.Callq('print_int'),
+                  x86.Jmp('conclusion')],
+    }
+    eliminator = DeadCodeEliminator()
+    assert eliminator(x86.X86Program(blocks)).blocks == blocks
+    assert eliminator.removed == 0
+
+def test_keeps_flags_set_before_a_jump():
+    # the flags may be read where the jump goes
+    blocks = {
+        'start': [x86.Movq(x86.Immediate(1), a),
+                  x86.Addq(x86.Immediate(2), a),
+                  x86.Jmp('conclusion')],
+    }
+    eliminator = DeadCodeEliminator()
+    assert eliminator(x86.X86Program(blocks)).blocks == blocks
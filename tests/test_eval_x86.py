@@ -0,0 +1,161 @@
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.benchmarks import with_prelude
+from cs3020_support.eval_x86 import X86Emulator
+from cs3020_support.limits import ExecutionLimits
+
+from helpers import MAX_STEPS, PROGRAM_SHAPES, allocate, generated_program, shape_id
+
+def table(df):
+    return [tuple(row) for row in df.itertuples(index=False)]
+
+def test_instruction_snippets_use_the_original_addresses():
+    # as in the notebook exercises: unset words and registers are None,
+    # and the stack starts at 1000
+    emu = X86Emulator(logging=False)
+    df = emu.eval_instructions('movq $5, %rax\npushq %rax\nmovq $3, -16(%rbp)')
+    assert table(df) == [('mem 992', None, 5), ('mem 984', None, 3),
+                         ('reg rsp', 1000, 992), ('reg rax', None, 5)]
+    # the state carries over to the next snippet
+    assert table(emu.eval_instructions('popq %rcx')) == [('reg rsp', 992, 1000),
+                                                         ('reg rcx', None, 5)]
+
+def test_instruction_snippets_in_flat_memory():
+    df = X86Emulator(logging=False, memory='flat').eval_instructions('pushq $7')
+    top = 2**20
+    assert table(df) == [(f'mem {top - 8}', None, 7), ('reg rsp', top, top - 8)]
+
+# ==================================================
+# Whole programs: text and AST, flat and dictionary memory
+# ==================================================
+
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES, ids=shape_id)
+def test_program_forms_and_memory_models_agree(shape):
+    blocks = generated_program(*shape).blocks
+    for program in (with_prelude(blocks), allocate(blocks)):
+        text = x86.print_x86(program)
+        outputs = [X86Emulator(logging=False, memory=memory, limits=ExecutionLimits(MAX_STEPS))
+                   .eval_program(p)
+                   for memory in ('flat', 'dict') for p in (program, text)]
+        assert outputs[1:] == outputs[:1] * 3
+        assert outputs[0]
+
+# ==================================================
+# Garbage collection
+# ==================================================
+
+def allocate_tuple(label: str, size: int, next_label: str) -> str:
+    # as the compilers do it: call collect if the tuple does not fit in
+    # fromspace, then bump free_ptr; the tuple's address is left in %r11
+    return f'''
+{label}:
+  movq free_ptr(%rip), %rax
+  addq ${size}, %rax
+  movq fromspace_end(%rip), %rcx
+  cmpq %rcx, %rax
+  jle {label}_ok
+  movq %r15, %rdi
+  movq ${size}, %rsi
+  callq collect
+  jmp {label}_ok
+{label}_ok:
+  movq free_ptr(%rip), %r11
+  addq ${size}, free_ptr(%rip)
+  jmp {next_label}
+'''
+
+# Builds a linked list of N tuples (i, h, next) in a 64-byte heap, where h
+# is the address fromspace started at (an integer the collector must not
+# treat as a pointer, since the tag says it is not one), and allocates a
+# garbage tuple (i,) before each node. The list's head is a root; so is
+# node 5, which must stay shared with the list. At the end, node 5's first
+# field is set to 100 through the second root, and the list is printed.
+N = 20
+NODE_TAG = (0b100 << 7) | (3 << 1) | 1
+GARBAGE_TAG = (1 << 1) | 1
+LINKED_LIST = f'''
+  .globl main
+main:
+  pushq %rbp
+  movq %rsp, %rbp
+  pushq %rbx
+  pushq %r12
+  movq $16384, %rdi
+  movq $64, %rsi
+  callq initialize
+  movq rootstack_begin(%rip), %r15
+  movq $0, 0(%r15)
+  movq $0, 8(%r15)
+  addq $16, %r15
+  movq fromspace_begin(%rip), %r12
+  movq $0, %rbx
+  jmp loop
+loop:
+  cmpq ${N}, %rbx
+  jl garbage
+  jmp walk
+{allocate_tuple('garbage', 16, 'fill_garbage')}
+fill_garbage:
+  movq ${GARBAGE_TAG}, 0(%r11)
+  movq %rbx, 8(%r11)
+  jmp node
+{allocate_tuple('node', 32, 'fill_node')}
+fill_node:
+  movq ${NODE_TAG}, 0(%r11)
+  movq %rbx, 8(%r11)
+  movq %r12, 16(%r11)
+  movq -16(%r15), %rax
+  movq %rax, 24(%r11)
+  movq %r11, -16(%r15)
+  cmpq $5, %rbx
+  je keep
+  jmp next
+keep:
+  movq %r11, -8(%r15)
+  jmp next
+next:
+  addq $1, %rbx
+  jmp loop
+walk:
+  movq -8(%r15), %rax
+  movq $100, 8(%rax)
+  movq -16(%r15), %rbx
+  jmp walk_test
+walk_test:
+  cmpq $0, %rbx
+  je done
+  movq 8(%rbx), %rdi
+  callq print_int
+  movq 16(%rbx), %rdi
+  callq print_int
+  movq 24(%rbx), %rbx
+  jmp walk_test
+done:
+  subq $16, %r15
+  movq $0, %rax
+  popq %r12
+  popq %rbx
+  popq %rbp
+  retq
+'''
+
+@pytest.mark.parametrize('memory', ['flat', 'dict'])
+def test_collector_keeps_linked_tuples(memory):
+    emu = X86Emulator(logging=False, memory=memory, limits=ExecutionLimits(MAX_STEPS))
+    output = emu.eval_program(LINKED_LIST)
+    h = emu.layout.heap_begin
+    expected = []
+    for i in reversed(range(N)):
+        expected += [100 if i == 5 else i, h]
+    assert output == expected
+
+    stats = emu.gc_stats()
+    assert stats.collections >= 5
+    # the list outgrows the heap, which is grown by doubling
+    assert stats.heap_resizes >= 1
+    assert stats.heap_size >= 32 * N and stats.heap_size & (stats.heap_size - 1) == 0
+    # at least the live list is copied by the last collection, and never
+    # the garbage of earlier iterations more than once
+    assert 32 <= stats.bytes_copied <= stats.collections * 32 * N
+    assert stats.bytes_requested >= 16 * stats.collections
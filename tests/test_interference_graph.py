@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.interference_graph import BitsetInterferenceGraph, iter_bits
+from cs3020_support.liveness import Liveness, reads_writes
+from cs3020_support.register_allocation import build_interference
+
+from helpers import PROGRAM_SHAPES, generated_program, load_assignment_module, shape_id
+
+# the InterferenceGraph class the assignments use, as the reference
+InterferenceGraph = load_assignment_module('a3', 'interference_graph').InterferenceGraph
+
+def random_graphs(seed: int, n: int = 30):
+    """
+    Builds the same random graph in a BitsetInterferenceGraph and in the
+    assignments' InterferenceGraph, with add_edge, add_interference and
+    add_clique.
+    """
+    rng = random.Random(seed)
+    nodes = [x86.Var(f'v{k}') for k in range(n)] + [x86.Reg('rax'), x86.Reg('rcx')]
+    graph, reference = BitsetInterferenceGraph(), InterferenceGraph()
+    for a in nodes:
+        graph.add_node(a)
+    for _ in range(40):
+        r = rng.random()
+        if r < 0.5:
+            a, b = rng.choice(nodes), rng.choice(nodes)
+            graph.add_edge(a, b)
+            reference.add_edge(a, b)
+        elif r < 0.9:
+            written, live = rng.sample(nodes, 2), rng.sample(nodes, rng.randint(0, 8))
+            graph.add_interference(written, live)
+            for w in written:
+                for v in live:
+                    reference.add_edge(w, v)
+        else:
+            clique = rng.sample(nodes, rng.randint(2, 5))
+            graph.add_clique(clique)
+            for a in clique:
+                for b in clique:
+                    reference.add_edge(a, b)
+    return nodes, graph, reference
+
+def test_iter_bits():
+    rng = random.Random(0)
+    for _ in range(200):
+        bits = rng.getrandbits(rng.randint(0, 300))
+        assert list(iter_bits(bits)) == [k for k in range(bits.bit_length()) if bits >> k & 1]
+
+@pytest.mark.parametrize('seed', range(10))
+def test_same_graph_as_assignment_class(seed):
+    nodes, graph, reference = random_graphs(seed)
+    assert graph.get_nodes() == set(nodes)
+    for a in nodes:
+        assert graph.neighbors(a) == reference.neighbors(a)
+        assert graph.degree(a) == len(reference.neighbors(a))
+        for b in nodes:
+            assert graph.interferes(a, b) == (b in reference.neighbors(a))
+
+    edges = list(graph.edges())
+    assert len(edges) == graph.num_edges()
+    assert {frozenset(e) for e in edges} == {frozenset((a, b)) for a in nodes
+                                            for b in reference.neighbors(a)}
+
+@pytest.mark.parametrize('seed', range(10))
+def test_merge(seed):
+    nodes, graph, reference = random_graphs(seed)
+    a, b = nodes[0], nodes[1]
+    expected = (reference.neighbors(a) | reference.neighbors(b)) - {a, b}
+    graph.merge(a, b)
+
+    assert graph.neighbors(a) == expected
+    assert b not in graph.get_nodes()
+    assert graph.neighbors(b) == set()
+    for c in nodes[2:]:
+        assert b not in graph.neighbors(c)
+        assert (a in graph.neighbors(c)) == (c in expected)
+    assert graph.degrees() == {c: len(graph.neighbors(c)) for c in graph.get_nodes()}
+
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES[::4], ids=shape_id)
+def test_build_interference(shape):
+    # the usual rule, written out with the assignment's graph: each location
+    # written by an instruction interferes with each location live after it,
+    # except the source of a movq
+    program = generated_program(*shape)
+    liveness = Liveness(program.blocks)
+    reference = InterferenceGraph()
+    for label, instrs in program.blocks.items():
+        for instr, after in zip(instrs, liveness.live_after(label)):
+            if type(instr).__name__ in ('Jmp', 'JmpIf'):
+                continue
+            _, writes = reads_writes(instr)
+            for w in writes:
+                for v in after:
+                    if not (isinstance(instr, x86.Movq) and v == instr.a1):
+                        reference.add_edge(w, v)
+
+    graph = build_interference(liveness)
+    for a in liveness.locations:
+        assert graph.neighbors(a) == reference.neighbors(a)
@@ -0,0 +1,94 @@
+import random
+
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.benchmarks import random_x86_ast
+from cs3020_support.liveness import Liveness, live_after_sets, reads_writes
+
+from helpers import PROGRAM_SHAPES, generated_program, shape_id
+
+# instructions after which the rest of the block never runs
+ENDS_BLOCK = ('Jmp', 'Retq', 'TailJmp', 'IndirectJmp')
+
+def naive_liveness(blocks, live_at_exit=None):
+    """
+    The textbook analysis, on sets: visit every instruction of every block
+    backwards, until no block's live-before set changes.
+    :return: The live-before set of each block, and the live-after set of
+    each instruction.
+    """
+    live_at_exit = live_at_exit or {}
+    live_in = {label: set() for label in blocks}
+
+    def target_live(label):
+        return live_in[label] if label in blocks else set(live_at_exit.get(label, ()))
+
+    changed = True
+    while changed:
+        changed = False
+        after_sets = {}
+        for label, instrs in blocks.items():
+            live = set()
+            afters = []
+            for i in reversed(instrs):
+                name = type(i).__name__
+                if name in ENDS_BLOCK:
+                    # what follows is unreachable
+                    live = set()
+                afters.append(live)
+                if name == 'Jmp':
+                    live = set(target_live(i.label))
+                elif name == 'JmpIf':
+                    live = live | target_live(i.label)
+                else:
+                    reads, writes = reads_writes(i)
+                    live = (live - set(writes)) | set(reads)
+            after_sets[label] = afters[::-1]
+            if live != live_in[label]:
+                live_in[label] = live
+                changed = True
+    return live_in, after_sets
+
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES, ids=shape_id)
+def test_generated_programs(shape):
+    blocks = generated_program(*shape).blocks
+    exit_live = {'conclusion': [x86.Reg('rax')]}
+    live_in, after_sets = naive_liveness(blocks, exit_live)
+    liveness = Liveness(blocks, exit_live)
+    for label in blocks:
+        assert liveness.live_before_block(label) == live_in[label]
+        assert liveness.live_after(label) == after_sets[label]
+    assert live_after_sets(blocks, exit_live) == after_sets
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_programs(seed):
+    # every instruction form, jumps in the middle of blocks, and loops
+    # between any blocks
+    blocks = random_x86_ast(8, 12, seed).blocks
+    live_in, _ = naive_liveness(blocks)
+    liveness = Liveness(blocks)
+    for label in blocks:
+        assert liveness.live_before_block(label) == live_in[label]
+
+@pytest.mark.parametrize('seed', range(10))
+def test_incremental_updates(seed):
+    # after replacing or removing blocks, the analysis must agree with a
+    # fresh one of the new program
+    rng = random.Random(seed)
+    blocks = dict(generated_program(12, 3, seed, seed % 2 == 0).blocks)
+    liveness = Liveness(blocks)
+    for _ in range(10):
+        label = rng.choice(list(blocks))
+        instrs = list(blocks[label])
+        if rng.random() < 0.8 and len(instrs) > 1:
+            del instrs[rng.randrange(len(instrs) - 1)]
+            blocks[label] = instrs
+            liveness.update_block(label, instrs)
+        elif label != 'start':
+            del blocks[label]
+            liveness.remove_block(label)
+        live_in, after_sets = naive_liveness(blocks)
+        for label in blocks:
+            assert liveness.live_before_block(label) == live_in[label]
+            assert liveness.live_after(label) == after_sets[label]
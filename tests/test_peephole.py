@@ -0,0 +1,80 @@
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.benchmarks import with_prelude
+from cs3020_support.peephole import PeepholeOptimizer
+
+from cs3020_support.register_allocation import allocate_homes, apply_homes
+
+from helpers import (CALLEE_SAVED_REGISTERS, CALLER_SAVED_REGISTERS, PROGRAM_SHAPES,
+                     generated_program, run_counted, shape_id)
+
+def allocated_with_self_moves(blocks) -> x86.X86Program:
+    # as after prelude & conclusion, without patch instructions removing
+    # the self-moves, so the peephole pass has them to remove
+    allocation = allocate_homes(blocks, CALLER_SAVED_REGISTERS, CALLEE_SAVED_REGISTERS)
+    return with_prelude(apply_homes(blocks, allocation.homes), allocation)
+
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES, ids=shape_id)
+def test_optimized_program_prints_the_same(shape):
+    before = allocated_with_self_moves(generated_program(*shape).blocks)
+    optimizer = PeepholeOptimizer()
+    after = optimizer(before)
+    output_before, executed_before = run_counted(before)
+    output_after, executed_after = run_counted(after)
+    assert output_after == output_before
+    assert executed_after <= executed_before
+    # main always ends with a jump to start, the next block
+    assert optimizer.hits['jump to next block'] >= 1
+    assert executed_after < executed_before
+
+def test_compare_bool():
+    # the flags of cmpq i, $3 decide the loop, not those of cmpq $0, c
+    i, c = x86.Reg('rcx'), x86.Reg('rdx')
+    blocks = {
+        'start': [x86.Movq(x86.Immediate(0), i), x86.Jmp('body')],
+        'body': [x86.Addq(x86.Immediate(1), i),
+                 x86.Movq(i, x86.Reg('rdi')),
+                 x86.Callq('print_int'),
+                 x86.Cmpq(x86.Immediate(3), i),
+                 x86.Set('l', x86.ByteReg('al')),
+                 x86.Movzbq(x86.ByteReg('al'), c),
+                 x86.Cmpq(x86.Immediate(0), c),
+                 x86.JmpIf('e', 'end'),
+                 x86.Jmp('body')],
+        'end': [x86.Jmp('conclusion')],
+    }
+    before = with_prelude(blocks)
+    optimizer = PeepholeOptimizer()
+    after = optimizer(before)
+    assert optimizer.hits['compare bool'] == 1
+    # then "jmp end" jumps to the next block
+    assert after.blocks['body'][-2:] == [x86.Movzbq(x86.ByteReg('al'), c), x86.JmpIf('l', 'body')]
+    assert run_counted(after)[0] == run_counted(before)[0] == [1, 2, 3]
+
+def test_compare_bool_keeps_flags_read_at_a_target():
+    # "end" reads the flags of cmpq $0, c: rewriting the jumps would give
+    # it those of cmpq $3, i instead
+    i, c = x86.Reg('rcx'), x86.Reg('rdx')
+    blocks = {
+        'start': [x86.Movq(x86.Immediate(5), i),
+                  x86.Cmpq(x86.Immediate(3), i),
+                  x86.Set('l', x86.ByteReg('al')),
+                  x86.Movzbq(x86.ByteReg('al'), c),
+                  x86.Cmpq(x86.Immediate(0), c),
+                  x86.JmpIf('e', 'end'),
+                  x86.Jmp('other')],
+        'other': [x86.Jmp('conclusion')],
+        'end': [x86.Jmp('check')],
+        'check': [x86.Set('e', x86.ByteReg('al')),
+                  x86.Movzbq(x86.ByteReg('al'), x86.Reg('rdi')),
+                  x86.Callq('print_int'),
+                  x86.Jmp('conclusion')],
+    }
+    before = with_prelude(blocks)
+    optimizer = PeepholeOptimizer()
+    after = optimizer(before)
+    assert optimizer.hits['compare bool'] == 0
+    assert run_counted(after)[0] == run_counted(before)[0] == [1]
+    # without the blocks, the targets are unknown
+    assert PeepholeOptimizer().optimize_block(blocks['start']) == blocks['start']
@@ -0,0 +1,70 @@
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.liveness import Liveness
+from cs3020_support.register_allocation import (ALLOCATION_STRATEGIES, allocate_homes,
+                                                block_order, live_intervals)
+
+from helpers import (CALLEE_SAVED_REGISTERS, CALLER_SAVED_REGISTERS, PROGRAM_SHAPES,
+                     allocate, generated_program, run_blocks, run_x86, shape_id)
+
+i, c, a = x86.Var('i'), x86.Var('c'), x86.Var('a')
+
+def counting_loop(first, last):
+    """
+    A loop on i whose body ends with "jmp body", as when the loop test goes
+    through a boolean c; first and last are put at the start and the end of
+    the body. Nothing reads i after the loop.
+    """
+    return {
+        'start': [x86.Movq(x86.Immediate(0), i), x86.Jmp('body')],
+        'body': first + [x86.Addq(x86.Immediate(1), i),
+                         x86.Cmpq(x86.Immediate(3), i),
+                         x86.Set('l', x86.ByteReg('al')),
+                         x86.Movzbq(x86.ByteReg('al'), c),
+                         x86.Cmpq(x86.Immediate(0), c),
+                         x86.JmpIf('e', 'end')] + last + [x86.Jmp('body')],
+        'end': [x86.Jmp('conclusion')],
+    }
+
+@pytest.mark.parametrize('strategy', list(ALLOCATION_STRATEGIES))
+@pytest.mark.parametrize('shape', PROGRAM_SHAPES, ids=shape_id)
+def test_allocated_program_prints_the_same(strategy, shape):
+    program = generated_program(*shape)
+    assert run_x86(allocate(program.blocks, strategy)) == run_blocks(program.blocks)
+
+def test_interval_reaches_jump_back_to_loop():
+    # i is last read by "cmpq $3, i", but the jmp at the end of the body
+    # still needs it
+    blocks = counting_loop([], [])
+    liveness = Liveness(blocks)
+    order = block_order(liveness)
+    intervals, _ = live_intervals(liveness, order)
+    n = sum(len(blocks[label]) for label in order[:order.index('body') + 1])
+    interval = next(iv for iv in intervals if iv.location == i)
+    assert interval.end >= 2 * (n - 1)
+
+def test_linear_scan_keeps_loop_counter_and_test_apart():
+    allocation = allocate_homes(counting_loop([], []), CALLER_SAVED_REGISTERS,
+                                CALLEE_SAVED_REGISTERS, 'linear scan')
+    assert allocation.homes[i] != allocation.homes[c]
+
+def test_linear_scan_loop_from_review():
+    # used to give i0 and c0 the same register, so the loop never ended
+    program = generated_program(3, 1, 0, True)
+    allocation = allocate_homes(program.blocks, CALLER_SAVED_REGISTERS,
+                                CALLEE_SAVED_REGISTERS, 'linear scan')
+    assert allocation.homes[x86.Var('i0')] != allocation.homes[x86.Var('c0')]
+    assert run_x86(allocate(program.blocks, 'linear scan')) == run_blocks(program.blocks)
+
+def test_root_stack_slots_of_tuples_live_around_loop():
+    # t1 is read at the top of the body, and again on the next iteration;
+    # t2 is written afterwards, so it must not take t1's slot
+    t1, t2 = x86.VecVar('t1'), x86.VecVar('t2')
+    blocks = counting_loop([x86.Movq(t1, a)], [x86.Movq(a, t2), x86.Movq(t2, x86.Reg('rdi')),
+                                              x86.Callq('print_int')])
+    blocks['start'].insert(0, x86.Movq(x86.Immediate(7), t1))
+    for strategy in ALLOCATION_STRATEGIES:
+        allocation = allocate_homes(blocks, CALLER_SAVED_REGISTERS, CALLEE_SAVED_REGISTERS, strategy)
+        assert allocation.homes[t1] != allocation.homes[t2]
+        assert allocation.root_stack_slots == 2
@@ -0,0 +1,80 @@
+import ast
+import importlib.util
+import os
+import sys
+import time
+
+import pytest
+
+from cs3020_support.limits import ExecutionLimitExceeded, ExecutionLimits
+from cs3020_support.result_cache import ResultCache
+
+from helpers import load_assignment_module
+
+INTERPRETER = '''def eval_Lif(prog):
+    return {result}
+'''
+
+def load_interpreter(tmp_path, monkeypatch, result: str):
+    # writes and imports a module with an interpreter, as the runner would
+    path = tmp_path / 'toy_interpreter.py'
+    path.write_text(INTERPRETER.format(result=result))
+    spec = importlib.util.spec_from_file_location('toy_interpreter', path)
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, 'toy_interpreter', module)
+    spec.loader.exec_module(module)
+    return module.eval_Lif
+
+def test_key_changes_with_the_program_and_the_interpreter(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    interpreter = load_interpreter(tmp_path, monkeypatch, '[1]')
+    key = cache.key('print(1)', interpreter)
+    assert cache.key('print(1)', interpreter) == key
+    assert cache.key('print(2)', interpreter) != key
+
+    assert cache.lookup_or_run('print(1)', interpreter, lambda: [1]) == ([1], False)
+    assert cache.lookup_or_run('print(1)', interpreter, lambda: [1]) == ([1], True)
+
+    # after the interpreter is edited, its old results are not used
+    edited = load_interpreter(tmp_path, monkeypatch, '[1, 2]')
+    assert cache.key('print(1)', edited) != key
+    assert cache.lookup_or_run('print(1)', edited, lambda: [1, 2]) == ([1, 2], False)
+
+def test_corrupt_entry_is_dropped(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put('k', [1, 2])
+    assert cache.get('k') == (True, [1, 2])
+    with open(cache.path('k'), 'wb') as f:
+        f.write(b'not a pickle')
+    assert cache.get('k') == (False, None)
+    assert not os.path.exists(cache.path('k'))
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=3)
+    now = time.time()
+    for i, key in enumerate('abcd'):
+        cache.put(key, i)
+        os.utime(cache.path(key), (now - 100 + i, now - 100 + i))
+    # writes do not evict; the runner evicts once per run
+    assert len(os.listdir(tmp_path)) == 4
+    # reading 'a' makes it the most recently used
+    assert cache.get('a') == (True, 0)
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ['a.pickle', 'c.pickle', 'd.pickle']
+
+def test_exceeded_limits_are_not_cached(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    interpreter = load_interpreter(tmp_path, monkeypatch, '[]')
+    eval_Lif = load_assignment_module('a5', 'interpreter').eval_Lif
+    program = 'x = 0\nwhile x < 1:\n    x = x + 0\n'
+    runs = []
+
+    def run():
+        runs.append(1)
+        return eval_Lif(ast.parse(program), limits=ExecutionLimits(max_steps=100))
+
+    for _ in range(2):
+        with pytest.raises(ExecutionLimitExceeded):
+            cache.lookup_or_run(program, interpreter, run)
+    assert len(runs) == 2
+    assert not os.path.exists(cache.directory) or not os.listdir(cache.directory)
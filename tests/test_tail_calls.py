@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+from cs3020_support import x86
+from cs3020_support.tail_calls import expand_tail_jumps
+
+from helpers import load_assignment_module
+
+print_x86_defs = load_assignment_module('a7', 'print_x86defs').print_x86_defs
+
+rbp, rsp, rcx = x86.Reg('rbp'), x86.Reg('rsp'), x86.Reg('rcx')
+CONCLUSION = [x86.Addq(x86.Immediate(16), rsp), x86.Popq(rbp), x86.Retq()]
+
+def program_defs(blocks):
+    # print_x86_defs only reads defs, and the label and blocks of each
+    return SimpleNamespace(defs=[SimpleNamespace(label='count', blocks=blocks)])
+
+def count_blocks():
+    return {'countstart': [x86.Movq(x86.Immediate(1), x86.Reg('rdi')),
+                           x86.TailJmp(x86.FunRef('count'), 1)],
+            'countother': [x86.TailJmp(rcx, 1)]}
+
+def test_expanded_tail_jumps_print_as_indirect_jumps():
+    blocks = expand_tail_jumps(count_blocks(), CONCLUSION)
+    assert blocks['countstart'][-4:] == [x86.Leaq(x86.FunRef('count'), x86.Reg('rax')),
+                                         *CONCLUSION[:-1], x86.IndirectJmp(x86.Reg('rax'))]
+    assert blocks['countother'] == [x86.Movq(rcx, x86.Reg('rax')),
+                                    *CONCLUSION[:-1], x86.IndirectJmp(x86.Reg('rax'))]
+    text = print_x86_defs(program_defs(blocks))
+    assert 'tailjmp' not in text
+    assert text.count('jmp *%rax') == 2
+
+def test_unexpanded_tail_jump_is_not_printed():
+    with pytest.raises(Exception, match='TailJmp'):
+        print_x86_defs(program_defs(count_blocks()))
+    # except in the logs of the passes before prelude & conclusion
+    text = print_x86_defs(program_defs(count_blocks()), pseudo_instructions=True)
+    assert 'tailjmp *%rcx' in text